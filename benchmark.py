@@ -0,0 +1,254 @@
+"""Benchmark suite for physics in Spriteworld.
+
+This script times the simulation and rendering of the configs in
+`spriteworld_physics/configs/`, as well as the import of the simulation core,
+and prints a table of results.
+
+To run all benchmarks:
+```bash
+python benchmark.py
+```
+
+To run a subset of benchmarks, e.g. only the renderers at 256x256:
+```bash
+python benchmark.py --benchmarks=render --render_size=256
+```
+"""
+
+# pylint: disable=import-error
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import collections
+import importlib
+import subprocess
+import sys
+import timeit
+
+from absl import app
+from absl import flags
+import numpy as np
+
+FLAGS = flags.FLAGS
+flags.DEFINE_list('benchmarks', None,
+                  'Names of the benchmarks to run. Defaults to all.')
+flags.DEFINE_list('configs', [
+    'drift', 'springs', 'collisions', 'magnets', 'star_system',
+    'colliding_springs'
+], 'Names of the configs in spriteworld_physics/configs/ to benchmark.')
+flags.DEFINE_integer('render_size', 256,
+                     'Height and width of the rendered images.')
+flags.DEFINE_integer('anti_aliasing', 10,
+                     'Anti-aliasing factor of the reference PILRenderer.')
+flags.DEFINE_integer('num_steps', 100,
+                     'Number of environment steps per timing.')
+flags.DEFINE_list('import_modules', [
+    'spriteworld_physics.forces', 'spriteworld_physics.graph_generators',
+    'spriteworld_physics.simulation_plan',
+    'spriteworld_physics.physics_environment'
+], 'Modules whose import time is measured by the import benchmark.')
+flags.DEFINE_float('import_time_target_ms', 500.,
+                   'Target import time of each module of --import_modules. '
+                   'The import benchmark fails if a module exceeds it.')
+flags.DEFINE_integer('repeats', 3,
+                     'Number of timings per benchmark, of which the best is '
+                     'reported.')
+
+_BENCHMARKS = collections.OrderedDict()
+
+
+def _register(name):
+    """Decorator registering a benchmark function under name.
+
+    Benchmark functions return a list of (label, value, unit) rows.
+    """
+    def _decorator(fn):
+        _BENCHMARKS[name] = fn
+        return fn
+    return _decorator
+
+
+def _best_time(fn, number=1):
+    """Best time in seconds of one call to fn over FLAGS.repeats timings."""
+    return min(timeit.repeat(fn, number=number, repeat=FLAGS.repeats)) / number
+
+
+def _make_env(config_name, renderers=None):
+    from spriteworld_physics import physics_environment
+    config = importlib.import_module(
+        'spriteworld_physics.configs.' + config_name).get_config()
+    config['renderers'] = renderers or {}
+    return physics_environment.PhysicsEnvironment(**config)
+
+
+_IMPORT_SCRIPT = '''
+import time
+start = time.time()
+import {module}
+print(time.time() - start)
+'''
+
+
+@_register('import')
+def _benchmark_import():
+    """Import time of core modules, each in a fresh interpreter."""
+    rows = []
+    failures = []
+    for module in FLAGS.import_modules:
+        script = _IMPORT_SCRIPT.format(module=module)
+        seconds = []
+        for _ in range(FLAGS.repeats):
+            lines = subprocess.check_output(
+                [sys.executable, '-c', script]).decode().splitlines()
+            seconds.append(float(lines[-1]))
+        milliseconds = 1e3 * min(seconds)
+        rows.append(('import {}'.format(module), milliseconds, 'ms'))
+        if milliseconds > FLAGS.import_time_target_ms:
+            failures.append('{} takes {:.0f} ms to import, over the target of '
+                            '{:.0f} ms.'.format(module, milliseconds,
+                                                FLAGS.import_time_target_ms))
+    if failures:
+        raise RuntimeError('\n'.join(failures))
+    return rows
+
+
+@_register('physics')
+def _benchmark_physics():
+    """Simulation speed of each config, without rendering."""
+    rows = []
+    for config_name in FLAGS.configs:
+        env = _make_env(config_name)
+        env.reset()
+
+        def _run():
+            for _ in range(FLAGS.num_steps):
+                env.step()
+
+        seconds = _best_time(_run)
+        rows.append(('{} steps'.format(config_name),
+                     1e6 * seconds / FLAGS.num_steps, 'us/step'))
+    return rows
+
+
+def _make_pinned_env(num_pinned, num_moving, interleaved, pinned_speed=0.):
+    """Scene of pinned sprites, each moving sprite on a spring to one of them.
+
+    Pinned sprites have zero velocity and no incoming edges, so they are static
+    (see simulation_plan.EpisodePlan.static_mask) unless pinned_speed is
+    positive. Moving sprites are spread evenly among the pinned ones if
+    interleaved, and are the last sprites otherwise.
+    """
+    from spriteworld_physics import forces
+    from spriteworld_physics import graph_generators
+    from spriteworld_physics import physics_environment
+    from spriteworld_physics import sprite
+
+    num_sprites = num_pinned + num_moving
+    if interleaved:
+        moving = np.arange(num_moving) * (num_sprites // num_moving)
+    else:
+        moving = np.arange(num_pinned, num_sprites)
+    is_moving = np.zeros(num_sprites, dtype=bool)
+    is_moving[moving] = True
+    anchors = np.flatnonzero(~is_moving)[:num_moving]
+
+    def _init_sprites():
+        random_state = np.random.RandomState(0)
+        positions = random_state.uniform(0.1, 0.9, size=(num_sprites, 2))
+        velocities = np.where(
+            is_moving[:, np.newaxis],
+            random_state.uniform(-0.02, 0.02, size=(num_sprites, 2)),
+            pinned_speed)
+        return [sprite.Sprite(x=p[0], y=p[1], x_vel=v[0], y_vel=v[1])
+                for p, v in zip(positions, velocities)]
+
+    graph_generator = graph_generators.EdgeList(
+        forces.Spring(spring_constant=0.05, spring_equilibrium=0.1),
+        senders=anchors, receivers=moving)
+    return physics_environment.PhysicsEnvironment(
+        graph_generators=(graph_generator,), renderers={},
+        init_sprites=_init_sprites,
+        episode_length=FLAGS.num_steps * FLAGS.repeats + 1,
+        physics_steps_per_env_step=10)
+
+
+@_register('pinned')
+def _benchmark_pinned():
+    """Simulation speed of scenes of mostly pinned sprites.
+
+    Integration only updates the dynamic sprites, through a slice if they are
+    grouped and an index array if they are interleaved with the pinned ones.
+    The last scene has the same sprites, but no pinned sprite is static.
+    """
+    rows = []
+    scenes = [('interleaved', True, 0.), ('grouped', False, 0.),
+              ('interleaved, none static', True, 1e-9)]
+    for label, interleaved, pinned_speed in scenes:
+        env = _make_pinned_env(4000, 40, interleaved,
+                               pinned_speed=pinned_speed)
+        env.reset()
+        num_static = np.count_nonzero(env.episode_plan.static_mask)
+
+        def _run():
+            for _ in range(FLAGS.num_steps):
+                env.step()
+
+        seconds = _best_time(_run)
+        rows.append(('pinned {} ({} static of 4040)'.format(label, num_static),
+                     1e6 * seconds / FLAGS.num_steps, 'us/step'))
+    return rows
+
+
+@_register('render')
+def _benchmark_render():
+    """Speed and fidelity of renderers relative to PILRenderer."""
+    from spriteworld import renderers as spriteworld_renderers
+    from spriteworld_physics import renderers
+
+    image_size = (FLAGS.render_size, FLAGS.render_size)
+    color_to_rgb = spriteworld_renderers.color_maps.hsv_to_rgb
+    candidates = collections.OrderedDict([
+        ('PILRenderer(anti_aliasing={})'.format(FLAGS.anti_aliasing),
+         spriteworld_renderers.PILRenderer(
+             image_size=image_size, anti_aliasing=FLAGS.anti_aliasing,
+             color_to_rgb=color_to_rgb)),
+        ('SignedDistanceRenderer',
+         renderers.SignedDistanceRenderer(
+             image_size=image_size, color_to_rgb=color_to_rgb)),
+    ])
+    reference_name = next(iter(candidates))
+
+    rows = []
+    for config_name in FLAGS.configs:
+        env = _make_env(config_name)
+        env.reset()
+        env.step()
+        state = env.state()
+        reference = candidates[reference_name].render(**state).astype(int)
+        for name, renderer in candidates.items():
+            seconds = _best_time(lambda: renderer.render(**state), number=10)
+            label = '{} {}x{} {}'.format(config_name, FLAGS.render_size,
+                                         FLAGS.render_size, name)
+            rows.append((label, 1e3 * seconds, 'ms/frame'))
+            if name != reference_name:
+                error = np.mean(np.abs(
+                    renderer.render(**state).astype(int) - reference))
+                rows.append((label + ' error', error, 'mean |diff|/255'))
+    return rows
+
+
+def main(_):
+    names = FLAGS.benchmarks or list(_BENCHMARKS.keys())
+    for name in names:
+        if name not in _BENCHMARKS:
+            raise ValueError('Unknown benchmark {}. Available benchmarks are '
+                             '{}.'.format(name, list(_BENCHMARKS.keys())))
+        print('== {} =='.format(name))
+        for label, value, unit in _BENCHMARKS[name]():
+            print('{:<70} {:>12.3f} {}'.format(label, value, unit))
+
+
+if __name__ == '__main__':
+    app.run(main)
@@ -0,0 +1,63 @@
+"""Generate a large dataset of episodes from a physics in Spriteworld config.
+
+This script runs a resumable dataset_jobs.DatasetJob. Episodes are written in
+shards to an output directory, and if the script is interrupted, running it
+again with the same flags skips the shards that are already complete.
+
+To run this script on a config, run:
+```bash
+python generate_dataset.py --config=$path_to_task_config$ \
+    --output_dir=$path_to_output_dir$ --num_episodes=10000
+```
+
+If the config's colors are defined in RGB space instead of HSV space, add the
+flag `--hsv_colors=False`.
+"""
+
+# pylint: disable=import-error
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+from absl import app
+from absl import flags
+from absl import logging
+from spriteworld_physics import dataset_jobs
+
+FLAGS = flags.FLAGS
+flags.DEFINE_string('config', 'spriteworld_physics.configs.collisions',
+                    'Module name of task config to use.')
+flags.DEFINE_string('mode', 'train', 'Mode, "train" or "test"]')
+flags.DEFINE_boolean('hsv_colors', True,
+                     'Whether the config uses HSV as color factors.')
+flags.DEFINE_integer('render_size', 64,
+                     'Height and width of the output image.')
+flags.DEFINE_integer('anti_aliasing', 5, 'Renderer anti-aliasing factor.')
+flags.DEFINE_integer('num_episodes', 1000, 'Number of episodes to generate.')
+flags.DEFINE_integer('episodes_per_shard', 100, 'Number of episodes per shard.')
+flags.DEFINE_integer('seed', 0, 'Seed of the dataset.')
+flags.DEFINE_string('output_dir', None, 'Directory to write the dataset to.')
+flags.DEFINE_boolean('verify_checksum', False,
+                     'Whether to verify the checksums of existing shards.')
+flags.mark_flag_as_required('output_dir')
+
+
+def main(_):
+    job = dataset_jobs.DatasetJob(
+        output_dir=FLAGS.output_dir,
+        config=FLAGS.config,
+        num_episodes=FLAGS.num_episodes,
+        episodes_per_shard=FLAGS.episodes_per_shard,
+        seed=FLAGS.seed,
+        mode=FLAGS.mode,
+        render_size=FLAGS.render_size,
+        anti_aliasing=FLAGS.anti_aliasing,
+        hsv_colors=FLAGS.hsv_colors)
+    generated = job.run(verify_checksum=FLAGS.verify_checksum)
+    logging.info('Generated %d shards. Dataset complete in %s.',
+                 len(generated), FLAGS.output_dir)
+
+
+if __name__ == '__main__':
+    app.run(main)
@@ -0,0 +1,74 @@
+"""Sweep the number of physics steps per environment step of configs.
+
+This script runs accuracy_sweep.substep_curve() on configs and prints, for each
+number of physics steps per environment step, the time taken per episode and
+the errors with respect to reference episodes simulated with many more physics
+steps. It then prints the smallest number of physics steps meeting a
+tolerance, next to the number the config uses.
+
+To sweep all configs in spriteworld_physics/configs/, run:
+```bash
+python run_accuracy_sweep.py --metric=energy_error --tolerance=0.01
+```
+
+or add e.g. `--configs=spriteworld_physics.configs.springs` for a single
+config.
+"""
+
+# pylint: disable=import-error
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+from absl import app
+from absl import flags
+from spriteworld_physics import accuracy_sweep
+from spriteworld_physics import parameter_sweep
+
+FLAGS = flags.FLAGS
+flags.DEFINE_list('configs', None,
+                  'Module names of the configs. Defaults to all configs in '
+                  'spriteworld_physics/configs/.')
+flags.DEFINE_string('mode', 'train', 'Mode, "train" or "test"]')
+flags.DEFINE_list('substeps', ['1', '2', '5', '10', '20', '50'],
+                  'Numbers of physics steps per environment step.')
+flags.DEFINE_integer('reference_substeps', 500,
+                     'Number of physics steps per environment step of the '
+                     'reference episodes.')
+flags.DEFINE_integer('num_episodes', 4, 'Number of episodes per point.')
+flags.DEFINE_integer('seed', 0, 'Seed of the episodes.')
+flags.DEFINE_enum('metric', 'position_error', accuracy_sweep.ERROR_METRICS,
+                  'Error compared to the tolerance.')
+flags.DEFINE_float('tolerance', 0.01, 'Largest acceptable error.')
+
+
+def main(_):
+    configs = FLAGS.configs or accuracy_sweep.list_configs()
+    substeps = [int(n) for n in FLAGS.substeps]
+    header = ['substeps', 'ms/episode'] + list(accuracy_sweep.ERROR_METRICS)
+    for config in configs:
+        curve = accuracy_sweep.substep_curve(
+            config, substeps=substeps,
+            reference_substeps=FLAGS.reference_substeps,
+            num_episodes=FLAGS.num_episodes, seed=FLAGS.seed, mode=FLAGS.mode)
+        print(config)
+        print('\t'.join(header))
+        for point in curve:
+            row = [str(point.physics_steps_per_env_step),
+                   '{:.2f}'.format(1000. * point.seconds_per_episode)]
+            row += ['{:.3g}'.format(getattr(point, k))
+                    for k in accuracy_sweep.ERROR_METRICS]
+            print('\t'.join(row))
+
+        current = parameter_sweep.resolve_config(config, {}, mode=FLAGS.mode)
+        best = accuracy_sweep.min_substeps(curve, FLAGS.tolerance,
+                                           metric=FLAGS.metric)
+        print('Smallest substeps with {} <= {:g}: {} (config uses {})\n'.format(
+            FLAGS.metric, FLAGS.tolerance,
+            best if best is not None else 'none swept',
+            current.get('physics_steps_per_env_step', 1)))
+
+
+if __name__ == '__main__':
+    app.run(main)
@@ -13,6 +13,15 @@ flag `--hsv_colors=False`.
 If you would like to use a mode other than "train", add the flag
 `--mode=$mode$`.
 
+By default, the demo simulates in a background thread as fast as it can, while
+the figure shows the latest frame whenever it is ready to draw, dropping the
+frames it has no time for. Each frame is written into the figure canvas in
+place and blitted, overlaid with the live simulation and display frame rates.
+To benchmark this loop without a display, add the flags
+`--headless --num_frames=300`, which draw on an Agg canvas and print the frame
+rates. The flag `--blit=False` restores the simple viewer that redraws the
+figure every environment step.
+
 This file is modified from run_demo.py in the Spriteworld library, available
 from https://github.com/deepmind/spriteworld/.
 """
@@ -23,16 +32,19 @@ from __future__ import absolute_import
 from __future__ import division
 from __future__ import print_function
 
+import collections
+import importlib
+import threading
+import time
+
 from absl import app
 from absl import flags
-import importlib
+from absl import logging
+import matplotlib
+import numpy as np
 from spriteworld import renderers
 from spriteworld_physics import physics_environment
 
-import matplotlib
-matplotlib.use('TKAgg', force=True)
-import matplotlib.pylab as plt
-
 FLAGS = flags.FLAGS
 flags.DEFINE_string('config', 'spriteworld_physics.configs.springs',
                     'Module name of task config to use.')
@@ -42,7 +54,25 @@ flags.DEFINE_boolean('hsv_colors', True,
 flags.DEFINE_integer('render_size', 256,
                      'Height and width of the output image.')
 flags.DEFINE_integer('anti_aliasing', 10, 'Renderer anti-aliasing factor.')
-flags.DEFINE_float('pause_between_frames', 0.001, 'Pause between frames.')
+flags.DEFINE_float('pause_between_frames', 0.001,
+                   'Pause between frames, without blitting.')
+flags.DEFINE_boolean('blit', True,
+                     'Whether to update the image in place with blitting, '
+                     'simulating in a background thread.')
+flags.DEFINE_boolean('headless', False,
+                     'Whether to draw on an Agg canvas without a display, to '
+                     'benchmark the viewer. Implies --blit.')
+flags.DEFINE_integer('display_size', 512,
+                     'Height and width of the displayed image in pixels, with '
+                     'blitting.')
+flags.DEFINE_boolean('show_fps', True,
+                     'Whether to overlay simulation and display frame rates.')
+flags.DEFINE_integer('num_frames', None,
+                     'Number of frames to display before exiting. Defaults to '
+                     'unlimited, or 300 with --headless.')
+
+# Set in main(), once the backend is chosen from the flags.
+plt = None
 
 
 class DemoUI(object):
@@ -69,7 +99,176 @@ class DemoUI(object):
         plt.pause(FLAGS.pause_between_frames)
 
 
+class RateMeter(object):
+    """Number of events per second over a sliding window."""
+
+    def __init__(self, window=1.):
+        self._window = window
+        self._times = collections.deque()
+
+    def tick(self):
+        now = time.time()
+        self._times.append(now)
+        while now - self._times[0] > self._window:
+            self._times.popleft()
+
+    @property
+    def rate(self):
+        if len(self._times) < 2:
+            return 0.
+        return (len(self._times) - 1) / (self._times[-1] - self._times[0])
+
+
+class SimulationThread(threading.Thread):
+    """Steps the environment as fast as possible, keeping the latest frame."""
+
+    def __init__(self, env):
+        super(SimulationThread, self).__init__()
+        self.daemon = True
+        self._env = env
+        self._lock = threading.Lock()
+        self._frame = None
+        self._frame_index = -1
+        self._stopped = threading.Event()
+        self.meter = RateMeter()
+
+    def run(self):
+        timestep = self._env.reset()
+        while not self._stopped.is_set():
+            if timestep.observation is not None:
+                with self._lock:
+                    self._frame = timestep.observation['image']
+                    self._frame_index += 1
+                self.meter.tick()
+            timestep = self._env.step()
+
+    def latest_frame(self):
+        """Return the index and image of the latest frame, or (-1, None)."""
+        with self._lock:
+            return self._frame_index, self._frame
+
+    def stop(self):
+        self._stopped.set()
+
+
+class BlitDemoUI(object):
+    """Visualises frames by updating the canvas in place and blitting it.
+
+    Unlike DemoUI, which clears the axes and resamples a new image artist every
+    frame, this writes each frame, scaled up by nearest neighbors with indices
+    computed once per canvas size, directly into the pixel buffer of the Agg
+    canvas. It then draws only the frame rate overlay on top and blits the
+    canvas to the window. Pixels are copied as 32-bit RGBA words into
+    preallocated arrays.
+    """
+
+    def __init__(self, image_shape, display_size=512, show_fps=True):
+        dpi = 100.
+        self._fig = plt.figure(
+            figsize=(display_size / dpi, display_size / dpi), dpi=dpi,
+            num='Spriteworld', facecolor='black')
+        self._text = None
+        if show_fps:
+            self._text = self._fig.text(
+                0.02, 0.98, '', verticalalignment='top', family='monospace',
+                color='white', bbox=dict(facecolor='black', alpha=0.5),
+                animated=True)
+        self._image_shape = tuple(image_shape[:2])
+        self._rgba = np.full(self._image_shape + (4,), 255, dtype=np.uint8)
+        self._rows = None
+        self._columns = None
+        self._scaled_rows = None
+        plt.show(block=False)
+        self._fig.canvas.draw()
+
+    def _canvas_pixels(self):
+        """Canvas pixels as writable uint32 array, updating the indices."""
+        pixels = np.asarray(self._fig.canvas.buffer_rgba())
+        height, width = pixels.shape[:2]
+        if (self._rows is None or len(self._rows) != height or
+                len(self._columns) != width):
+            # The canvas changes size when the window is resized.
+            self._rows = np.arange(height) * self._image_shape[0] // height
+            self._columns = np.arange(width) * self._image_shape[1] // width
+            self._scaled_rows = np.empty((height, self._image_shape[1]),
+                                         dtype=np.uint32)
+        return pixels.view(np.uint32)[:, :, 0]
+
+    def update(self, image, text=''):
+        """Draw an image and overlay text."""
+        pixels = self._canvas_pixels()
+        self._rgba[:, :, :3] = image
+        np.take(self._rgba.view(np.uint32)[:, :, 0], self._rows, axis=0,
+                out=self._scaled_rows)
+        np.take(self._scaled_rows, self._columns, axis=1, out=pixels)
+        if self._text is not None:
+            self._text.set_text(text)
+            self._fig.draw_artist(self._text)
+        canvas = self._fig.canvas
+        canvas.blit(self._fig.bbox)
+        canvas.flush_events()
+
+    @property
+    def is_open(self):
+        return plt.fignum_exists(self._fig.number)
+
+
+def run_blit_demo(env, num_frames=None, display_size=512, show_fps=True):
+    """Play env with BlitDemoUI, simulating in a background thread.
+
+    Args:
+        env: Environment with an 'image' renderer.
+        num_frames: Optional int. Number of frames to display before returning.
+            Unlimited if None.
+        display_size: Int. Height and width of the displayed image in pixels.
+        show_fps: Bool. Whether to overlay the frame rates.
+
+    Returns:
+        Dictionary with the mean simulation and display frame rates and the
+            number of simulated frames that were not displayed.
+    """
+    simulation = SimulationThread(env)
+    simulation.start()
+    frame = simulation.latest_frame()
+    while frame[1] is None:
+        time.sleep(0.001)
+        frame = simulation.latest_frame()
+
+    demo = BlitDemoUI(frame[1].shape, display_size=display_size,
+                      show_fps=show_fps)
+    display_meter = RateMeter()
+    start_time = time.time()
+    first_index = last_index = frame[0]
+    num_displayed = 0
+    while demo.is_open and (num_frames is None or num_displayed < num_frames):
+        index, image = simulation.latest_frame()
+        if index == last_index and num_displayed:
+            # Wait for the simulation to produce a new frame.
+            time.sleep(0.0005)
+            continue
+        last_index = index
+        display_meter.tick()
+        demo.update(image, 'sim {:6.1f} fps\ndraw {:5.1f} fps'.format(
+            simulation.meter.rate, display_meter.rate))
+        num_displayed += 1
+    simulation.stop()
+
+    elapsed = time.time() - start_time
+    num_simulated = last_index - first_index + 1
+    return {
+        'simulation_fps': num_simulated / elapsed,
+        'display_fps': num_displayed / elapsed,
+        'dropped_frames': num_simulated - num_displayed,
+    }
+
+
 def main(_):
+    global plt
+    headless = FLAGS.headless
+    matplotlib.use('Agg' if headless else 'TKAgg', force=True)
+    from matplotlib import pylab  # pylint: disable=g-import-not-at-top
+    plt = pylab
+
     # Load and adjust environment config
     config = importlib.import_module(FLAGS.config)
     config = config.get_config(FLAGS.mode)
@@ -82,6 +281,19 @@ def main(_):
                 anti_aliasing=FLAGS.anti_aliasing),
     }
     env = physics_environment.PhysicsEnvironment(**config)
+
+    if FLAGS.blit or headless:
+        num_frames = FLAGS.num_frames
+        if num_frames is None and headless:
+            num_frames = 300
+        stats = run_blit_demo(env, num_frames=num_frames,
+                              display_size=FLAGS.display_size,
+                              show_fps=FLAGS.show_fps)
+        logging.info('Simulated %.1f fps, displayed %.1f fps, dropped %d '
+                     'frames.', stats['simulation_fps'], stats['display_fps'],
+                     stats['dropped_frames'])
+        return
+
     demo = DemoUI()
 
     # Run the environment in a loop
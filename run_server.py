@@ -0,0 +1,67 @@
+"""Run a local simulation server for physics in Spriteworld configs.
+
+This script runs a simulation_server.SimulationServer until interrupted.
+Clients connect with simulation_server.SimulationClient to request rollouts of
+any config, which the server simulates once per config environment and streams
+back as arrays.
+
+To serve on a Unix socket, run:
+```bash
+python run_server.py --address=/tmp/spriteworld.sock
+```
+
+or on a localhost TCP port with `--address=localhost:6000`. Add
+`--cache_dir=$path_to_cache_dir$` to keep the simulated episodes on disk, to
+serve repeated requests without simulating them again.
+"""
+
+# pylint: disable=import-error
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+from absl import app
+from absl import flags
+from spriteworld_physics import simulation_server
+
+FLAGS = flags.FLAGS
+flags.DEFINE_string('address', '/tmp/spriteworld_physics.sock',
+                    'Unix socket path, or host:port of a TCP socket.')
+flags.DEFINE_string('authkey', None,
+                    'Optional key clients must authenticate with.')
+flags.DEFINE_boolean('hsv_colors', True,
+                     'Whether the configs use HSV as color factors.')
+flags.DEFINE_integer('render_size', 64,
+                     'Height and width of the output image.')
+flags.DEFINE_integer('anti_aliasing', 5, 'Renderer anti-aliasing factor.')
+flags.DEFINE_integer('max_run_episodes', 64,
+                     'Largest number of episodes of one config simulated '
+                     'sequentially before the scheduler looks at the queue '
+                     'again.')
+flags.DEFINE_string('cache_dir', None,
+                    'Optional directory of a cache of the simulated episodes.')
+flags.DEFINE_float('cache_max_gb', None,
+                   'Size limit of the cache in gigabytes, above which the '
+                   'least recently used episodes are deleted.')
+
+
+def main(_):
+    server = simulation_server.SimulationServer(
+        address=FLAGS.address,
+        authkey=FLAGS.authkey.encode() if FLAGS.authkey else None,
+        render_size=FLAGS.render_size,
+        anti_aliasing=FLAGS.anti_aliasing,
+        hsv_colors=FLAGS.hsv_colors,
+        max_run_episodes=FLAGS.max_run_episodes,
+        cache_dir=FLAGS.cache_dir,
+        cache_max_bytes=(int(FLAGS.cache_max_gb * 2**30)
+                         if FLAGS.cache_max_gb is not None else None))
+    try:
+        server.serve_forever()
+    finally:
+        server.close()
+
+
+if __name__ == '__main__':
+    app.run(main)
@@ -0,0 +1,69 @@
+"""Run a cached parameter sweep over a physics in Spriteworld config.
+
+This script runs a parameter_sweep.ParameterSweep and prints summaries of the
+trajectories at each grid point. Grid points are cached in a directory, so
+running the script again after changing the grid only simulates the new
+points.
+
+To sweep a config over a grid of parameter values, run:
+```bash
+python run_sweep.py --config=spriteworld_physics.configs.colliding_springs \
+    --grid='{"spring_constant": [0.01, 0.02], "shell_radius": [0.05, 0.08]}' \
+    --cache_dir=$path_to_cache_dir$
+```
+
+Parameter names are keys of the config (e.g. physics_steps_per_env_step) or
+force parameters (e.g. spring_constant, spring_equilibrium, gravity_constant,
+shell_radius).
+"""
+
+# pylint: disable=import-error
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import json
+
+from absl import app
+from absl import flags
+import numpy as np
+from spriteworld_physics import parameter_sweep
+
+FLAGS = flags.FLAGS
+flags.DEFINE_string('config', 'spriteworld_physics.configs.colliding_springs',
+                    'Module name of task config to use.')
+flags.DEFINE_string('mode', 'train', 'Mode, "train" or "test"]')
+flags.DEFINE_string('grid', None,
+                    'JSON dictionary mapping parameter names to lists of '
+                    'values.')
+flags.DEFINE_string('cache_dir', None, 'Directory of cached grid points.')
+flags.DEFINE_integer('num_episodes', 10, 'Number of episodes per grid point.')
+flags.DEFINE_integer('seed', 0, 'Seed of the episodes.')
+flags.DEFINE_integer('num_workers', None,
+                     'Number of worker processes. Defaults to the number of '
+                     'CPUs.')
+flags.mark_flag_as_required('grid')
+flags.mark_flag_as_required('cache_dir')
+
+
+def main(_):
+    sweep = parameter_sweep.ParameterSweep(
+        config=FLAGS.config,
+        param_grid=json.loads(FLAGS.grid),
+        cache_dir=FLAGS.cache_dir,
+        num_episodes=FLAGS.num_episodes,
+        seed=FLAGS.seed,
+        mode=FLAGS.mode,
+        num_workers=FLAGS.num_workers)
+    header = ['overrides'] + list(parameter_sweep.SUMMARY_KEYS)
+    print('\t'.join(header))
+    for overrides, summaries in sweep.run():
+        row = [json.dumps(overrides, sort_keys=True)]
+        row += ['{:.4g}'.format(np.mean(summaries[k]))
+                for k in parameter_sweep.SUMMARY_KEYS]
+        print('\t'.join(row))
+
+
+if __name__ == '__main__':
+    app.run(main)
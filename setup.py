@@ -29,11 +29,14 @@ setup(
     install_requires=[
         'absl-py',
         'dm_env',
-        'matplotlib',
         'numpy',
         'six',
         'spriteworld',
     ],
+    extras_require={
+        # Only needed by the demo UI and gif generator scripts.
+        'demo': ['imageio', 'matplotlib'],
+    },
     classifiers=[
         'Development Status :: 5 - Production/Stable',
         'Environment :: Console',
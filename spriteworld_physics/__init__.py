@@ -0,0 +1,2 @@
+# Keep in sync with setup.py.
+__version__ = '1.0.1'
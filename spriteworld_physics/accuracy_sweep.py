@@ -0,0 +1,225 @@
+"""Accuracy versus cost of the number of physics steps per environment step.
+
+Each environment step of a config is integrated in physics_steps_per_env_step
+physics steps. More steps are more accurate and proportionally slower.
+substep_curve() runs the episodes of a config at several numbers of physics
+steps, and compares them to the same episodes run with many more physics steps
+as a reference:
+'''
+curve = accuracy_sweep.substep_curve(
+    'spriteworld_physics.configs.springs', substeps=(1, 2, 5, 10, 20))
+for point in curve:
+    print(point.physics_steps_per_env_step, point.seconds_per_episode,
+          point.position_error)
+print(accuracy_sweep.min_substeps(curve, tolerance=0.01))
+'''
+
+The errors of each point (see AccuracyPoint) are the distance of the sprite
+positions to the reference, and the drift of the energy and momenta computed
+by diagnostics.conserved_quantities(), both from their initial values and from
+the reference. They are averaged over episodes. Episode e is seeded with
+dataset_jobs.episode_seed(seed, e), so all points simulate the same initial
+scenes.
+
+Collisions make trajectories chaotic, so in configs with collisions the
+position error of long episodes is large at any number of physics steps, and
+energy errors are the more useful criterion.
+"""
+
+# pylint: disable=import-error
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import collections
+import pkgutil
+import time
+
+import numpy as np
+from spriteworld_physics import dataset_jobs
+from spriteworld_physics import diagnostics
+from spriteworld_physics import parameter_sweep
+from spriteworld_physics import physics_environment
+
+AccuracyPoint = collections.namedtuple('AccuracyPoint', [
+    'physics_steps_per_env_step',
+    'seconds_per_episode',
+    # Largest root mean square distance of the sprites to their reference
+    # positions over an episode, in frame units.
+    'position_error',
+    # Largest deviation of the energy from its initial value.
+    'energy_drift',
+    # Largest deviation of the energy from the reference energy.
+    'energy_error',
+    # Largest deviation of the linear momentum from the reference momentum.
+    'momentum_error',
+    # Largest deviation of the angular momentum from the reference momentum.
+    'angular_momentum_error',
+])
+
+# Fields of AccuracyPoint that min_substeps() may compare to a tolerance.
+# Energy and momentum errors are relative to the largest total kinetic plus
+# absolute potential energy, total absolute momentum and total absolute angular
+# momentum of the reference episode respectively.
+ERROR_METRICS = AccuracyPoint._fields[2:]
+
+_CONFIGS_PACKAGE = 'spriteworld_physics.configs'
+
+
+def list_configs():
+    """Module names of the configs in configs/."""
+    package = __import__(_CONFIGS_PACKAGE, fromlist=['__path__'])
+    return sorted(_CONFIGS_PACKAGE + '.' + name
+                  for _, name, is_package in pkgutil.iter_modules(
+                      package.__path__) if not is_package)
+
+
+def run_episodes(config, physics_steps_per_env_step, num_episodes=4, seed=0,
+                 mode='train'):
+    """Simulate episodes of a config without rendering.
+
+    Args:
+        config: String. Module name of the config.
+        physics_steps_per_env_step: Int. Number of physics steps per
+            environment step, replacing the value of the config.
+        num_episodes: Int. Number of episodes.
+        seed: Int. Seed from which episode seeds are derived.
+        mode: String. Mode fed to the config's get_config().
+
+    Returns:
+        episodes: List of dictionaries, one per episode, holding the
+            'positions', 'velocities' and 'masses' of the episode and its
+            diagnostics.conserved_quantities().
+        seconds_per_episode: Float. Mean time taken to simulate an episode,
+            excluding the diagnostics.
+    """
+    env_config = parameter_sweep.resolve_config(config, {}, mode=mode)
+    env_config['physics_steps_per_env_step'] = physics_steps_per_env_step
+    env = physics_environment.PhysicsEnvironment(**env_config)
+
+    episodes = []
+    seconds = 0.
+    for episode in range(num_episodes):
+        np.random.seed(dataset_jobs.episode_seed(seed, episode))
+        start = time.time()
+        arrays = env.rollout_episode(observation_keys=())
+        seconds += time.time() - start
+        masses = np.array(env.sprite_state.masses, dtype=float)
+        result = diagnostics.conserved_quantities(
+            arrays['positions'], arrays['velocities'], masses,
+            env.episode_plan)
+        result.update(positions=arrays['positions'],
+                      velocities=arrays['velocities'], masses=masses)
+        episodes.append(result)
+    return episodes, seconds / max(num_episodes, 1)
+
+
+def _largest_deviation(values, reference, scale=1.):
+    """Largest Euclidean norm of values[t] - reference[t], divided by scale."""
+    deviation = (values - reference).reshape(len(values), -1)
+    largest = np.sqrt(np.max(np.sum(deviation ** 2, axis=1)))
+    # Quantities that are zero throughout the reference have no scale.
+    return float(largest / scale) if scale > 0 else float(largest)
+
+
+def compare_episode(episode, reference):
+    """Errors of an episode from run_episodes() with respect to a reference.
+
+    Returns:
+        Dictionary mapping each of ERROR_METRICS to a float.
+    """
+    positions = episode['positions']
+    reference_positions = reference['positions']
+    position_error = np.sqrt(np.max(np.mean(
+        np.sum((positions - reference_positions) ** 2, axis=-1), axis=-1)))
+
+    masses = reference['masses']
+    speeds = np.sqrt(np.sum(reference['velocities'] ** 2, axis=-1))
+    arms = reference_positions - 0.5
+    moments = np.abs(arms[..., 0] * reference['velocities'][..., 1] -
+                     arms[..., 1] * reference['velocities'][..., 0])
+    energy_scale = np.max(reference['kinetic_energy'] +
+                          np.abs(reference['potential_energy']))
+    momentum_scale = np.max(np.dot(speeds, masses))
+    angular_momentum_scale = np.max(np.dot(moments, masses))
+
+    energy = episode['energy']
+    return {
+        'position_error': float(position_error),
+        'energy_drift': _largest_deviation(
+            energy, np.full_like(energy, energy[0]), energy_scale),
+        'energy_error': _largest_deviation(
+            energy, reference['energy'], energy_scale),
+        'momentum_error': _largest_deviation(
+            episode['linear_momentum'], reference['linear_momentum'],
+            momentum_scale),
+        'angular_momentum_error': _largest_deviation(
+            episode['angular_momentum'], reference['angular_momentum'],
+            angular_momentum_scale),
+    }
+
+
+def substep_curve(config, substeps=(1, 2, 5, 10, 20, 50),
+                  reference_substeps=500, num_episodes=4, seed=0,
+                  mode='train'):
+    """Cost and errors of a config at several numbers of physics steps.
+
+    Args:
+        config: String. Module name of the config.
+        substeps: Iterable of ints. Numbers of physics steps per environment
+            step to evaluate.
+        reference_substeps: Int. Number of physics steps per environment step
+            of the reference episodes.
+        num_episodes: Int. Number of episodes per number of physics steps.
+        seed: Int. Seed from which episode seeds are derived.
+        mode: String. Mode fed to the config's get_config().
+
+    Returns:
+        List of AccuracyPoint, sorted by physics_steps_per_env_step.
+    """
+    reference, _ = run_episodes(config, reference_substeps,
+                                num_episodes=num_episodes, seed=seed, mode=mode)
+    curve = []
+    for num_substeps in sorted(set(substeps)):
+        episodes, seconds = run_episodes(
+            config, num_substeps, num_episodes=num_episodes, seed=seed,
+            mode=mode)
+        errors = [compare_episode(e, r) for e, r in zip(episodes, reference)]
+        curve.append(AccuracyPoint(
+            physics_steps_per_env_step=num_substeps,
+            seconds_per_episode=seconds,
+            **{k: float(np.mean([e[k] for e in errors]))
+               for k in ERROR_METRICS}))
+    return curve
+
+
+def min_substeps(curve, tolerance, metric='position_error'):
+    """Smallest number of physics steps meeting a tolerance.
+
+    Errors need not decrease monotonically with the number of physics steps,
+    e.g. when collisions are detected at different steps, so the returned
+    number is the smallest of the curve from which all larger numbers of the
+    curve also meet the tolerance.
+
+    Args:
+        curve: List of AccuracyPoint, as returned by substep_curve().
+        tolerance: Float. Largest acceptable error.
+        metric: String. One of ERROR_METRICS.
+
+    Returns:
+        Int, or None if the largest number of physics steps of the curve does
+            not meet the tolerance.
+
+    Raises:
+        ValueError: If metric is not one of ERROR_METRICS.
+    """
+    if metric not in ERROR_METRICS:
+        raise ValueError('Unknown metric {}, expected one of {}.'.format(
+            metric, ERROR_METRICS))
+    best = None
+    for point in sorted(curve, key=lambda p: -p.physics_steps_per_env_step):
+        if getattr(point, metric) > tolerance:
+            break
+        best = point.physics_steps_per_env_step
+    return best
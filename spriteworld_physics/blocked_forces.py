@@ -0,0 +1,159 @@
+"""Blocked, multi-threaded application of forces between all pairs of sprites.
+
+For a graph generator that applies one force between all ordered pairs of
+distinct sprites (e.g. graph_generators.FullyConnected), the edge lists used by
+simulation_plan.EpisodePlan have num_sprites * (num_sprites - 1) entries, which
+for scenes of tens of thousands of sprites do not fit in memory, let alone in
+cache. An AllPairsGroup instead tiles the receiver x sender pair space into
+blocks of block_shape pairs and applies the force block by block, with scratch
+arrays of one block per thread, so no num_sprites x num_sprites array is ever
+allocated.
+
+Receivers are split into blocks of rows, each of which is a task on a thread
+pool: NumPy releases the GIL in array operations, so large scenes use all cores.
+A task sums the accelerations of its receivers over the sender blocks in a
+fixed order, and writes them to its own rows of a shared array, so the result
+does not depend on the number of threads or on task scheduling.
+
+The force class must implement forces.AbstractForce.pair_accelerations(). The
+result matches apply_force_to_edges() on the corresponding edges up to floating
+point rounding, since accelerations are summed in a different order.
+"""
+
+# pylint: disable=import-error
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import threading
+
+import numpy as np
+
+
+class _BlockWorkspace(object):
+    """Scratch arrays for one block of pairs, owned by one thread."""
+
+    def __init__(self, block_shape):
+        self.diff = np.empty((2,) + block_shape)
+        self.dist = np.empty(block_shape)
+        self.magnitude = np.empty(block_shape)
+        self.row_sum = np.empty(block_shape[0])
+        self.acceleration = np.empty((2, block_shape[0]))
+
+
+class AllPairsGroup(object):
+    """One force applied between all ordered pairs of distinct sprites."""
+
+    def __init__(self, force_class, parameters, num_sprites,
+                 block_shape=(128, 256)):
+        """Construct group.
+
+        Args:
+            force_class: Subclass of forces.AbstractForce with blockwise True.
+            parameters: Dictionary mapping parameter names to floats.
+            num_sprites: Int. Number of sprites.
+            block_shape: Pair of ints. Number of receivers and senders per
+                block.
+        """
+        if not force_class.blockwise:
+            raise ValueError('{} does not support blockwise application.'.format(
+                force_class.__name__))
+        self.force_class = force_class
+        self.parameters = parameters
+        self._num_sprites = num_sprites
+        self._block_shape = tuple(block_shape)
+        self._receiver_starts = list(range(0, num_sprites, block_shape[0]))
+        self._sender_starts = list(range(0, num_sprites, block_shape[1]))
+        self._delta_velocity = np.empty((2, num_sprites))
+        self._local = threading.local()
+
+    def _workspace(self):
+        workspace = getattr(self._local, 'workspace', None)
+        if workspace is None:
+            workspace = _BlockWorkspace(self._block_shape)
+            self._local.workspace = workspace
+        return workspace
+
+    def _apply_receiver_block(self, args):
+        """Sum the accelerations of a block of receivers over all senders."""
+        receiver_start, coordinates, masses, force_multiplier = args
+        workspace = self._workspace()
+        receiver_stop = min(receiver_start + self._block_shape[0],
+                            self._num_sprites)
+        num_receivers = receiver_stop - receiver_start
+        receivers = slice(receiver_start, receiver_stop)
+        receiver_coordinates = coordinates[:, receivers, np.newaxis]
+        receiver_masses = masses[receivers, np.newaxis]
+        acceleration = workspace.acceleration[:, :num_receivers]
+        acceleration.fill(0.)
+        row_sum = workspace.row_sum[:num_receivers]
+
+        for sender_start in self._sender_starts:
+            sender_stop = min(sender_start + self._block_shape[1],
+                              self._num_sprites)
+            num_senders = sender_stop - sender_start
+            senders = slice(sender_start, sender_stop)
+            diff = workspace.diff[:, :num_receivers, :num_senders]
+            dist = workspace.dist[:num_receivers, :num_senders]
+            magnitude = workspace.magnitude[:num_receivers, :num_senders]
+
+            np.subtract(receiver_coordinates, coordinates[:, np.newaxis, senders],
+                        out=diff)
+            np.multiply(diff[0], diff[0], out=dist)
+            np.multiply(diff[1], diff[1], out=magnitude)
+            np.add(dist, magnitude, out=dist)
+            np.sqrt(dist, out=dist)
+
+            # A sprite does not act on itself. Its distance to itself is set to
+            # 1 so that the direction is 0 rather than NaN, and its magnitude
+            # is set to 0.
+            self_start = max(receiver_start, sender_start)
+            self_stop = min(receiver_stop, sender_stop)
+            self_pairs = np.arange(self_start, self_stop)
+            dist[self_pairs - receiver_start, self_pairs - sender_start] = 1.
+
+            self.force_class.pair_accelerations(
+                dist, masses[senders], receiver_masses, self.parameters,
+                force_multiplier, out=magnitude)
+            magnitude[self_pairs - receiver_start,
+                      self_pairs - sender_start] = 0.
+            np.divide(magnitude, dist, out=magnitude)
+            for coordinate in (0, 1):
+                np.multiply(diff[coordinate], magnitude, out=diff[coordinate])
+                np.add.reduce(diff[coordinate], axis=1, out=row_sum)
+                np.add(acceleration[coordinate], row_sum,
+                       out=acceleration[coordinate])
+
+        self._delta_velocity[:, receivers] = acceleration
+
+    def apply(self, positions, velocities, masses, force_multiplier=1.,
+              pool=None):
+        """Apply the force between all pairs of sprites.
+
+        Args:
+            positions: Float array [num_sprites, 2].
+            velocities: Float array [num_sprites, 2]. Updated in place.
+            masses: Float array [num_sprites].
+            force_multiplier: Coefficient to multiply to the force.
+            pool: Optional multiprocessing.pool.ThreadPool to apply receiver
+                blocks concurrently.
+        """
+        coordinates = np.ascontiguousarray(positions.T)
+        masses = np.ascontiguousarray(masses)
+        tasks = [(start, coordinates, masses, force_multiplier)
+                 for start in self._receiver_starts]
+        if pool is None or len(tasks) == 1:
+            for task in tasks:
+                self._apply_receiver_block(task)
+        else:
+            pool.map(self._apply_receiver_block, tasks)
+        np.add(velocities, self._delta_velocity.T, out=velocities)
+
+    @property
+    def block_shape(self):
+        return self._block_shape
+
+    @property
+    def num_blocks(self):
+        return len(self._receiver_starts) * len(self._sender_starts)
@@ -0,0 +1,138 @@
+"""Stable hashing of resolved environment configs.
+
+Configs returned by the get_config() functions in configs/ hold live objects:
+forces, graph generators, factor distributions, renderers and the closures
+returned by generate_sprites.generate_sprites(). describe() turns such a
+config into a canonical JSON-serializable structure by recursing into object
+attributes, dictionaries, sequences, numpy arrays and function closures, and
+config_hash() digests it. Two configs built by the same code with the same
+constants therefore hash equally across processes and runs, and changing any
+constant, e.g. a spring constant or the range of a factor distribution,
+changes the hash. This is used to key on-disk caches of simulation results.
+
+Objects with a hash_parameters() method, such as the renderers of
+renderers.py, are described by the parameters it returns instead of their
+attributes. Their other attributes are caches and buffers filled as they are
+used, so the hash of a config does not change once an environment built from
+it has run. Objects without attributes (e.g. C extension types) are described
+by their type only, so their internal state does not contribute to the hash.
+"""
+
+# pylint: disable=import-error
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import hashlib
+import json
+import types
+
+import numpy as np
+import six
+
+
+def _qualified_name(obj):
+    module = getattr(obj, '__module__', None) or ''
+    name = getattr(obj, '__qualname__', None) or getattr(obj, '__name__', '')
+    return '{}.{}'.format(module, name)
+
+
+def _digest(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+def _sort_key(description):
+    return json.dumps(description, sort_keys=True)
+
+
+def _describe_code(code, memo):
+    return {
+        '__code__': _digest(code.co_code),
+        'consts': [_describe(c, memo) for c in code.co_consts],
+        'names': list(code.co_names),
+    }
+
+
+def _describe_function(fn, memo):
+    closure = fn.__closure__ or ()
+    return {
+        '__function__': _qualified_name(fn),
+        'code': _describe_code(fn.__code__, memo),
+        'defaults': _describe(fn.__defaults__, memo),
+        'closure': [_describe(cell.cell_contents, memo) for cell in closure],
+    }
+
+
+def _describe(obj, memo):
+    """Recursive implementation of describe(), with cycle detection."""
+    if obj is None or isinstance(obj, (bool, float) + six.string_types):
+        return obj
+    if isinstance(obj, six.integer_types):
+        return int(obj)
+    if isinstance(obj, np.generic):
+        return obj.item()
+    if isinstance(obj, np.ndarray):
+        return {'__ndarray__': [obj.dtype.str, list(obj.shape),
+                                _digest(np.ascontiguousarray(obj).tobytes())]}
+    if isinstance(obj, type):
+        return {'__class__': _qualified_name(obj)}
+    if isinstance(obj, types.CodeType):
+        return _describe_code(obj, memo)
+    if isinstance(obj, types.ModuleType):
+        return {'__module__': obj.__name__}
+
+    if id(obj) in memo:
+        return {'__cycle__': _qualified_name(type(obj))}
+    memo.add(id(obj))
+    try:
+        if isinstance(obj, (list, tuple)):
+            return [_describe(x, memo) for x in obj]
+        if isinstance(obj, (set, frozenset)):
+            return sorted((_describe(x, memo) for x in obj), key=_sort_key)
+        if isinstance(obj, dict):
+            items = [[_describe(k, memo), _describe(v, memo)]
+                     for k, v in six.iteritems(obj)]
+            return {'__dict__': sorted(items, key=_sort_key)}
+        if isinstance(obj, types.FunctionType):
+            return _describe_function(obj, memo)
+        if isinstance(obj, types.MethodType):
+            return {'__method__': _describe(obj.__func__, memo),
+                    'self': _describe(obj.__self__, memo)}
+        hash_parameters = getattr(obj, 'hash_parameters', None)
+        if callable(hash_parameters):
+            return {'__object__': _qualified_name(type(obj)),
+                    'parameters': _describe(hash_parameters(), memo)}
+        if hasattr(obj, '__dict__'):
+            return {'__object__': _qualified_name(type(obj)),
+                    'state': _describe(vars(obj), memo)}
+        return {'__object__': _qualified_name(type(obj))}
+    finally:
+        memo.discard(id(obj))
+
+
+def describe(obj):
+    """Canonical JSON-serializable description of a config or config value.
+
+    Args:
+        obj: Any object, typically a config dictionary.
+
+    Returns:
+        Structure of dicts, lists, strings, numbers and None.
+    """
+    return _describe(obj, set())
+
+
+def config_hash(config, **extra):
+    """Hex digest identifying a resolved config.
+
+    Args:
+        config: Config dictionary, as returned by get_config() functions.
+        **extra: Additional JSON-serializable values to include in the hash,
+            e.g. a seed or a number of episodes.
+
+    Returns:
+        String. SHA-256 hex digest of describe(config) and extra.
+    """
+    description = {'config': describe(config), 'extra': describe(extra)}
+    return _digest(_sort_key(description).encode('utf-8'))
@@ -0,0 +1,55 @@
+"""Tests for config_hashing."""
+
+# pylint: disable=import-error
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+from absl.testing import absltest
+from spriteworld.renderers import color_maps
+from spriteworld_physics import config_hashing
+from spriteworld_physics import dataset_jobs
+from spriteworld_physics import physics_environment
+from spriteworld_physics import renderers
+
+_SPRINGS = 'spriteworld_physics.configs.springs'
+
+
+def _make_config(image_size=(8, 8)):
+    """Springs config with renderers that cache state as they render."""
+    config = dataset_jobs.make_config(_SPRINGS, render_size=16)
+    hsv_to_rgb = color_maps.hsv_to_rgb
+    config['renderers'].update(
+        factors_array=renderers.SpriteFactorArray(),
+        signed_distance=renderers.SignedDistanceRenderer(
+            image_size, color_to_rgb=hsv_to_rgb),
+        static_layer=renderers.StaticLayerPILRenderer(
+            image_size, color_to_rgb=hsv_to_rgb))
+    config['renderers'].update(renderers.MultiResolutionPILRenderer(
+        [image_size, (16, 16)], color_to_rgb=hsv_to_rgb).renderers('multi'))
+    return config
+
+
+class ConfigHashTest(absltest.TestCase):
+
+    def testHashDoesNotChangeWhenRendering(self):
+        config = _make_config()
+        digest = config_hashing.config_hash(config)
+        env = physics_environment.PhysicsEnvironment(**config)
+        env.reset()
+        env.step()
+        self.assertEqual(digest, config_hashing.config_hash(config))
+
+    def testHashIsReproducible(self):
+        self.assertEqual(config_hashing.config_hash(_make_config()),
+                         config_hashing.config_hash(_make_config()))
+
+    def testHashDependsOnRendererParameters(self):
+        self.assertNotEqual(
+            config_hashing.config_hash(_make_config()),
+            config_hashing.config_hash(_make_config(image_size=(4, 4))))
+
+
+if __name__ == '__main__':
+    absltest.main()
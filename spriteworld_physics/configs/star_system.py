@@ -21,11 +21,11 @@ from __future__ import print_function
 import numpy as np
 import os
 from spriteworld import factor_distributions as distribs
-from spriteworld import renderers as spriteworld_renderers
 from spriteworld import sprite_generators
 from spriteworld_physics import forces
 from spriteworld_physics import generate_sprites
 from spriteworld_physics import graph_generators
+from spriteworld_physics import renderers as physics_renderers
 
 
 def get_config(mode=None):
@@ -86,9 +86,11 @@ def get_config(mode=None):
     graph_generator = graph_generators.AdjacencyMatrix(
         adjacency_matrix=adjacency_matrix, symmetric=False)
 
+    # The center circle never moves, so it is drawn once per episode into a
+    # cached background layer.
     renderers = {
         'image':
-            spriteworld_renderers.PILRenderer(
+            physics_renderers.StaticLayerPILRenderer(
                 image_size=(64, 64), anti_aliasing=5)
     }
 
@@ -0,0 +1,329 @@
+"""Resumable generation of large datasets of episodes.
+
+A DatasetJob generates a fixed number of episodes from a config and writes them
+to an output directory in shards of consecutive episodes. The directory holds:
+    job.json: The job specification. A job can only be resumed with the same
+        specification.
+    shard-XXXXX.npz: Episode data of each shard, see _generate_shard().
+    shard-XXXXX.json: Manifest of each shard, holding its episode range, size
+        and checksum. It is written only after the shard data is complete, so
+        a shard is done if and only if its manifest matches its data.
+    progress.json: Summary of the completed episode ranges.
+
+Shards are written to a temporary file and atomically moved into place, so a
+job that is killed at any point can be restarted with run(), which skips
+completed shards and regenerates missing or partially written ones. Each
+episode is sampled with its own seed derived from the job seed and episode
+index, so a resumed job produces exactly the same data as an uninterrupted one.
+"""
+
+# pylint: disable=import-error
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import glob
+import hashlib
+import importlib
+import json
+import os
+
+from absl import logging
+import numpy as np
+import six
+from spriteworld_physics import physics_environment
+
+_JOB_FILE = 'job.json'
+_PROGRESS_FILE = 'progress.json'
+_SHARD_PATTERN = 'shard-{:05d}'
+_TMP_SUFFIX = '.tmp'
+
+
+def episode_seed(seed, episode):
+    """Seed of the global numpy random state for an episode of a job."""
+    return int(np.random.SeedSequence([seed, episode]).generate_state(1)[0])
+
+
+def write_atomic(path, write_fn, mode='wb'):
+    """Write a file through write_fn(file) and atomically move it to path."""
+    tmp_path = path + _TMP_SUFFIX
+    with open(tmp_path, mode) as f:
+        write_fn(f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.rename(tmp_path, path)
+
+
+def make_config(config, mode='train', render_size=64, anti_aliasing=5,
+                hsv_colors=True):
+    """Build the config dictionary of a config, rendering images with PIL.
+
+    Args:
+        config: String. Module name of the task config to use.
+        mode: String. Mode fed to the config's get_config().
+        render_size: Int. Height and width of the rendered images.
+        anti_aliasing: Int. Renderer anti-aliasing factor.
+        hsv_colors: Bool. Whether the config uses HSV as color factors.
+
+    Returns:
+        Config dictionary with a single renderer 'image', which can be fed as
+            kwargs to physics_environment.PhysicsEnvironment.
+    """
+    from spriteworld import renderers  # pylint: disable=g-import-not-at-top
+    config = importlib.import_module(config).get_config(mode)
+    config['renderers'] = {
+        'image':
+            renderers.PILRenderer(
+                image_size=(render_size, render_size),
+                color_to_rgb=renderers.color_maps.hsv_to_rgb
+                if hsv_colors else None,
+                anti_aliasing=anti_aliasing),
+    }
+    return config
+
+
+def make_environment(config, mode='train', render_size=64, anti_aliasing=5,
+                     hsv_colors=True):
+    """Build the environment of a config, rendering images with PIL.
+
+    Args:
+        As make_config().
+
+    Returns:
+        physics_environment.PhysicsEnvironment with a single renderer 'image'.
+    """
+    return physics_environment.PhysicsEnvironment(**make_config(
+        config, mode=mode, render_size=render_size,
+        anti_aliasing=anti_aliasing, hsv_colors=hsv_colors))
+
+
+def _write_json(path, data):
+    write_atomic(path, lambda f: json.dump(data, f, indent=2, sort_keys=True),
+                  mode='w')
+
+
+def _read_json(path):
+    with open(path, 'r') as f:
+        return json.load(f)
+
+
+def _file_checksum(path):
+    sha = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+
+def _merge_ranges(ranges):
+    """Merge sorted half-open [start, stop) ranges that touch."""
+    merged = []
+    for start, stop in sorted(ranges):
+        if merged and start <= merged[-1][1]:
+            merged[-1][1] = max(merged[-1][1], stop)
+        else:
+            merged.append([start, stop])
+    return merged
+
+
+class DatasetJob(object):
+    """Resumable, sharded dataset generation job."""
+
+    def __init__(self,
+                 output_dir,
+                 config,
+                 num_episodes,
+                 episodes_per_shard=100,
+                 seed=0,
+                 mode='train',
+                 render_size=64,
+                 anti_aliasing=5,
+                 hsv_colors=True):
+        """Construct dataset job.
+
+        Args:
+            output_dir: String. Directory to write the dataset to. Created if
+                needed.
+            config: String. Module name of the task config to use.
+            num_episodes: Int. Total number of episodes.
+            episodes_per_shard: Int. Number of episodes per shard.
+            seed: Int. Seed of the job, from which episode seeds are derived.
+            mode: String. Mode fed to the config's get_config().
+            render_size: Int. Height and width of the rendered images.
+            anti_aliasing: Int. Renderer anti-aliasing factor.
+            hsv_colors: Bool. Whether the config uses HSV as color factors.
+
+        Raises:
+            ValueError: If output_dir holds a job with a different
+                specification.
+        """
+        self._output_dir = os.path.expanduser(output_dir)
+        self._spec = {
+            'config': config,
+            'num_episodes': num_episodes,
+            'episodes_per_shard': episodes_per_shard,
+            'seed': seed,
+            'mode': mode,
+            'render_size': render_size,
+            'anti_aliasing': anti_aliasing,
+            'hsv_colors': hsv_colors,
+        }
+        self._num_shards = -(-num_episodes // episodes_per_shard)
+        self._env = None
+
+        if not os.path.isdir(self._output_dir):
+            os.makedirs(self._output_dir)
+        job_path = os.path.join(self._output_dir, _JOB_FILE)
+        if os.path.isfile(job_path):
+            existing_spec = _read_json(job_path)
+            if existing_spec != self._spec:
+                raise ValueError(
+                    'Directory {} holds a job with a different specification '
+                    '{}.'.format(self._output_dir, existing_spec))
+        else:
+            _write_json(job_path, self._spec)
+
+    def _make_env(self):
+        return make_environment(
+            self._spec['config'], mode=self._spec['mode'],
+            render_size=self._spec['render_size'],
+            anti_aliasing=self._spec['anti_aliasing'],
+            hsv_colors=self._spec['hsv_colors'])
+
+    def _shard_path(self, shard, extension):
+        return os.path.join(self._output_dir,
+                            _SHARD_PATTERN.format(shard) + extension)
+
+    def shard_range(self, shard):
+        """Half-open range [start, stop) of the episodes of a shard."""
+        start = shard * self._spec['episodes_per_shard']
+        stop = min(start + self._spec['episodes_per_shard'],
+                   self._spec['num_episodes'])
+        return start, stop
+
+    def is_complete(self, shard, verify_checksum=False):
+        """Whether a shard has been completely written.
+
+        Args:
+            shard: Int. Shard index.
+            verify_checksum: Bool. Whether to also verify the checksum of the
+                shard data, which requires reading it.
+        """
+        manifest_path = self._shard_path(shard, '.json')
+        data_path = self._shard_path(shard, '.npz')
+        if not (os.path.isfile(manifest_path) and os.path.isfile(data_path)):
+            return False
+        try:
+            manifest = _read_json(manifest_path)
+        except ValueError:
+            return False
+        if (manifest.get('episodes') != list(self.shard_range(shard)) or
+                manifest.get('num_bytes') != os.path.getsize(data_path)):
+            return False
+        if verify_checksum:
+            return manifest.get('sha256') == _file_checksum(data_path)
+        return True
+
+    def completed_shards(self, verify_checksum=False):
+        return [s for s in range(self._num_shards)
+                if self.is_complete(s, verify_checksum=verify_checksum)]
+
+    def _generate_episode(self, episode):
+        """Run one episode, returning its stacked images and factors."""
+        np.random.seed(episode_seed(self._spec['seed'], episode))
+        timestep = self._env.reset()
+        images = []
+        factors = []
+        while True:
+            images.append(timestep.observation['image'])
+            factors.append(np.array(self._env.sprite_state.factors))
+            if timestep.last():
+                break
+            timestep = self._env.step()
+        return np.stack(images), np.stack(factors)
+
+    def _generate_shard(self, shard):
+        """Generate and write a shard.
+
+        The shard data is an npz file with arrays:
+            image: Uint8 array [num_episodes, num_steps, H, W, 3].
+            factors: Float array [num_episodes, num_steps, max_sprites,
+                len(sprite.FACTOR_NAMES)]. Padded with NaN beyond the number of
+                sprites of each episode.
+            num_sprites: Int array [num_episodes].
+            episodes: Int array [num_episodes] of global episode indices.
+        """
+        start, stop = self.shard_range(shard)
+        episodes = [self._generate_episode(e) for e in range(start, stop)]
+
+        images = np.stack([e[0] for e in episodes])
+        num_sprites = np.array([e[1].shape[1] for e in episodes])
+        num_steps, num_factors = episodes[0][1].shape[0], episodes[0][1].shape[2]
+        factors = np.full(
+            (len(episodes), num_steps, num_sprites.max(), num_factors), np.nan)
+        for i, (_, episode_factors) in enumerate(episodes):
+            factors[i, :, :num_sprites[i]] = episode_factors
+
+        data_path = self._shard_path(shard, '.npz')
+        write_atomic(data_path, lambda f: np.savez_compressed(
+            f, image=images, factors=factors, num_sprites=num_sprites,
+            episodes=np.arange(start, stop)))
+        _write_json(self._shard_path(shard, '.json'), {
+            'episodes': [start, stop],
+            'num_bytes': os.path.getsize(data_path),
+            'sha256': _file_checksum(data_path),
+        })
+
+    def _write_progress(self):
+        completed = self.completed_shards()
+        _write_json(os.path.join(self._output_dir, _PROGRESS_FILE), {
+            'completed_shards': completed,
+            'completed_episodes': _merge_ranges(
+                [self.shard_range(s) for s in completed]),
+            'num_shards': self._num_shards,
+        })
+
+    def run(self, shards=None, verify_checksum=False):
+        """Generate all shards that are not complete yet.
+
+        Args:
+            shards: Optional iterable of shard indices to restrict the job to,
+                e.g. to split a job across machines sharing output_dir.
+            verify_checksum: Bool. Whether to verify the checksums of existing
+                shards before skipping them.
+
+        Returns:
+            List of the indices of the shards generated by this call.
+        """
+        if shards is None:
+            shards = range(self._num_shards)
+
+        # Remove leftovers of shards that were being written when a previous
+        # run was interrupted.
+        for shard in shards:
+            for tmp_path in glob.glob(
+                    self._shard_path(shard, '.*' + _TMP_SUFFIX)):
+                os.remove(tmp_path)
+
+        todo = [s for s in shards
+                if not self.is_complete(s, verify_checksum=verify_checksum)]
+        logging.info('%d of %d shards left to generate.', len(todo),
+                     self._num_shards)
+
+        if todo and self._env is None:
+            self._env = self._make_env()
+        for i, shard in enumerate(todo):
+            self._generate_shard(shard)
+            self._write_progress()
+            logging.info('Generated shard %d (%d of %d).', shard, i + 1,
+                         len(todo))
+        return todo
+
+    @property
+    def num_shards(self):
+        return self._num_shards
+
+    @property
+    def spec(self):
+        return dict(six.iteritems(self._spec))
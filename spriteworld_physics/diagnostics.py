@@ -0,0 +1,209 @@
+"""Conserved quantities of simulated trajectories.
+
+These functions compute the total energy, linear momentum and angular momentum
+of the sprites at every step of a trajectory, vectorized over steps and
+sprites, e.g. of an episode returned by
+physics_environment.PhysicsEnvironment.rollout_episode():
+'''
+episode = env.rollout_episode(observation_keys=())
+quantities = diagnostics.conserved_quantities(
+    episode['positions'], episode['velocities'], env.sprite_state.masses,
+    env.episode_plan)
+print(diagnostics.drift(quantities['energy']))
+'''
+
+The potential energy is the sum of forces.AbstractForce.pair_potential() over
+the interaction edges of an episode plan, for force classes that are
+conservative (Spring and Gravity, and their per-edge variants). A pair of
+sprites connected in both directions, e.g. by graph_generators.FullyConnected,
+holds the potential once, shared between its two edges. An edge without its
+reverse holds the whole potential, as for sprites orbiting a fixed sprite in
+configs/star_system.py.
+
+Only the forces contribute to the energy and momenta. Collisions are not
+conservative forces and contribute no potential, and bouncing off walls
+changes the momenta of the sprites. So these quantities are only conserved in
+systems without walls and collisions, up to the integration error of the
+simulation. See accuracy_sweep.py for how they are used to pick the number of
+physics steps per environment step.
+"""
+
+# pylint: disable=import-error
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import numpy as np
+
+QUANTITY_KEYS = ('kinetic_energy', 'potential_energy', 'energy',
+                 'linear_momentum', 'angular_momentum')
+
+# Largest number of pairs of a step for which distances are computed at once.
+_MAX_CHUNK_PAIRS = 1 << 20
+
+
+def kinetic_energy(velocities, masses):
+    """Total kinetic energy.
+
+    Args:
+        velocities: Float array [..., num_sprites, 2].
+        masses: Float array [num_sprites].
+
+    Returns:
+        Float array [...].
+    """
+    return 0.5 * np.einsum('...ni,...ni,n->...', velocities, velocities,
+                           masses)
+
+
+def linear_momentum(velocities, masses):
+    """Total linear momentum.
+
+    Args:
+        velocities: Float array [..., num_sprites, 2].
+        masses: Float array [num_sprites].
+
+    Returns:
+        Float array [..., 2].
+    """
+    return np.einsum('...ni,n->...i', velocities, masses)
+
+
+def angular_momentum(positions, velocities, masses, origin=(0.5, 0.5)):
+    """Total angular momentum about a point.
+
+    Args:
+        positions: Float array [..., num_sprites, 2].
+        velocities: Float array [..., num_sprites, 2].
+        masses: Float array [num_sprites].
+        origin: Pair of floats. Point about which the momentum is taken.
+            Defaults to the center of the frame.
+
+    Returns:
+        Float array [...]. Counter-clockwise component of the momentum.
+    """
+    arm = positions - np.asarray(origin, dtype=float)
+    moment = arm[..., 0] * velocities[..., 1] - arm[..., 1] * velocities[..., 0]
+    return np.einsum('...n,n->...', moment, masses)
+
+
+def _edges_potential(force_class, senders, receivers, parameters, weights,
+                     positions, masses):
+    """Weighted sum of the pair potentials of edges, at every step."""
+    potential = np.zeros(positions.shape[0])
+    if not len(senders):
+        return potential
+    sender_masses = masses[senders]
+    receiver_masses = masses[receivers]
+    chunk = max(1, _MAX_CHUNK_PAIRS // len(senders))
+    for start in range(0, positions.shape[0], chunk):
+        steps = positions[start:start + chunk]
+        diff = steps[:, receivers] - steps[:, senders]
+        dist = np.sqrt(np.einsum('tei,tei->te', diff, diff))
+        pair_potential = force_class.pair_potential(
+            dist, sender_masses, receiver_masses, parameters)
+        potential[start:start + chunk] = np.dot(pair_potential, weights)
+    return potential
+
+
+def _pair_weights(senders, receivers, num_sprites):
+    """1/2 for edges whose reverse edge is also listed, else 1."""
+    edge_ids = senders.astype(np.int64) * num_sprites + receivers
+    reverse_ids = receivers.astype(np.int64) * num_sprites + senders
+    return np.where(np.isin(reverse_ids, edge_ids), 0.5, 1.)
+
+
+def potential_energy(positions, masses, episode_plan):
+    """Total potential energy of the conservative forces of an episode.
+
+    Args:
+        positions: Float array [num_steps, num_sprites, 2].
+        masses: Float array [num_sprites].
+        episode_plan: simulation_plan.EpisodePlan of the episode. Graphs with
+            a refresh_interval contribute the edges they have at the time of
+            the call.
+
+    Returns:
+        Float array [num_steps].
+    """
+    positions = np.asarray(positions, dtype=float)
+    masses = np.asarray(masses, dtype=float)
+    num_sprites = positions.shape[1]
+    potential = np.zeros(positions.shape[0])
+    for group in episode_plan.edge_groups:
+        if not group.force_class.conservative:
+            continue
+        weights = _pair_weights(group.senders, group.receivers, num_sprites)
+        potential += _edges_potential(
+            group.force_class, group.senders, group.receivers,
+            group.parameters, weights, positions, masses)
+
+    # Groups applied block by block act between all ordered pairs of sprites.
+    # Their edges are listed for a few receivers at a time.
+    for group in episode_plan.all_pairs_groups:
+        if not group.force_class.conservative:
+            continue
+        block = max(1, _MAX_CHUNK_PAIRS // num_sprites)
+        for start in range(0, num_sprites, block):
+            receivers = np.repeat(
+                np.arange(start, min(start + block, num_sprites)), num_sprites)
+            senders = np.tile(np.arange(num_sprites),
+                              len(receivers) // num_sprites)
+            keep = senders != receivers
+            potential += _edges_potential(
+                group.force_class, senders[keep], receivers[keep],
+                group.parameters, np.full(np.count_nonzero(keep), 0.5),
+                positions, masses)
+    return potential
+
+
+def conserved_quantities(positions, velocities, masses, episode_plan,
+                         origin=(0.5, 0.5)):
+    """Energy and momenta of a trajectory.
+
+    Args:
+        positions: Float array [num_steps, num_sprites, 2].
+        velocities: Float array [num_steps, num_sprites, 2].
+        masses: Float array [num_sprites].
+        episode_plan: simulation_plan.EpisodePlan of the episode.
+        origin: Pair of floats. Point about which the angular momentum is
+            taken.
+
+    Returns:
+        Dictionary mapping each of QUANTITY_KEYS to a float array with leading
+            dimension num_steps:
+            kinetic_energy: [num_steps].
+            potential_energy: [num_steps], see potential_energy().
+            energy: [num_steps]. Sum of the kinetic and potential energies.
+            linear_momentum: [num_steps, 2].
+            angular_momentum: [num_steps].
+    """
+    positions = np.asarray(positions, dtype=float)
+    velocities = np.asarray(velocities, dtype=float)
+    masses = np.asarray(masses, dtype=float)
+    kinetic = kinetic_energy(velocities, masses)
+    potential = potential_energy(positions, masses, episode_plan)
+    return {
+        'kinetic_energy': kinetic,
+        'potential_energy': potential,
+        'energy': kinetic + potential,
+        'linear_momentum': linear_momentum(velocities, masses),
+        'angular_momentum': angular_momentum(positions, velocities, masses,
+                                             origin=origin),
+    }
+
+
+def drift(values):
+    """Largest deviation of a quantity from its initial value.
+
+    Args:
+        values: Float array [num_steps, ...]. Values of a quantity at each
+            step, e.g. an element of conserved_quantities().
+
+    Returns:
+        Float. Largest Euclidean norm of values[t] - values[0].
+    """
+    values = np.asarray(values, dtype=float)
+    deviation = (values - values[0]).reshape(len(values), -1)
+    return float(np.sqrt(np.max(np.sum(deviation ** 2, axis=1))))
@@ -0,0 +1,274 @@
+"""Content-addressed on-disk cache of rendered episodes.
+
+Experiments often regenerate the very same episodes: the same config, seed and
+renderer settings. An EpisodeCache stores the sprite factors and renderer
+outputs of each episode in a directory named by a hash of everything the
+episode depends on, and serves later requests for the episode by
+memory-mapping the stored arrays instead of simulating and rendering it again:
+'''
+cache = episode_cache.EpisodeCache('/tmp/episodes', max_bytes=10 * 2**30)
+config = dataset_jobs.make_config('spriteworld_physics.configs.collisions')
+digest = episode_cache.config_digest(config)
+env = physics_environment.PhysicsEnvironment(**config)
+for episode in range(10):
+    seed = dataset_jobs.episode_seed(0, episode)
+    np.random.seed(seed)
+    arrays = cache.rollout_episode(
+        env, episode_cache.episode_key(digest, seed), outputs=('image',))
+'''
+
+The key of an episode is the config_hashing.config_hash() of the resolved
+config, including its forces, graph generators, factor distributions, episode
+length and renderers, of the seed of the global numpy random state the episode
+is sampled with, and of the library version. Episodes must only depend on the
+config and the seed, which holds for all configs in configs/, but not for
+environments that load their initial scenes from an
+initial_state_bank.InitialStateBank.
+
+Each entry is a directory of .npy files, factors.npy and one file per renderer
+output, written under a temporary name and atomically renamed into place, so
+several processes can share a cache directory. With max_bytes, the least
+recently used entries are deleted once the entries exceed max_bytes. An entry
+is used when it is stored or read, which sets the modification time of its
+directory. Arrays of deleted entries that are still memory-mapped remain
+readable on POSIX systems.
+"""
+
+# pylint: disable=import-error
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import collections
+import os
+import shutil
+import uuid
+
+import numpy as np
+import spriteworld_physics
+from spriteworld_physics import config_hashing
+from spriteworld_physics import physics_environment
+from spriteworld_physics import sprite_state
+
+_FACTORS = 'factors'
+_EXTENSION = '.npy'
+# Prefixes of entries being written and being deleted. Names starting with '.'
+# are not entries.
+_TMP_PREFIX = '.tmp-'
+_DELETED_PREFIX = '.deleted-'
+
+
+def config_digest(config):
+    """Hash of a resolved config, see module docstring."""
+    return config_hashing.config_hash(config)
+
+
+def episode_key(digest, seed):
+    """Key of the episode of a config sampled with a seed.
+
+    Args:
+        digest: String. config_digest() of the config.
+        seed: Int. Seed of the global numpy random state the episode is
+            sampled with, e.g. dataset_jobs.episode_seed(seed, episode).
+
+    Returns:
+        String. Hex digest of the config digest, seed and library version.
+    """
+    return config_hashing.config_hash(
+        digest, seed=int(seed), version=spriteworld_physics.__version__)
+
+
+def _entry_size(path):
+    return sum(os.path.getsize(os.path.join(path, name))
+               for name in os.listdir(path))
+
+
+class EpisodeCache(object):
+    """Directory of episodes keyed by episode_key()."""
+
+    def __init__(self, cache_dir, max_bytes=None):
+        """Construct cache.
+
+        Args:
+            cache_dir: String. Directory of the cache. Created if needed, and
+                may be shared with other processes.
+            max_bytes: Optional int. Size of the entries above which the least
+                recently used ones are deleted. Unlimited if None.
+        """
+        self._cache_dir = os.path.expanduser(cache_dir)
+        self._max_bytes = max_bytes
+        if not os.path.isdir(self._cache_dir):
+            os.makedirs(self._cache_dir)
+        # Sizes of the entries, as last seen by this process. The directory is
+        # scanned again before deleting entries, to account for the entries
+        # stored and used by other processes.
+        self._sizes = {key: size for _, key, size in self._scan()}
+        self._stats = collections.Counter()
+
+    def _entry_path(self, key):
+        return os.path.join(self._cache_dir, key)
+
+    def _scan(self):
+        """List (last use time, key, size) of the entries in the directory."""
+        entries = []
+        for key in os.listdir(self._cache_dir):
+            if key.startswith('.'):
+                continue
+            path = self._entry_path(key)
+            try:
+                entries.append((os.stat(path).st_mtime, key, _entry_size(path)))
+            except OSError:
+                # Deleted by another process since it was listed.
+                continue
+        return entries
+
+    def stored_outputs(self, key):
+        """Names of the arrays stored for an episode, empty if not cached."""
+        try:
+            names = os.listdir(self._entry_path(key))
+        except OSError:
+            return set()
+        names = set(n[:-len(_EXTENSION)] for n in names
+                    if n.endswith(_EXTENSION))
+        if _FACTORS in names:
+            names.update(physics_environment.ROLLOUT_STATE_KEYS)
+        return names
+
+    def get(self, key, outputs):
+        """Load the arrays of a cached episode.
+
+        Args:
+            key: String. Key of the episode.
+            outputs: Iterable of the names of the arrays to load, among
+                physics_environment.ROLLOUT_STATE_KEYS and the renderer names
+                of the episode.
+
+        Returns:
+            Dictionary mapping outputs to read-only memory-mapped arrays, as
+                returned by PhysicsEnvironment.rollout_episode(), or None if
+                the episode or one of the outputs is not cached.
+        """
+        outputs = tuple(outputs)
+        path = self._entry_path(key)
+        names = set(k for k in outputs
+                    if k not in physics_environment.ROLLOUT_STATE_KEYS)
+        names.add(_FACTORS)
+        try:
+            arrays = {
+                name: np.load(os.path.join(path, name + _EXTENSION),
+                              mmap_mode='r')
+                for name in names
+            }
+            os.utime(path, None)
+        except (IOError, OSError):
+            self._stats['misses'] += 1
+            return None
+        self._stats['hits'] += 1
+        factors = arrays[_FACTORS]
+        arrays['positions'] = factors[:, :, sprite_state.POSITION_SLICE]
+        arrays['velocities'] = factors[:, :, sprite_state.VELOCITY_SLICE]
+        return {k: arrays[k] for k in outputs}
+
+    def put(self, key, arrays):
+        """Store the arrays of an episode, replacing any cached arrays.
+
+        Args:
+            key: String. Key of the episode.
+            arrays: Dictionary of arrays, as returned by
+                PhysicsEnvironment.rollout_episode(). Must hold 'factors'.
+                Positions and velocities are not stored separately, as they
+                are part of the factors.
+        """
+        tmp_path = os.path.join(
+            self._cache_dir, _TMP_PREFIX + key + '-' + uuid.uuid4().hex)
+        os.makedirs(tmp_path)
+        for name, array in arrays.items():
+            if name in ('positions', 'velocities'):
+                continue
+            np.save(os.path.join(tmp_path, name + _EXTENSION), array)
+        size = _entry_size(tmp_path)
+
+        path = self._entry_path(key)
+        if os.path.isdir(path):
+            self._delete(key)
+        try:
+            os.rename(tmp_path, path)
+        except OSError:
+            # Another process stored the episode in the meantime.
+            shutil.rmtree(tmp_path, ignore_errors=True)
+            return
+        self._sizes[key] = size
+        self._stats['stores'] += 1
+        self._stats['bytes_stored'] += size
+        self._evict(keep=key)
+
+    def _delete(self, key):
+        """Delete an entry, first renaming it so it is no longer found."""
+        deleted_path = os.path.join(
+            self._cache_dir, _DELETED_PREFIX + key + '-' + uuid.uuid4().hex)
+        try:
+            os.rename(self._entry_path(key), deleted_path)
+        except OSError:
+            return False
+        finally:
+            self._sizes.pop(key, None)
+        shutil.rmtree(deleted_path, ignore_errors=True)
+        return True
+
+    def _evict(self, keep=None):
+        """Delete the least recently used entries above max_bytes."""
+        if (self._max_bytes is None or
+                sum(self._sizes.values()) <= self._max_bytes):
+            return
+        entries = sorted(self._scan())
+        self._sizes = {key: size for _, key, size in entries}
+        total_bytes = sum(self._sizes.values())
+        for _, key, size in entries:
+            if total_bytes <= self._max_bytes:
+                break
+            if key != keep and self._delete(key):
+                total_bytes -= size
+                self._stats['evictions'] += 1
+
+    def rollout_episode(self, env, key, outputs):
+        """Load an episode from the cache, or simulate and store it.
+
+        On a miss, the episode is simulated by env.rollout_episode(), so the
+        global numpy random state must be seeded with the seed of the key
+        beforehand. Renderer outputs already stored for the episode are
+        rendered again, so that the new entry holds them too.
+
+        Args:
+            env: physics_environment.PhysicsEnvironment of the config of the
+                key.
+            key: String. episode_key() of the episode.
+            outputs: Iterable of the names of the arrays to return, see get().
+
+        Returns:
+            Dictionary mapping outputs to arrays, memory-mapped on hits.
+        """
+        outputs = tuple(outputs)
+        arrays = self.get(key, outputs)
+        if arrays is not None:
+            return arrays
+        observation_keys = sorted(
+            (set(outputs) | self.stored_outputs(key)) -
+            set(physics_environment.ROLLOUT_STATE_KEYS))
+        episode = env.rollout_episode(observation_keys=observation_keys)
+        self.put(key, episode)
+        return {k: episode[k] for k in outputs}
+
+    @property
+    def cache_dir(self):
+        return self._cache_dir
+
+    @property
+    def num_bytes(self):
+        """Size of the entries, as last seen by this process."""
+        return sum(self._sizes.values())
+
+    @property
+    def stats(self):
+        """Counts of hits, misses, stores, bytes stored and evictions."""
+        return dict(self._stats)
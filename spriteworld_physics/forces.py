@@ -11,10 +11,165 @@ import numpy as np
 import six
 
 
+def is_no_force(force):
+    """Whether force is NoForce, either the class itself or an instance."""
+    return force is NoForce or isinstance(force, NoForce)
+
+
+def get_diff_dist_force_direction_edges(positions, senders, receivers,
+                                        workspace=None):
+    """Vectorized AbstractForce.get_diff_dist_force_direction() over edges.
+
+    Args:
+        positions: Float array of shape [num_sprites, 2].
+        senders: Int array of shape [num_edges]. Acting sprite indices.
+        receivers: Int array of shape [num_edges]. Receiving sprite indices.
+        workspace: Optional EdgeWorkspace of the edges. If given, the results
+            are written into its buffers instead of new arrays.
+
+    Returns:
+        diff: Float array of shape [num_edges, 2].
+        dist: Float array of shape [num_edges].
+        force_direction: Float array of shape [num_edges, 2].
+    """
+    if workspace is None:
+        diff = positions[receivers] - positions[senders]
+        dist = np.sqrt(np.einsum('ij,ij->i', diff, diff))
+        force_direction = diff / dist[:, np.newaxis]
+        return diff, dist, force_direction
+
+    # Indices are valid, so mode='clip' only avoids the buffering np.take()
+    # does with mode='raise'.
+    diff = workspace.diff
+    dist = workspace.dist
+    np.take(positions, receivers, axis=0, out=diff, mode='clip')
+    np.take(positions, senders, axis=0, mode='clip',
+            out=workspace.sender_positions)
+    np.subtract(diff, workspace.sender_positions, out=diff)
+    np.einsum('ij,ij->i', diff, diff, out=dist)
+    np.sqrt(dist, out=dist)
+    # Dividing column by column avoids the buffered iteration of
+    # broadcasting dist to [num_edges, 2].
+    for diff_column, direction_column in workspace.diff_direction_columns:
+        np.divide(diff_column, dist, out=direction_column)
+    return diff, dist, workspace.direction
+
+
+def accumulate_velocity(velocities, receivers, delta_velocity):
+    """Add per-edge velocity updates to the velocities of their receivers.
+
+    Args:
+        velocities: Float array of shape [num_sprites, 2], updated in place.
+        receivers: Int array of shape [num_edges].
+        delta_velocity: Float array of shape [num_edges, 2].
+    """
+    num_sprites = velocities.shape[0]
+    for coord in (0, 1):
+        velocities[:, coord] += np.bincount(
+            receivers, weights=delta_velocity[:, coord], minlength=num_sprites)
+
+
+class EdgeWorkspace(object):
+    """Preallocated scratch arrays for applying forces to a fixed set of edges.
+
+    simulation_plan.EpisodePlan builds one workspace per group of edges at
+    episode reset and passes it to apply_force_to_edges() every physics step,
+    so that the kernels only run in-place operations on these buffers and
+    allocate no arrays.
+
+    Velocity updates are accumulated onto receivers by sorting the edges by
+    receiver once, here, and summing each receiver's segment with
+    np.add.reduceat() every step, which unlike np.bincount() writes into an
+    existing array.
+    """
+
+    def __init__(self, velocities, masses, senders, receivers):
+        """Allocate buffers.
+
+        Args:
+            velocities: Float array of shape [num_sprites, 2]. Velocities
+                updated by accumulate_velocity(). Must stay the same array for
+                the lifetime of the workspace.
+            masses: Float array of shape [num_sprites]. Sprite masses, assumed
+                constant for the lifetime of the workspace.
+            senders: Int array of shape [num_edges].
+            receivers: Int array of shape [num_edges].
+        """
+        num_edges = len(senders)
+        self.sender_positions = np.empty((num_edges, 2))
+        self.diff = np.empty((num_edges, 2))
+        self.dist = np.empty(num_edges)
+        self.direction = np.empty((num_edges, 2))
+        self.magnitude = np.empty(num_edges)
+        self.scratch = np.empty(num_edges)
+        self.in_reach = np.empty(num_edges, dtype=bool)
+        self.delta_velocity = np.empty((num_edges, 2))
+        self.diff_direction_columns = tuple(
+            (self.diff[:, i], self.direction[:, i]) for i in (0, 1))
+        self._direction_delta_columns = tuple(
+            (self.direction[:, i], self.delta_velocity[:, i]) for i in (0, 1))
+        self.sender_masses = masses[senders]
+        self.receiver_masses = masses[receivers]
+
+        self._order = np.argsort(receivers, kind='stable')
+        sorted_receivers = receivers[self._order]
+        self._segment_starts = np.flatnonzero(np.concatenate(
+            [[True], sorted_receivers[1:] != sorted_receivers[:-1]]))
+        targets = sorted_receivers[self._segment_starts]
+        self._sorted_delta_velocity = np.empty((num_edges, 2))
+        self._segment_sums = np.empty((len(targets), 2))
+
+        # Velocities of the receivers, as a view if they are contiguous.
+        self._velocities = velocities
+        self._targets = None
+        self._target_velocities = None
+        if len(targets) and targets[-1] - targets[0] + 1 == len(targets):
+            self._target_velocities = velocities[targets[0]:targets[-1] + 1]
+        else:
+            self._targets = targets
+
+    def set_delta_velocity(self):
+        """Set delta_velocity to magnitude times direction, edge by edge."""
+        for direction_column, delta_column in self._direction_delta_columns:
+            np.multiply(self.magnitude, direction_column, out=delta_column)
+
+    def accumulate_velocity(self):
+        """Add delta_velocity of each edge to the velocity of its receiver."""
+        if not len(self._order):
+            return
+        np.take(self.delta_velocity, self._order, axis=0, mode='clip',
+                out=self._sorted_delta_velocity)
+        np.add.reduceat(self._sorted_delta_velocity, self._segment_starts,
+                        axis=0, out=self._segment_sums)
+        if self._targets is None:
+            np.add(self._target_velocities, self._segment_sums,
+                   out=self._target_velocities)
+        else:
+            np.add.at(self._velocities, self._targets, self._segment_sums)
+
+
 @six.add_metaclass(abc.ABCMeta)
 class AbstractForce(object):
     """Abstract class from which all distributions should inherit."""
 
+    # Whether the force updates the velocities of both the acting and receiving
+    # sprites. Symmetric forces must never be applied both on (i, j) and on
+    # (j, i).
+    symmetric = False
+
+    # Whether the class implements apply_force_to_edges(). Forces that do not
+    # are applied pair by pair with apply_force().
+    vectorized = False
+
+    # Whether the class implements pair_accelerations(), used to apply the
+    # force between all pairs of sprites of large scenes block by block, see
+    # blocked_forces.py.
+    blockwise = False
+
+    # Whether the class implements pair_potential(), used to compute the
+    # energy of a system, see diagnostics.py.
+    conservative = False
+
     def get_diff_dist_force_direction(self, acting_sprite, receiving_sprite):
         diff = receiving_sprite.position - acting_sprite.position
         dist = np.linalg.norm(diff)
@@ -37,16 +192,117 @@ class AbstractForce(object):
     def metadata(self):
         """Return dictionary containing force metadata."""
 
+    def parameters(self):
+        """Return dictionary of the parameters of this force.
+
+        Keys are the constructor arguments of the force. When the force is
+        compiled into a simulation_plan.SimulationPlan, each value is broadcast
+        over the edges the force is applied to and fed to
+        apply_force_to_edges().
+        """
+        return {}
+
+    def set_parameters(self, **parameters):
+        """Change parameters of this force in place.
+
+        Args:
+            **parameters: New values, keyed by names from parameters().
+
+        Raises:
+            ValueError: If a name is not a parameter of this force.
+        """
+        known = self.parameters()
+        for name, value in parameters.items():
+            if name not in known:
+                raise ValueError('{} has no parameter {}. Parameters are '
+                                 '{}.'.format(type(self).__name__, name,
+                                              sorted(known.keys())))
+            setattr(self, '_' + name, value)
+
+    @classmethod
+    def apply_force_to_edges(cls, positions, velocities, masses, senders,
+                             receivers, parameters, force_multiplier=1.,
+                             workspace=None):
+        """Apply forces of this class to many sprite pairs at once.
+
+        Only called if cls.vectorized is True. Must be equivalent to calling
+        apply_force() on each edge in order.
+
+        Args:
+            positions: Float array of shape [num_sprites, 2].
+            velocities: Float array of shape [num_sprites, 2]. Updated in
+                place.
+            masses: Float array of shape [num_sprites].
+            senders: Int array of shape [num_edges]. Acting sprite indices.
+            receivers: Int array of shape [num_edges]. Receiving sprite
+                indices.
+            parameters: Dictionary mapping the keys of parameters() to float
+                arrays of shape [num_edges].
+            force_multiplier: Coefficient to multiply to the force.
+            workspace: Optional EdgeWorkspace of these edges, holding scratch
+                buffers to compute the force in place.
+        """
+        raise NotImplementedError(
+            '{} does not support vectorized application.'.format(cls.__name__))
+
+    @classmethod
+    def pair_accelerations(cls, dist, sender_masses, receiver_masses,
+                           parameters, force_multiplier, out):
+        """Acceleration magnitudes of a block of sprite pairs.
+
+        Only called if cls.blockwise is True. The velocity of each receiver
+        changes by the returned magnitude times the unit vector from sender to
+        receiver, as in apply_force_to_edges().
+
+        Args:
+            dist: Float array [num_receivers, num_senders]. Distances between
+                receivers and senders. Must not be modified.
+            sender_masses: Float array [num_senders].
+            receiver_masses: Float array [num_receivers, 1].
+            parameters: Dictionary mapping the keys of parameters() to floats.
+            force_multiplier: Coefficient to multiply to the force.
+            out: Float array like dist, to write the magnitudes into.
+        """
+        raise NotImplementedError(
+            '{} does not support blockwise application.'.format(cls.__name__))
+
+    @classmethod
+    def pair_potential(cls, dist, sender_masses, receiver_masses, parameters):
+        """Potential energy of sprite pairs.
+
+        Only called if cls.conservative is True. The force this class applies
+        to the receiver of a pair is minus the gradient of the potential with
+        respect to the receiver position.
+
+        Args:
+            dist: Float array. Distances between receivers and senders.
+            sender_masses: Float array broadcastable to dist.
+            receiver_masses: Float array broadcastable to dist.
+            parameters: Dictionary mapping the keys of parameters() to floats
+                or to float arrays broadcastable to dist.
+
+        Returns:
+            Float array like dist.
+        """
+        raise NotImplementedError(
+            '{} does not define a potential.'.format(cls.__name__))
+
 
 class NoForce(AbstractForce):
     """Applies no force to sprites."""
 
+    vectorized = True
+
     def __init__(self):
         pass
 
     def apply_force(self, *unused_args, **unused_kwargs):
         pass
 
+    @classmethod
+    def apply_force_to_edges(cls, *unused_args, **unused_kwargs):
+        pass
+
     def metadata(self):
         return {'force': 'NoForce'}
 
@@ -54,6 +310,10 @@ class NoForce(AbstractForce):
 class Spring(AbstractForce):
     """Applies spring force according to Hooke's Law."""
 
+    vectorized = True
+    blockwise = True
+    conservative = True
+
     def __init__(self, spring_constant, spring_equilibrium):
         """Construct spring force.
 
@@ -74,11 +334,59 @@ class Spring(AbstractForce):
         acceleration = force_magnitude * force_direction / receiving_sprite.mass
         receiving_sprite.update_velocity(acceleration)
 
+    @classmethod
+    def apply_force_to_edges(cls, positions, velocities, masses, senders,
+                             receivers, parameters, force_multiplier=1.,
+                             workspace=None):
+        _, dist, force_direction = get_diff_dist_force_direction_edges(
+            positions, senders, receivers, workspace=workspace)
+        if workspace is None:
+            force_magnitude = -1. * force_multiplier * \
+                parameters['spring_constant'] * \
+                (dist - parameters['spring_equilibrium'])
+            acceleration = (
+                (force_magnitude / masses[receivers])[:, np.newaxis] *
+                force_direction)
+            accumulate_velocity(velocities, receivers, acceleration)
+            return
+
+        # Same operations as above, in the workspace buffers.
+        force_magnitude = workspace.magnitude
+        np.multiply(parameters['spring_constant'], -1. * force_multiplier,
+                    out=force_magnitude)
+        np.subtract(dist, parameters['spring_equilibrium'],
+                    out=workspace.scratch)
+        np.multiply(force_magnitude, workspace.scratch, out=force_magnitude)
+        np.divide(force_magnitude, workspace.receiver_masses,
+                  out=force_magnitude)
+        workspace.set_delta_velocity()
+        workspace.accumulate_velocity()
+
+    @classmethod
+    def pair_accelerations(cls, dist, sender_masses, receiver_masses,
+                           parameters, force_multiplier, out):
+        del sender_masses  # Unused
+        np.subtract(dist, parameters['spring_equilibrium'], out=out)
+        np.multiply(out, -1. * force_multiplier * parameters['spring_constant'],
+                    out=out)
+        np.divide(out, receiver_masses, out=out)
+        return out
+
+    @classmethod
+    def pair_potential(cls, dist, sender_masses, receiver_masses, parameters):
+        del sender_masses, receiver_masses  # Unused
+        stretch = dist - parameters['spring_equilibrium']
+        return 0.5 * parameters['spring_constant'] * stretch * stretch
+
     def metadata(self):
         return {'force': 'Spring',
                 'spring_constant': self._spring_constant,
                 'spring_equilibrium': self._spring_equilibrium}
 
+    def parameters(self):
+        return {'spring_constant': self._spring_constant,
+                'spring_equilibrium': self._spring_equilibrium}
+
 
 class Gravity(AbstractForce):
     """Applies gravitational force according to Newton's Law.
@@ -86,6 +394,11 @@ class Gravity(AbstractForce):
     This can also be used to implement magnetic repulsion in the style of
     Coulomb's Law, except the sprites' charges are the same as as their masses.
     """
+
+    vectorized = True
+    blockwise = True
+    conservative = True
+
     def __init__(self, gravity_constant, distance_for_max_force=0.01):
         """Construct gravitational force.
 
@@ -111,9 +424,168 @@ class Gravity(AbstractForce):
         acceleration = force_magnitude * force_direction / receiving_sprite.mass
         receiving_sprite.update_velocity(acceleration)
 
+    @classmethod
+    def apply_force_to_edges(cls, positions, velocities, masses, senders,
+                             receivers, parameters, force_multiplier=1.,
+                             workspace=None):
+        _, dist, force_direction = get_diff_dist_force_direction_edges(
+            positions, senders, receivers, workspace=workspace)
+        if workspace is None:
+            dist = np.maximum(dist, parameters['distance_for_max_force'])
+            receiving_masses = masses[receivers]
+            force_magnitude = (
+                force_multiplier * parameters['gravity_constant'] *
+                masses[senders] * receiving_masses) / (dist * dist)
+            acceleration = (
+                (force_magnitude / receiving_masses)[:, np.newaxis] *
+                force_direction)
+            accumulate_velocity(velocities, receivers, acceleration)
+            return
+
+        # Same operations as above, in the workspace buffers.
+        np.maximum(dist, parameters['distance_for_max_force'], out=dist)
+        force_magnitude = workspace.magnitude
+        np.multiply(parameters['gravity_constant'], force_multiplier,
+                    out=force_magnitude)
+        np.multiply(force_magnitude, workspace.sender_masses,
+                    out=force_magnitude)
+        np.multiply(force_magnitude, workspace.receiver_masses,
+                    out=force_magnitude)
+        np.multiply(dist, dist, out=workspace.scratch)
+        np.divide(force_magnitude, workspace.scratch, out=force_magnitude)
+        np.divide(force_magnitude, workspace.receiver_masses,
+                  out=force_magnitude)
+        workspace.set_delta_velocity()
+        workspace.accumulate_velocity()
+
+    @classmethod
+    def pair_accelerations(cls, dist, sender_masses, receiver_masses,
+                           parameters, force_multiplier, out):
+        # The receiver mass cancels out, so unlike in apply_force_to_edges()
+        # it is not multiplied and then divided.
+        del receiver_masses  # Unused
+        np.maximum(dist, parameters['distance_for_max_force'], out=out)
+        np.multiply(out, out, out=out)
+        np.divide(sender_masses, out, out=out)
+        np.multiply(out, force_multiplier * parameters['gravity_constant'],
+                    out=out)
+        return out
+
+    @classmethod
+    def pair_potential(cls, dist, sender_masses, receiver_masses, parameters):
+        # Below distance_for_max_force the force is constant, so the potential
+        # continues linearly.
+        min_dist = parameters['distance_for_max_force']
+        inverse_dist = np.where(
+            dist > min_dist, 1. / np.maximum(dist, min_dist),
+            (2. * min_dist - dist) / (min_dist * min_dist))
+        return (parameters['gravity_constant'] * sender_masses *
+                receiver_masses * inverse_dist)
+
     def metadata(self):
         return {'force': 'Gravity', 'gravity_constant': self._gravity_constant}
 
+    def parameters(self):
+        return {'gravity_constant': self._gravity_constant,
+                'distance_for_max_force': self._distance_for_max_force}
+
+
+def _check_scalar_parameters(force):
+    """Raise ValueError if a per-edge force has parameters of many edges."""
+    for name, value in force.parameters().items():
+        if np.ndim(value):
+            raise ValueError(
+                'Parameter {} of {} has one value per edge, so pairs of '
+                'sprites must be applied with edge_force().'.format(
+                    name, type(force).__name__))
+
+
+def _edge_parameters(force, index):
+    """Float parameters of edge index of a per-edge force."""
+    return {name: float(value if not np.ndim(value) else value[index])
+            for name, value in force.parameters().items()}
+
+
+class PerEdgeSpring(Spring):
+    """Springs with their own constant and equilibrium on each edge.
+
+    The parameters are arrays aligned with the edges of a
+    graph_generators.EdgeList, so any number of distinct springs are applied in
+    one vectorized pass. Since a pair of sprites does not identify its edge,
+    apply_force() only accepts scalar parameters. Pair by pair, each edge is
+    applied by its edge_force() instead.
+    """
+
+    # Parameters are per edge, so the force cannot be applied to all pairs.
+    blockwise = False
+
+    def __init__(self, spring_constant, spring_equilibrium):
+        """Construct per-edge spring force.
+
+        Args:
+            spring_constant: Non-negative float array of shape [num_edges], or
+                scalar. Spring constant of each edge.
+            spring_equilibrium: Non-negative float array of shape [num_edges],
+                or scalar. Resting equilibrium of each edge.
+        """
+        super(PerEdgeSpring, self).__init__(
+            spring_constant=np.asarray(spring_constant, dtype=float),
+            spring_equilibrium=np.asarray(spring_equilibrium, dtype=float))
+
+    def apply_force(self, acting_sprite, receiving_sprite, force_multiplier=1.):
+        _check_scalar_parameters(self)
+        super(PerEdgeSpring, self).apply_force(
+            acting_sprite, receiving_sprite, force_multiplier=force_multiplier)
+
+    def edge_force(self, index):
+        """Spring with the parameters of edge index."""
+        return Spring(**_edge_parameters(self, index))
+
+    def metadata(self):
+        return {'force': 'PerEdgeSpring',
+                'spring_constant': self._spring_constant.tolist(),
+                'spring_equilibrium': self._spring_equilibrium.tolist()}
+
+
+class PerEdgeGravity(Gravity):
+    """Gravity with its own constant and softening distance on each edge.
+
+    See PerEdgeSpring for how per-edge parameters are applied.
+    """
+
+    blockwise = False
+
+    def __init__(self, gravity_constant, distance_for_max_force=0.01):
+        """Construct per-edge gravitational force.
+
+        Args:
+            gravity_constant: Float array of shape [num_edges], or scalar.
+                Gravitational constant of each edge. May be negative to
+                implement a repulsive force.
+            distance_for_max_force: Float array of shape [num_edges], or
+                scalar. Distance corresponding to the maximum allowed force of
+                each edge, see Gravity.
+        """
+        super(PerEdgeGravity, self).__init__(
+            gravity_constant=np.asarray(gravity_constant, dtype=float),
+            distance_for_max_force=np.asarray(distance_for_max_force,
+                                              dtype=float))
+
+    def apply_force(self, acting_sprite, receiving_sprite, force_multiplier=1.):
+        _check_scalar_parameters(self)
+        super(PerEdgeGravity, self).apply_force(
+            acting_sprite, receiving_sprite, force_multiplier=force_multiplier)
+
+    def edge_force(self, index):
+        """Gravity with the parameters of edge index."""
+        return Gravity(**_edge_parameters(self, index))
+
+    def metadata(self):
+        return {'force': 'PerEdgeGravity',
+                'gravity_constant': self._gravity_constant.tolist(),
+                'distance_for_max_force':
+                    self._distance_for_max_force.tolist()}
+
 
 class SymmetricShellCollision(AbstractForce):
     """Applies collisions.
@@ -126,6 +598,10 @@ class SymmetricShellCollision(AbstractForce):
     never have a collision both in entry (i, j) and in entry (j, i). For
     example, use graph_generators.LowerTriangular for all-to-all collisions.
     """
+
+    symmetric = True
+    vectorized = True
+
     def __init__(self, shell_radius):
         self._shell_radius = shell_radius
 
@@ -165,5 +641,53 @@ class SymmetricShellCollision(AbstractForce):
             normalized_diff)
         receiving_sprite.update_velocity(receiving_vel_update)
 
+    @classmethod
+    def apply_force_to_edges(cls, positions, velocities, masses, senders,
+                             receivers, parameters, force_multiplier=1.,
+                             workspace=None):
+        del force_multiplier  # Unused
+
+        # Distances do not depend on velocities, so sprite pairs out of reach
+        # are filtered out in one pass. The few remaining pairs are bounced
+        # sequentially, because each bounce changes the velocities seen by the
+        # next ones. With a workspace, the filter allocates nothing unless some
+        # pair is in reach.
+        diff, dist, _ = get_diff_dist_force_direction_edges(
+            positions, senders, receivers, workspace=workspace)
+        if workspace is None:
+            in_reach = np.flatnonzero(dist <= 2 * parameters['shell_radius'])
+        else:
+            np.multiply(parameters['shell_radius'], 2, out=workspace.scratch)
+            np.less_equal(dist, workspace.scratch, out=workspace.in_reach)
+            if not workspace.in_reach.any():
+                return
+            in_reach = np.flatnonzero(workspace.in_reach)
+
+        for edge in in_reach:
+            acting, receiving = senders[edge], receivers[edge]
+            acting_mass, receiving_mass = masses[acting], masses[receiving]
+            acting_vel = velocities[acting]
+            receiving_vel = velocities[receiving]
+
+            total_vel = ((acting_mass * acting_vel +
+                          receiving_mass * receiving_vel) /
+                         (acting_mass + receiving_mass))
+            acting_centered_vel = acting_vel - total_vel
+            receiving_centered_vel = receiving_vel - total_vel
+
+            if np.dot(diff[edge], acting_centered_vel) < 0:
+                continue
+
+            normalized_diff = diff[edge] / dist[edge]
+            acting_vel += (
+                -2. * np.dot(normalized_diff, acting_centered_vel) *
+                normalized_diff)
+            receiving_vel += (
+                -2. * np.dot(normalized_diff, receiving_centered_vel) *
+                normalized_diff)
+
     def metadata(self):
         return {'force': 'ShellCollision', 'shell_radius': self._shell_radius}
+
+    def parameters(self):
+        return {'shell_radius': self._shell_radius}
@@ -8,6 +8,22 @@ Since each episode may contain a different number of sprites and require a
 different interaction graph, the classes in this file are interaction graph
 generators and all have a generate_graph(sprites) method that is called each
 episode reset and returns the interaction graph for the given spites.
+
+Graph generators also have a generate_edges(sprites) method returning the same
+interactions as a sparse edge list, grouped by force. This is what
+simulation_plan.SimulationPlan uses, so generators that can list their edges
+directly avoid building the dense num_sprites x num_sprites graph.
+
+Lattice, NearestNeighbors and RadiusGraph list the edges of local interaction
+graphs directly, in time linear in the number of sprites (see
+spatial_index.py), so they scale to scenes of many thousands of sprites.
+
+Graphs are generated at episode reset. A graph generator with a refresh_interval
+is dynamic: simulation_plan.EpisodePlan refreshes its edges every
+refresh_interval physics steps from the current sprite positions, through the
+EdgeUpdater returned by its edge_updater() method. NearestNeighbors and
+RadiusGraph can be dynamic, and update their edges incrementally: only the
+edges of the sprites that moved since the last refresh are recomputed.
 """
 
 # pylint: disable=import-error
@@ -17,9 +33,197 @@ from __future__ import division
 from __future__ import print_function
 
 import abc
+import collections
 import six
 import numpy as np
 from spriteworld_physics import forces
+from spriteworld_physics import spatial_index
+
+
+def _graph_from_edges(sprites, edges):
+    """Dense interaction graph of the edge lists of generate_edges()."""
+    graph = [[forces.NoForce for _ in sprites] for _ in sprites]
+    for force, senders, receivers in edges:
+        for i, j in zip(senders, receivers):
+            graph[i][j] = force
+    return graph
+
+
+def _sprite_positions(sprites):
+    return np.array([s.position for s in sprites], dtype=float).reshape(-1, 2)
+
+
+def _check_refresh_interval(refresh_interval):
+    if refresh_interval is not None and refresh_interval < 1:
+        raise ValueError('refresh_interval must be positive, but is {}.'.format(
+            refresh_interval))
+
+
+def _pair_ids(senders, receivers, num_sprites):
+    return senders * num_sprites + receivers
+
+
+class EdgeUpdater(object):
+    """Edges of a dynamic graph, updated as the sprites of an episode move.
+
+    This implementation regenerates all edges with generate_edges() on every
+    update. Subclasses may update them incrementally.
+    """
+
+    def __init__(self, graph_generator, sprites):
+        """Generate the initial edges.
+
+        Args:
+            graph_generator: Instance of AbstractGraphGenerator.
+            sprites: Sequence of sprites of the episode.
+        """
+        self._graph_generator = graph_generator
+        self._sprites = sprites
+        self._edges = graph_generator.generate_edges(sprites)
+        self.num_moved = len(sprites)
+        self.num_patched_edges = self.num_edges
+
+    def update(self):
+        """Update the edges from the current sprite positions.
+
+        Sets num_moved to the number of sprites whose edges were recomputed and
+        num_patched_edges to the number of edges added or removed.
+
+        Returns:
+            The edges, as returned by generate_edges().
+        """
+        num_old_edges = self.num_edges
+        self._edges = self._graph_generator.generate_edges(self._sprites)
+        self.num_moved = len(self._sprites)
+        self.num_patched_edges = num_old_edges + self.num_edges
+        return self._edges
+
+    @property
+    def edges(self):
+        return self._edges
+
+    @property
+    def num_edges(self):
+        return sum(len(senders) for _, senders, _ in self.edges)
+
+
+class _LocalEdgeUpdater(EdgeUpdater):
+    """Incremental updater of a single-force graph of local interactions.
+
+    Sprites that moved more than the move_tolerance of the generator since the
+    edges were last computed for them are moved. Subclasses implement
+    _patch(), which recomputes only the edges that moving them may change.
+    """
+
+    def __init__(self, graph_generator, sprites):
+        self._graph_generator = graph_generator
+        self._sprites = sprites
+        self._force = graph_generator.forces[0]
+        self._num_sprites = len(sprites)
+        self._positions = _sprite_positions(sprites)
+        self._senders = np.zeros(0, dtype=int)
+        self._receivers = np.zeros(0, dtype=int)
+        self._initialize()
+        self.num_moved = len(sprites)
+        self.num_patched_edges = len(self._senders)
+
+    def _initialize(self):
+        raise NotImplementedError
+
+    def _patch(self, moved):
+        raise NotImplementedError
+
+    def update(self):
+        positions = _sprite_positions(self._sprites)
+        displacement = positions - self._positions
+        moved = np.flatnonzero(np.einsum('ij,ij->i', displacement, displacement)
+                               > self._graph_generator.move_tolerance ** 2)
+        old_ids = _pair_ids(self._senders, self._receivers, self._num_sprites)
+        self._positions[moved] = positions[moved]
+        if len(moved):
+            self._patch(moved)
+        new_ids = _pair_ids(self._senders, self._receivers, self._num_sprites)
+        self.num_moved = len(moved)
+        self.num_patched_edges = (len(np.setdiff1d(old_ids, new_ids)) +
+                                  len(np.setdiff1d(new_ids, old_ids)))
+        return self.edges
+
+    def _set_edges(self, senders, receivers):
+        """Set the edges, sorted in row-major order."""
+        ids = np.unique(_pair_ids(senders, receivers, self._num_sprites))
+        self._senders, self._receivers = np.divmod(ids, self._num_sprites)
+
+    @property
+    def edges(self):
+        if not len(self._senders):
+            return []
+        return [(self._force, self._senders, self._receivers)]
+
+
+class _RadiusEdgeUpdater(_LocalEdgeUpdater):
+    """Incremental updater of the edges of a RadiusGraph.
+
+    The grid index of the sprite positions is updated with the moved sprites,
+    whose edges are recomputed, while the edges between sprites that did not
+    move are kept.
+    """
+
+    def _initialize(self):
+        self._index = spatial_index.GridIndex(
+            self._positions, self._graph_generator.radius)
+        senders, receivers, _ = self._index.neighbors()
+        self._set_edges(senders, receivers)
+
+    def _patch(self, moved):
+        self._index.update(moved, self._positions[moved])
+        is_moved = np.zeros(self._num_sprites, dtype=bool)
+        is_moved[moved] = True
+        kept = ~(is_moved[self._senders] | is_moved[self._receivers])
+        queries, neighbors, _ = self._index.neighbors(queries=moved)
+        self._set_edges(
+            np.concatenate([self._senders[kept], queries, neighbors]),
+            np.concatenate([self._receivers[kept], neighbors, queries]))
+
+
+class _NearestNeighborEdgeUpdater(_LocalEdgeUpdater):
+    """Incremental updater of the edges of a NearestNeighbors graph.
+
+    The neighbors of a sprite are recomputed if it moved, if one of its
+    neighbors moved, or if a sprite moved to within the distance of its
+    furthest neighbor. The neighbors of the other sprites are kept. As for
+    RadiusGraph, the grid index of the sprite positions is built once per
+    episode and updated with the moved sprites.
+    """
+
+    def _initialize(self):
+        self._index = spatial_index.GridIndex(
+            self._positions, spatial_index.nearest_neighbor_cell_size(
+                self._positions, self._graph_generator.num_neighbors))
+        self._neighbor_dist = np.zeros(self._num_sprites)
+        self._set_neighbors(np.arange(self._num_sprites))
+
+    def _set_neighbors(self, receivers):
+        """Recompute the neighbors of receivers, keeping the others."""
+        new_receivers, new_senders, dist = self._index.nearest_neighbors(
+            self._graph_generator.num_neighbors, queries=receivers)
+        kept = ~np.isin(self._receivers, receivers)
+        self._set_edges(
+            np.concatenate([self._senders[kept], new_senders]),
+            np.concatenate([self._receivers[kept], new_receivers]))
+        self._neighbor_dist[receivers] = 0.
+        np.maximum.at(self._neighbor_dist, new_receivers, dist)
+
+    def _patch(self, moved):
+        self._index.update(moved, self._positions[moved])
+        affected = np.zeros(self._num_sprites, dtype=bool)
+        affected[moved] = True
+        affected[self._receivers[affected[self._senders]]] = True
+        max_dist = self._neighbor_dist.max()
+        if max_dist > 0:
+            _, near, dist = self._index.neighbors(
+                radius=max_dist, queries=moved)
+            affected[near[dist <= self._neighbor_dist[near]]] = True
+        self._set_neighbors(np.flatnonzero(affected))
 
 
 @six.add_metaclass(abc.ABCMeta)
@@ -30,10 +234,84 @@ class AbstractGraphGenerator(object):
     def generate_graph(self, sprites):
         """Return interaction graph given iterable of sprites."""
 
+    def generate_edges(self, sprites):
+        """Return the non-trivial interactions of the graph as edge lists.
+
+        The default implementation reads the dense graph from generate_graph().
+        Subclasses may override this to list their edges directly.
+
+        Args:
+            sprites: Sequence of sprites.
+
+        Returns:
+            List of tuples (force, senders, receivers), one per distinct force
+                in the graph in order of first appearance, where senders and
+                receivers are int arrays with the indices of the acting and
+                receiving sprites of each edge. Edges are in row-major order of
+                the graph and NoForce edges are omitted.
+        """
+        graph = self.generate_graph(sprites)
+        edges = collections.OrderedDict()
+        for i, row in enumerate(graph):
+            for j, force in enumerate(row):
+                if forces.is_no_force(force):
+                    continue
+                if id(force) not in edges:
+                    edges[id(force)] = (force, [], [])
+                edges[id(force)][1].append(i)
+                edges[id(force)][2].append(j)
+        return [(force, np.array(senders, dtype=int),
+                 np.array(receivers, dtype=int))
+                for force, senders, receivers in edges.values()]
+
+    @property
+    def forces(self):
+        """Tuple of the forces this generator may place in its graphs.
+
+        Used to validate graph generators before any graph is generated. Empty
+        if the forces are not known in advance.
+        """
+        return ()
+
+    def applies_both_directions(self, force):
+        """Whether force may be applied on both (i, j) and (j, i).
+
+        More precisely, whether force may be applied on (i, j) while a force of
+        the same type is applied on (j, i). Used to reject symmetric forces
+        (like forces.SymmetricShellCollision) that would be applied twice per
+        sprite pair.
+        """
+        del force  # Unused
+        return False
+
+    # Number of physics steps between refreshes of the edges during an
+    # episode, or None if edges are only generated at episode reset.
+    refresh_interval = None
+
+    # Whether generate_edges() only depends on the number of sprites, and not
+    # on their positions or other factors. simulation_plan.SimulationPlan then
+    # reuses the edges of the previous episode if it had as many sprites.
+    position_independent = False
+
+    def edge_updater(self, sprites):
+        """Return an EdgeUpdater refreshing the edges of a dynamic graph."""
+        return EdgeUpdater(self, sprites)
+
+    def all_pairs_force(self):
+        """The force applied between all ordered pairs of distinct sprites.
+
+        Used by simulation_plan.SimulationPlan to apply the force between all
+        pairs of large scenes block by block, without listing the edges, see
+        blocked_forces.py. None if the graph is not of this form.
+        """
+        return None
+
 
 class FullyConnected(AbstractGraphGenerator):
     """Fully connected graph with a single force."""
 
+    position_independent = True
+
     def __init__(self, force):
         """The same force is applied between all pairs of sprites.
 
@@ -55,10 +333,28 @@ class FullyConnected(AbstractGraphGenerator):
             graph[i][i] = forces.NoForce
         return graph
 
+    def generate_edges(self, sprites):
+        if forces.is_no_force(self._force):
+            return []
+        senders, receivers = np.nonzero(~np.eye(len(sprites), dtype=bool))
+        return [(self._force, senders, receivers)]
+
+    @property
+    def forces(self):
+        return (self._force,)
+
+    def applies_both_directions(self, force):
+        return force is self._force
+
+    def all_pairs_force(self):
+        return self._force
+
 
 class LowerTriangular(AbstractGraphGenerator):
     """Fully connected graph with a single force."""
 
+    position_independent = True
+
     def __init__(self, force):
         """Construct lower triangular graph generator.
 
@@ -83,6 +379,16 @@ class LowerTriangular(AbstractGraphGenerator):
                 graph[i][j] = self._force
         return graph
 
+    def generate_edges(self, sprites):
+        if forces.is_no_force(self._force):
+            return []
+        senders, receivers = np.tril_indices(len(sprites), k=-1)
+        return [(self._force, senders, receivers)]
+
+    @property
+    def forces(self):
+        return (self._force,)
+
 
 class AdjacencyMatrix(AbstractGraphGenerator):
     """Graph defined in adjacency matrix style.
@@ -93,6 +399,8 @@ class AdjacencyMatrix(AbstractGraphGenerator):
     there will be an error.
     """
 
+    position_independent = True
+
     def __init__(self, adjacency_matrix, symmetric=True):
         """Construct AdjacencyMatrix graph generator.
 
@@ -116,3 +424,341 @@ class AdjacencyMatrix(AbstractGraphGenerator):
             if self._symmetric:
                 graph[pair[1]][pair[0]] = force
         return graph
+
+    def generate_edges(self, sprites):
+        # Same edges as the graph of generate_graph(), in row-major order,
+        # without building the dense graph.
+        pair_forces = {}
+        for pair, force in self._adjacency_matrix.items():
+            if pair[0] >= len(sprites) or pair[1] >= len(sprites):
+                raise ValueError(
+                    'pair {} has an index greater than or equal to the number '
+                    'of sprites {}'.format(pair, len(sprites)))
+            pair_forces[tuple(pair)] = force
+            if self._symmetric:
+                pair_forces[(pair[1], pair[0])] = force
+
+        edges = collections.OrderedDict()
+        for pair in sorted(pair_forces.keys()):
+            force = pair_forces[pair]
+            if forces.is_no_force(force):
+                continue
+            if id(force) not in edges:
+                edges[id(force)] = (force, [], [])
+            edges[id(force)][1].append(pair[0])
+            edges[id(force)][2].append(pair[1])
+        return [(force, np.array(senders, dtype=int),
+                 np.array(receivers, dtype=int))
+                for force, senders, receivers in edges.values()]
+
+    @property
+    def forces(self):
+        unique_forces = collections.OrderedDict(
+            (id(force), force) for force in self._adjacency_matrix.values())
+        return tuple(unique_forces.values())
+
+    def applies_both_directions(self, force):
+        for (i, j), pair_force in self._adjacency_matrix.items():
+            if pair_force is not force or i == j:
+                continue
+            if self._symmetric:
+                return True
+            reverse_force = self._adjacency_matrix.get((j, i))
+            if type(reverse_force) is type(force):
+                return True
+        return False
+
+
+class EdgeList(AbstractGraphGenerator):
+    """Graph defined by arrays of sender and receiver indices.
+
+    This is the sparse counterpart of AdjacencyMatrix for a single force. Its
+    edges are passed directly to simulation_plan.SimulationPlan without
+    building a dense graph. With forces.PerEdgeSpring or forces.PerEdgeGravity,
+    whose parameters are arrays aligned with the edges, each edge can have its
+    own force constants while all edges are still applied in one vectorized
+    pass.
+
+    As with AdjacencyMatrix, the indices do not change across episodes, so
+    every episode must have more sprites than the largest index.
+    """
+
+    position_independent = True
+
+    def __init__(self, force, senders, receivers):
+        """Construct EdgeList graph generator.
+
+        Args:
+            force: Instance of forces.AbstractForce. If its parameters are
+                arrays, they must have shape [num_edges].
+            senders: Int array of shape [num_edges]. Indices of the sprites
+                acting on each edge.
+            receivers: Int array of shape [num_edges]. Indices of the sprites
+                receiving each edge.
+
+        Raises:
+            ValueError: If senders, receivers and the force parameters have
+                inconsistent shapes.
+        """
+        self._force = force
+        self._senders = np.asarray(senders, dtype=int)
+        self._receivers = np.asarray(receivers, dtype=int)
+        if (self._senders.ndim != 1 or
+                self._senders.shape != self._receivers.shape):
+            raise ValueError(
+                'senders and receivers must be 1-dimensional arrays of the '
+                'same length, but have shapes {} and {}.'.format(
+                    self._senders.shape, self._receivers.shape))
+        if not forces.is_no_force(force):
+            for name, value in force.parameters().items():
+                if np.ndim(value) and np.shape(value) != self._senders.shape:
+                    raise ValueError(
+                        'Parameter {} of {} has shape {}, but there are {} '
+                        'edges.'.format(name, type(force).__name__,
+                                        np.shape(value), len(self._senders)))
+
+    def _check_indices(self, sprites):
+        if len(self._senders) and max(self._senders.max(),
+                                      self._receivers.max()) >= len(sprites):
+            raise ValueError(
+                'EdgeList has an index greater than or equal to the number of '
+                'sprites {}'.format(len(sprites)))
+
+    def generate_graph(self, sprites):
+        self._check_indices(sprites)
+        graph = [[forces.NoForce for _ in sprites] for _ in sprites]
+        # Forces with per-edge parameters are applied pair by pair with the
+        # parameters of each edge.
+        edge_force = getattr(self._force, 'edge_force', None)
+        for index, (i, j) in enumerate(zip(self._senders, self._receivers)):
+            graph[i][j] = (self._force if edge_force is None else
+                           edge_force(index))
+        return graph
+
+    def generate_edges(self, sprites):
+        self._check_indices(sprites)
+        if forces.is_no_force(self._force):
+            return []
+        return [(self._force, self._senders, self._receivers)]
+
+    @property
+    def forces(self):
+        return (self._force,)
+
+    def applies_both_directions(self, force):
+        if force is not self._force:
+            return False
+        pairs = set(zip(self._senders.tolist(), self._receivers.tolist()))
+        return any((j, i) in pairs for i, j in pairs if i != j)
+
+
+class Lattice(AbstractGraphGenerator):
+    """Graph connecting neighboring sprites of a 2D grid, e.g. for cloth.
+
+    Sprite i is at row i // num_columns and column i % num_columns of the grid,
+    and the last row may be partial. The force is applied in both directions
+    between horizontally and vertically adjacent sprites, and diagonal_force,
+    if any, between diagonally adjacent sprites. The sprite positions are not
+    used, so the init_sprites of a config should place the sprites accordingly.
+    """
+
+    position_independent = True
+
+    def __init__(self, force, num_columns, diagonal_force=None):
+        """Construct lattice graph generator.
+
+        Args:
+            force: Instance of forces.AbstractForce, applied between
+                horizontally and vertically adjacent sprites.
+            num_columns: Positive int. Number of columns of the grid.
+            diagonal_force: Optional instance of forces.AbstractForce, applied
+                between diagonally adjacent sprites. For springs, its
+                equilibrium should be sqrt(2) times that of force.
+
+        Raises:
+            ValueError: If num_columns is not positive.
+        """
+        if num_columns < 1:
+            raise ValueError('num_columns must be positive, but is {}.'.format(
+                num_columns))
+        self._force = force
+        self._num_columns = num_columns
+        self._diagonal_force = diagonal_force
+
+    def _pairs(self, num_sprites, row_offset, column_offsets):
+        """Edges (i, j), both ways, where j is at the given offsets of i."""
+        index = np.arange(num_sprites)
+        columns = index % self._num_columns
+        senders = []
+        receivers = []
+        for column_offset in column_offsets:
+            neighbor_columns = columns + column_offset
+            neighbors = index + row_offset * self._num_columns + column_offset
+            valid = ((neighbor_columns >= 0) &
+                     (neighbor_columns < self._num_columns) &
+                     (neighbors < num_sprites))
+            senders.extend([index[valid], neighbors[valid]])
+            receivers.extend([neighbors[valid], index[valid]])
+        senders = np.concatenate(senders)
+        receivers = np.concatenate(receivers)
+        order = np.lexsort((receivers, senders))
+        return senders[order], receivers[order]
+
+    def generate_edges(self, sprites):
+        edges = []
+        if not forces.is_no_force(self._force):
+            senders, receivers = self._pairs(len(sprites), 0, [1])
+            row_senders, row_receivers = self._pairs(len(sprites), 1, [0])
+            senders = np.concatenate([senders, row_senders])
+            receivers = np.concatenate([receivers, row_receivers])
+            order = np.lexsort((receivers, senders))
+            edges.append((self._force, senders[order], receivers[order]))
+        if (self._diagonal_force is not None and
+                not forces.is_no_force(self._diagonal_force)):
+            senders, receivers = self._pairs(len(sprites), 1, [-1, 1])
+            edges.append((self._diagonal_force, senders, receivers))
+        return [e for e in edges if len(e[1])]
+
+    def generate_graph(self, sprites):
+        return _graph_from_edges(sprites, self.generate_edges(sprites))
+
+    @property
+    def forces(self):
+        if self._diagonal_force is None:
+            return (self._force,)
+        return (self._force, self._diagonal_force)
+
+    def applies_both_directions(self, force):
+        return force is self._force or force is self._diagonal_force
+
+
+class NearestNeighbors(AbstractGraphGenerator):
+    """Graph applying a force on each sprite from its nearest sprites.
+
+    Neighbors are determined by the sprite positions when edges are generated,
+    i.e. at the start of each episode, and every refresh_interval physics steps
+    if refresh_interval is given.
+    """
+
+    def __init__(self, force, num_neighbors, refresh_interval=None,
+                 move_tolerance=0.):
+        """Construct k-nearest-neighbor graph generator.
+
+        Args:
+            force: Instance of forces.AbstractForce, applied on each sprite by
+                its num_neighbors nearest other sprites (ties broken by
+                index), or by all other sprites if there are not more.
+            num_neighbors: Positive int.
+            refresh_interval: Optional positive int. Number of physics steps
+                between refreshes of the neighbors during an episode.
+            move_tolerance: Non-negative float. On refreshes, the neighbors of
+                sprites that moved at most this distance since their last
+                refresh (and of their neighbors) are kept. 0 refreshes the
+                neighbors exactly, larger values make refreshes cheaper.
+
+        Raises:
+            ValueError: If num_neighbors or refresh_interval is not positive.
+        """
+        if num_neighbors < 1:
+            raise ValueError('num_neighbors must be positive, but is {}.'.format(
+                num_neighbors))
+        _check_refresh_interval(refresh_interval)
+        self._force = force
+        self._num_neighbors = num_neighbors
+        self.refresh_interval = refresh_interval
+        self.move_tolerance = move_tolerance
+
+    def generate_edges(self, sprites):
+        if forces.is_no_force(self._force):
+            return []
+        receivers, senders, _ = spatial_index.nearest_neighbors(
+            _sprite_positions(sprites), self._num_neighbors)
+        if not len(senders):
+            return []
+        order = np.lexsort((receivers, senders))
+        return [(self._force, senders[order], receivers[order])]
+
+    def generate_graph(self, sprites):
+        return _graph_from_edges(sprites, self.generate_edges(sprites))
+
+    def edge_updater(self, sprites):
+        if forces.is_no_force(self._force):
+            return EdgeUpdater(self, sprites)
+        return _NearestNeighborEdgeUpdater(self, sprites)
+
+    @property
+    def forces(self):
+        return (self._force,)
+
+    @property
+    def num_neighbors(self):
+        return self._num_neighbors
+
+    def applies_both_directions(self, force):
+        # Neighborhoods are often mutual.
+        return force is self._force
+
+
+class RadiusGraph(AbstractGraphGenerator):
+    """Graph applying a force between all sprites within a distance.
+
+    Distances are measured between the sprite positions when edges are
+    generated, i.e. at the start of each episode, and every refresh_interval
+    physics steps if refresh_interval is given, e.g. for springs that form and
+    break with proximity.
+    """
+
+    def __init__(self, force, radius, refresh_interval=None,
+                 move_tolerance=0.):
+        """Construct fixed-radius graph generator.
+
+        Args:
+            force: Instance of forces.AbstractForce, applied in both
+                directions between distinct sprites at most radius apart.
+            radius: Positive float.
+            refresh_interval: Optional positive int. Number of physics steps
+                between refreshes of the edges during an episode.
+            move_tolerance: Non-negative float. On refreshes, the edges
+                between sprites that moved at most this distance since their
+                last refresh are kept. 0 refreshes the edges exactly, larger
+                values make refreshes cheaper.
+
+        Raises:
+            ValueError: If radius or refresh_interval is not positive.
+        """
+        if not radius > 0:
+            raise ValueError('radius must be positive, but is {}.'.format(
+                radius))
+        _check_refresh_interval(refresh_interval)
+        self._force = force
+        self._radius = radius
+        self.refresh_interval = refresh_interval
+        self.move_tolerance = move_tolerance
+
+    def generate_edges(self, sprites):
+        if forces.is_no_force(self._force):
+            return []
+        senders, receivers, _ = spatial_index.radius_neighbors(
+            _sprite_positions(sprites), self._radius)
+        if not len(senders):
+            return []
+        return [(self._force, senders, receivers)]
+
+    def generate_graph(self, sprites):
+        return _graph_from_edges(sprites, self.generate_edges(sprites))
+
+    def edge_updater(self, sprites):
+        if forces.is_no_force(self._force):
+            return EdgeUpdater(self, sprites)
+        return _RadiusEdgeUpdater(self, sprites)
+
+    @property
+    def forces(self):
+        return (self._force,)
+
+    @property
+    def radius(self):
+        return self._radius
+
+    def applies_both_directions(self, force):
+        return force is self._force
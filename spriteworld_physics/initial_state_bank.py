@@ -0,0 +1,160 @@
+"""Banks of pre-sampled initial scenes for fast environment resets.
+
+Resetting a PhysicsEnvironment normally calls the config's init_sprites, which
+samples each factor of each sprite from its distribution. For the short
+episodes of the shipped configs this is a large share of the time spent per
+episode. An InitialStateBank instead holds the factors of many initial scenes,
+sampled in bulk ahead of time, and an environment constructed with
+initial_state_bank=bank resets by copying the next scene of the bank into its
+sprite_state.SpriteState.
+
+Scene i of a bank generated with seed s and start k is sampled with the global
+numpy random state seeded with dataset_jobs.episode_seed(s, k + i), so banks of
+disjoint seed ranges can be generated in separate processes, and a bank holds
+exactly the initial scenes that dataset_jobs.DatasetJob would sample for the
+same episodes.
+
+Banks can be saved to a directory and loaded back memory-mapped, so that large
+banks are shared between processes without being read into memory:
+'''
+bank = initial_state_bank.InitialStateBank.generate(
+    config['init_sprites'], num_scenes=100000, seed=0)
+bank.save('/tmp/collisions_bank')
+...
+bank = initial_state_bank.InitialStateBank.load('/tmp/collisions_bank')
+env = physics_environment.PhysicsEnvironment(initial_state_bank=bank, **config)
+'''
+"""
+
+# pylint: disable=import-error
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import json
+import os
+
+import numpy as np
+from spriteworld_physics import config_hashing
+from spriteworld_physics import dataset_jobs
+from spriteworld_physics import sprite_state as sprite_state_lib
+
+_FACTORS_FILE = 'factors.npy'
+_NUM_SPRITES_FILE = 'num_sprites.npy'
+_SPEC_FILE = 'bank.json'
+
+
+class InitialStateBank(object):
+    """Factors of pre-sampled initial scenes."""
+
+    def __init__(self, factors, num_sprites, spec=None):
+        """Construct bank.
+
+        Args:
+            factors: Float array [num_scenes, max_sprites,
+                sprite_state.NUM_FACTORS], possibly memory-mapped. Rows beyond
+                the number of sprites of a scene are ignored.
+            num_sprites: Int array [num_scenes].
+            spec: Optional JSON-serializable dictionary describing how the bank
+                was generated, see generate().
+        """
+        num_factors = sprite_state_lib.NUM_FACTORS
+        if factors.ndim != 3 or factors.shape[2] != num_factors:
+            raise ValueError(
+                'factors must have shape [num_scenes, max_sprites, {}], but '
+                'has shape {}.'.format(num_factors, factors.shape))
+        if num_sprites.shape != factors.shape[:1]:
+            raise ValueError('num_sprites must have shape {}, but has shape '
+                             '{}.'.format(factors.shape[:1], num_sprites.shape))
+        self._factors = factors
+        self._num_sprites = num_sprites
+        self._spec = dict(spec or {})
+
+    @classmethod
+    def generate(cls, init_sprites, num_scenes, seed=0, start=0):
+        """Sample a bank of initial scenes.
+
+        Args:
+            init_sprites: Callable returning a sequence of sprite.Sprite, e.g.
+                the 'init_sprites' entry of a config.
+            num_scenes: Int. Number of scenes.
+            seed: Int. Seed from which scene seeds are derived.
+            start: Int. Episode index of the first scene, see module docstring.
+
+        Returns:
+            InitialStateBank, with spec holding seed, start and
+                config_hashing.config_hash() of init_sprites.
+        """
+        state = sprite_state_lib.SpriteState()
+        scenes = []
+        for episode in range(start, start + num_scenes):
+            np.random.seed(dataset_jobs.episode_seed(seed, episode))
+            state.bind(init_sprites())
+            scenes.append(np.array(state.factors))
+
+        num_sprites = np.array([len(s) for s in scenes], dtype=np.int64)
+        factors = np.full(
+            (num_scenes, max(num_sprites.max(initial=0), 1),
+             sprite_state_lib.NUM_FACTORS), np.nan)
+        for i, scene in enumerate(scenes):
+            factors[i, :len(scene)] = scene
+        spec = {
+            'seed': seed,
+            'start': start,
+            'init_sprites_hash': config_hashing.config_hash(init_sprites),
+        }
+        return cls(factors, num_sprites, spec=spec)
+
+    def save(self, path):
+        """Write the bank to a directory, created if needed."""
+        path = os.path.expanduser(path)
+        if not os.path.isdir(path):
+            os.makedirs(path)
+        dataset_jobs.write_atomic(os.path.join(path, _FACTORS_FILE),
+                                  lambda f: np.save(f, self._factors))
+        dataset_jobs.write_atomic(os.path.join(path, _NUM_SPRITES_FILE),
+                                  lambda f: np.save(f, self._num_sprites))
+        dataset_jobs.write_atomic(
+            os.path.join(path, _SPEC_FILE),
+            lambda f: json.dump(self._spec, f, indent=2, sort_keys=True),
+            mode='w')
+
+    @classmethod
+    def load(cls, path, mmap_mode='r'):
+        """Load a bank written by save().
+
+        Args:
+            path: String. Directory of the bank.
+            mmap_mode: Memory-map mode of the factor array, see np.load(), or
+                None to read it into memory.
+
+        Returns:
+            InitialStateBank.
+        """
+        path = os.path.expanduser(path)
+        with open(os.path.join(path, _SPEC_FILE), 'r') as f:
+            spec = json.load(f)
+        return cls(
+            np.load(os.path.join(path, _FACTORS_FILE), mmap_mode=mmap_mode),
+            np.load(os.path.join(path, _NUM_SPRITES_FILE)),
+            spec=spec)
+
+    def scene(self, index):
+        """Factors [num_sprites, NUM_FACTORS] of a scene."""
+        return self._factors[index, :self._num_sprites[index]]
+
+    def __len__(self):
+        return len(self._num_sprites)
+
+    @property
+    def factors(self):
+        return self._factors
+
+    @property
+    def num_sprites(self):
+        return self._num_sprites
+
+    @property
+    def spec(self):
+        return dict(self._spec)
@@ -0,0 +1,89 @@
+"""Lazily rendered environment observations.
+
+A LazyObservation is a read-only mapping from renderer names to renderer
+outputs, like the observation dict of spriteworld.environment.Environment, but
+it only runs a renderer when its key is first accessed and caches the result.
+Consumers that only look at some keys, or at some timesteps, then only pay for
+the renders they use.
+
+Until the environment advances, renders read the live environment state. Before
+advancing, the environment calls freeze() on the last observation it returned,
+which snapshots the sprite factor array if some renderer has not run yet.
+Accessing the observation later rebuilds the sprites of that timestep from the
+snapshot, so a stale observation still renders the timestep it belongs to.
+"""
+
+# pylint: disable=import-error
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import numpy as np
+import six
+from six.moves import collections_abc
+from spriteworld_physics import sprite_state as sprite_state_lib
+
+
+def snapshot_state(state):
+    """Copy of an environment state that does not change as sprites move.
+
+    Args:
+        state: Dictionary with 'sprites' and 'global_state' keys, as returned
+            by physics_environment.PhysicsEnvironment.state().
+
+    Returns:
+        State dictionary holding new sprites, rebuilt from a copy of the sprite
+        factors, and a new sprite_state.SpriteState bound to them.
+    """
+    global_state = dict(state['global_state'])
+    factors = global_state['sprite_state'].factors
+    sprites = sprite_state_lib.sprites_from_factors(factors)
+    snapshot = sprite_state_lib.SpriteState(capacity=len(sprites))
+    snapshot.bind(sprites)
+    global_state['sprite_state'] = snapshot
+    if global_state.get('static_sprites') is not None:
+        global_state['static_sprites'] = np.array(
+            global_state['static_sprites'])
+    return {'sprites': sprites, 'global_state': global_state}
+
+
+class LazyObservation(collections_abc.Mapping):
+    """Observation that runs each renderer on first access of its key."""
+
+    def __init__(self, renderers, state):
+        """Construct lazy observation.
+
+        Args:
+            renderers: Dict mapping names to renderers.
+            state: Dictionary of keyword arguments of the renderers' render(),
+                i.e. with 'sprites' and 'global_state' keys.
+        """
+        self._renderers = renderers
+        self._state = state
+        self._cache = {}
+        self._frozen = False
+
+    def __getitem__(self, key):
+        if key not in self._cache:
+            self._cache[key] = self._renderers[key].render(**self._state)
+        return self._cache[key]
+
+    def __iter__(self):
+        return iter(self._renderers)
+
+    def __len__(self):
+        return len(self._renderers)
+
+    def freeze(self):
+        """Decouple the observation from the live state before it changes."""
+        if self._frozen:
+            return
+        self._frozen = True
+        if len(self._cache) < len(self._renderers):
+            self._state = snapshot_state(self._state)
+
+    @property
+    def rendered_keys(self):
+        """Names of the renderers that have already run."""
+        return [k for k in six.iterkeys(self._renderers) if k in self._cache]
@@ -0,0 +1,288 @@
+"""Parallel parameter sweeps over config constants with on-disk caching.
+
+A ParameterSweep runs a base config from configs/ at every point of a parameter
+grid, e.g.
+'''
+sweep = parameter_sweep.ParameterSweep(
+    config='spriteworld_physics.configs.colliding_springs',
+    param_grid={'spring_constant': [0.01, 0.02, 0.04],
+                'physics_steps_per_env_step': [5, 10]},
+    cache_dir='/tmp/sweeps')
+for overrides, summaries in sweep.run():
+    print(overrides, summaries['kinetic_energy'].mean())
+'''
+
+Parameter names are either keys of the config dictionary (e.g.
+'physics_steps_per_env_step' or 'episode_length'), or parameters of forces (e.g.
+'spring_constant', 'gravity_constant' or 'shell_radius'), which are set on every
+force of the config's graph generators that has them. See apply_overrides().
+
+Each point runs num_episodes episodes without rendering and stores summaries of
+the trajectories (see summarize_episode()) in cache_dir, in a file named by
+config_hashing.config_hash() of the resolved config, seed and number of
+episodes. The hash covers the parameters of the objects of the config but not
+the state they cache as they are used, so the file of a point does not depend
+on whether its config has already been simulated. Points whose file exists are loaded instead of simulated, so
+re-running a partially changed sweep only computes the new points. Points are
+simulated in parallel worker processes.
+"""
+
+# pylint: disable=import-error
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import importlib
+import itertools
+import json
+import multiprocessing
+import os
+
+from absl import logging
+import numpy as np
+import six
+from spriteworld_physics import config_hashing
+from spriteworld_physics import dataset_jobs
+from spriteworld_physics import forces
+from spriteworld_physics import physics_environment
+
+# Config keys that cannot be overridden by a sweep.
+_FIXED_CONFIG_KEYS = ('graph_generators', 'renderers', 'init_sprites')
+
+SUMMARY_KEYS = (
+    'kinetic_energy', 'mean_speed', 'min_distance', 'fraction_out_of_frame')
+
+
+def expand_grid(param_grid):
+    """List the points of a parameter grid.
+
+    Args:
+        param_grid: Dictionary mapping parameter names to sequences of values.
+
+    Returns:
+        List of dictionaries mapping parameter names to values, one per
+            element of the Cartesian product of the value sequences, with
+            parameter names in sorted order.
+    """
+    names = sorted(param_grid.keys())
+    return [dict(zip(names, values))
+            for values in itertools.product(*[param_grid[n] for n in names])]
+
+
+def apply_overrides(config, overrides):
+    """Set config constants in place.
+
+    Args:
+        config: Config dictionary, as returned by a get_config() function.
+        overrides: Dictionary mapping parameter names to values. Each name must
+            be a key of config other than 'graph_generators', 'renderers' and
+            'init_sprites', or a parameter of some force in the config's graph
+            generators (see forces.AbstractForce.parameters()), in which case
+            it is set on every such force.
+
+    Raises:
+        ValueError: If a name matches neither a config key nor a force
+            parameter.
+    """
+    for name, value in six.iteritems(overrides):
+        if name in config and name not in _FIXED_CONFIG_KEYS:
+            config[name] = value
+            continue
+        matched = False
+        for graph_generator in config['graph_generators']:
+            for force in graph_generator.forces:
+                if forces.is_no_force(force):
+                    continue
+                if name in force.parameters():
+                    force.set_parameters(**{name: value})
+                    matched = True
+        if not matched:
+            raise ValueError(
+                'Parameter {} is neither a config key nor a parameter of a '
+                'force in the config.'.format(name))
+
+
+def resolve_config(config, overrides, mode='train'):
+    """Build a config from its module name and apply overrides, see above."""
+    config = importlib.import_module(config).get_config(mode)
+    apply_overrides(config, overrides)
+    config['renderers'] = {}
+    return config
+
+
+def summarize_episode(positions, velocities, masses):
+    """Per-step summaries of a trajectory.
+
+    Args:
+        positions: Float array [num_steps, num_sprites, 2].
+        velocities: Float array [num_steps, num_sprites, 2].
+        masses: Float array [num_sprites].
+
+    Returns:
+        Dictionary mapping each of SUMMARY_KEYS to a float array [num_steps]:
+            kinetic_energy: Total kinetic energy.
+            mean_speed: Mean speed of the sprites.
+            min_distance: Smallest distance between two sprites, or inf if
+                there are fewer than two sprites.
+            fraction_out_of_frame: Fraction of sprites outside [0, 1]^2.
+    """
+    speed_squared = np.sum(velocities ** 2, axis=-1)
+    num_sprites = positions.shape[1]
+    if num_sprites > 1:
+        diff = positions[:, :, np.newaxis] - positions[:, np.newaxis]
+        dist = np.sqrt(np.sum(diff ** 2, axis=-1))
+        dist[:, np.arange(num_sprites), np.arange(num_sprites)] = np.inf
+        min_distance = dist.min(axis=(1, 2))
+    else:
+        min_distance = np.full(positions.shape[0], np.inf)
+    out_of_frame = np.any((positions < 0) | (positions > 1), axis=-1)
+    return {
+        'kinetic_energy': 0.5 * np.sum(masses * speed_squared, axis=-1),
+        'mean_speed': np.mean(np.sqrt(speed_squared), axis=-1),
+        'min_distance': min_distance,
+        'fraction_out_of_frame': np.mean(out_of_frame, axis=-1),
+    }
+
+
+def run_point(config, overrides, mode, seed, num_episodes):
+    """Simulate one grid point.
+
+    Episode e is seeded with dataset_jobs.episode_seed(seed, e), as in
+    dataset_jobs.DatasetJob.
+
+    Returns:
+        Dictionary mapping each of SUMMARY_KEYS to a float array
+            [num_episodes, episode_length + 1].
+    """
+    env = physics_environment.PhysicsEnvironment(
+        **resolve_config(config, overrides, mode=mode))
+    summaries = {k: [] for k in SUMMARY_KEYS}
+    for episode in range(num_episodes):
+        np.random.seed(dataset_jobs.episode_seed(seed, episode))
+        timestep = env.reset()
+        state = env.sprite_state
+        positions = [np.array(state.positions)]
+        velocities = [np.array(state.velocities)]
+        while not timestep.last():
+            timestep = env.step()
+            positions.append(np.array(state.positions))
+            velocities.append(np.array(state.velocities))
+        episode_summaries = summarize_episode(
+            np.stack(positions), np.stack(velocities), state.masses)
+        for k in SUMMARY_KEYS:
+            summaries[k].append(episode_summaries[k])
+    return {k: np.stack(v) for k, v in six.iteritems(summaries)}
+
+
+def _run_and_cache_point(args):
+    """Worker function computing a grid point and writing it to its path."""
+    path, config, overrides, mode, seed, num_episodes = args
+    summaries = run_point(config, overrides, mode, seed, num_episodes)
+    summaries['overrides'] = np.array(json.dumps(overrides, sort_keys=True))
+    dataset_jobs.write_atomic(path, lambda f: np.savez(f, **summaries))
+    return path
+
+
+class ParameterSweep(object):
+    """Cached sweep of a config over a grid of parameter values."""
+
+    def __init__(self,
+                 config,
+                 param_grid,
+                 cache_dir,
+                 num_episodes=10,
+                 seed=0,
+                 mode='train',
+                 num_workers=None,
+                 context=None):
+        """Construct parameter sweep.
+
+        Args:
+            config: String. Module name of the base config.
+            param_grid: Dictionary mapping parameter names to sequences of
+                values, see apply_overrides() for valid names.
+            cache_dir: String. Directory of cached grid points. Created if
+                needed, and may be shared across sweeps and configs.
+            num_episodes: Int. Number of episodes per grid point.
+            seed: Int. Seed from which episode seeds are derived. The same
+                episode seeds are used at every grid point.
+            mode: String. Mode fed to the config's get_config().
+            num_workers: Optional int. Number of worker processes. Defaults to
+                the number of CPUs. With 1, points are run in this process.
+            context: Optional multiprocessing start method, e.g. 'fork' or
+                'spawn'.
+
+        Raises:
+            ValueError: If a parameter name is invalid for the config.
+        """
+        self._config = config
+        self._cache_dir = os.path.expanduser(cache_dir)
+        self._num_episodes = num_episodes
+        self._seed = seed
+        self._mode = mode
+        self._num_workers = num_workers or multiprocessing.cpu_count()
+        self._context = context
+        self._points = expand_grid(param_grid)
+
+        # Resolving each point here validates the parameter names before any
+        # work is started.
+        self._hashes = [
+            config_hashing.config_hash(
+                resolve_config(config, overrides, mode=mode), seed=seed,
+                num_episodes=num_episodes)
+            for overrides in self._points
+        ]
+        if not os.path.isdir(self._cache_dir):
+            os.makedirs(self._cache_dir)
+
+    def point_path(self, index):
+        """Path of the cache file of the index-th grid point."""
+        return os.path.join(self._cache_dir, self._hashes[index] + '.npz')
+
+    def is_cached(self, index):
+        return os.path.isfile(self.point_path(index))
+
+    def _load(self, index):
+        with np.load(self.point_path(index)) as data:
+            return {k: data[k] for k in SUMMARY_KEYS}
+
+    def run(self):
+        """Compute the grid points that are not cached yet.
+
+        Returns:
+            List of tuples (overrides, summaries) in grid order, where
+                summaries is as returned by run_point().
+        """
+        todo = [i for i in range(len(self._points)) if not self.is_cached(i)]
+        logging.info('%d of %d grid points cached, %d left to run.',
+                     len(self._points) - len(todo), len(self._points),
+                     len(todo))
+        args = [(self.point_path(i), self._config, self._points[i],
+                 self._mode, self._seed, self._num_episodes) for i in todo]
+
+        num_workers = min(self._num_workers, len(todo))
+        if num_workers <= 1:
+            for point_args in args:
+                _run_and_cache_point(point_args)
+        else:
+            ctx = multiprocessing.get_context(self._context)
+            pool = ctx.Pool(num_workers)
+            try:
+                for path in pool.imap_unordered(_run_and_cache_point, args):
+                    logging.info('Computed grid point %s.', path)
+            finally:
+                pool.close()
+                pool.join()
+
+        return [(overrides, self._load(i))
+                for i, overrides in enumerate(self._points)]
+
+    @property
+    def points(self):
+        """List of the override dictionaries of the grid points."""
+        return list(self._points)
+
+    @property
+    def num_points(self):
+        return len(self._points)
@@ -0,0 +1,37 @@
+"""Tests for parameter_sweep."""
+
+# pylint: disable=import-error
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+from absl.testing import absltest
+from spriteworld_physics import config_hashing
+from spriteworld_physics import parameter_sweep
+from spriteworld_physics import physics_environment
+
+_COLLIDING_SPRINGS = 'spriteworld_physics.configs.colliding_springs'
+
+
+class ParameterSweepTest(absltest.TestCase):
+
+    def testPointHashDoesNotChangeWhenSimulating(self):
+        config = parameter_sweep.resolve_config(
+            _COLLIDING_SPRINGS, {'spring_constant': 0.02})
+        digest = config_hashing.config_hash(config, seed=0, num_episodes=1)
+        env = physics_environment.PhysicsEnvironment(**config)
+        env.rollout_episode(observation_keys=())
+        self.assertEqual(
+            digest, config_hashing.config_hash(config, seed=0, num_episodes=1))
+
+    def testPointHashDependsOnOverrides(self):
+        digests = set(
+            config_hashing.config_hash(parameter_sweep.resolve_config(
+                _COLLIDING_SPRINGS, {'spring_constant': spring_constant}))
+            for spring_constant in (0.01, 0.02))
+        self.assertLen(digests, 2)
+
+
+if __name__ == '__main__':
+    absltest.main()
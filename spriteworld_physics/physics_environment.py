@@ -7,17 +7,67 @@ from __future__ import division
 from __future__ import print_function
 
 from spriteworld import environment
-from spriteworld import tasks
+from spriteworld_physics import observations
+from spriteworld_physics import simulation_plan
+from spriteworld_physics import sprite_state
 import numpy as np
 import six
 import dm_env
 
+# Key of the sprite factor arrays, in the arrays returned by
+# PhysicsEnvironment.rollout_episode() and in those that record observations
+# with write_observation().
+FACTORS_KEY = 'factors'
+
+# Keys of the sprite state arrays returned by PhysicsEnvironment.rollout().
+ROLLOUT_STATE_KEYS = (FACTORS_KEY, 'positions', 'velocities')
+
+
+def write_observation(arrays, observation, index, last_index):
+    """Record the renderer outputs of a timestep in preallocated arrays.
+
+    Environments with an observation_stride return no observation between
+    strides, in which case the outputs recorded at last_index are held.
+
+    Args:
+        arrays: Dictionary mapping renderer names, and optionally FACTORS_KEY,
+            to arrays. The entry under FACTORS_KEY is left to the caller.
+        observation: Observation of the timestep, or None.
+        index: Index into the arrays of the timestep.
+        last_index: Index into the arrays of the last timestep with an
+            observation. Unused if observation is not None.
+    """
+    if observation is None:
+        for key, array in six.iteritems(arrays):
+            if key != FACTORS_KEY:
+                array[index] = array[last_index]
+    else:
+        for key, value in six.iteritems(observation):
+            if key in arrays:
+                arrays[key][index] = value
+
+
+def _output_array(out, key, shape, dtype):
+    """View of shape into out[key], which is reallocated if too small."""
+    array = out.get(key)
+    if (array is None or array.dtype != dtype or array.ndim != len(shape) or
+            any(a < s for a, s in zip(array.shape, shape))):
+        array = np.empty(shape, dtype=dtype)
+        out[key] = array
+    return array[tuple(slice(0, s) for s in shape)]
+
 
 class PhysicsEnvironment(environment.Environment):
     """Physics environment class in Spriteworld.
 
     This environment inherits from spriteworld.environment.Environment. For
     details, see https://github.com/deepmind/spriteworld.
+
+    Unlike its parent, it has no task (hence no reward), so it does not import
+    spriteworld.tasks. Together with sprite.Sprite not depending on
+    matplotlib, this keeps importing the simulation core fast, which matters
+    for short-lived worker processes. Renderers are only imported by the
+    configs or code that construct them.
     """
 
     def __init__(self,
@@ -27,6 +77,13 @@ class PhysicsEnvironment(environment.Environment):
                  bounce_off_walls=True,
                  episode_length=10,
                  physics_steps_per_env_step=1,
+                 observation_stride=1,
+                 lazy_observations=False,
+                 debug_allocations=False,
+                 initial_state_bank=None,
+                 num_threads=None,
+                 blocked_min_sprites=(
+                     simulation_plan.DEFAULT_BLOCKED_MIN_SPRITES),
                  metadata=None):
         """Construct environment with physics in Spriteworld.
 
@@ -35,6 +92,10 @@ class PhysicsEnvironment(environment.Environment):
         error of the simulator. To increase the physical accuracy of the
         simulation, increase physics_steps_per_env_step.
 
+        The graph generators and integration settings are compiled once into a
+        simulation_plan.SimulationPlan, which is bound to the sprites of each
+        episode on reset.
+
         Args:
             graph_generators: Iterable of instances of subclasses of
                 graph_generators.AbstracGraphGenerator. Each element is used to
@@ -42,7 +103,7 @@ class PhysicsEnvironment(environment.Environment):
             renderers: Dict where values are renderers and keys are names,
                 reflected in the keys of the observation.
             init_sprites: Callable returning iterable of sprites, called upon
-                environment reset.
+                environment reset unless initial_state_bank is given.
             bounce_off_walls: Bool. Whether to keep sprites in frame by making
                 them bounce elastically off the frame edges.
             episode_length: Number of steps per episode.
@@ -50,59 +111,164 @@ class PhysicsEnvironment(environment.Environment):
                 simulation to perform each environment step. If not 1, forces
                 are re-normalized to account for this and make the acceleration
                 per environment step independ of physics_steps_per_env_step.
+            observation_stride: Int. Render observations only every
+                observation_stride environment steps, counting from the first
+                timestep of the episode. Other timesteps have observation None,
+                and cost only physics simulation.
+            lazy_observations: Bool. Whether observations are
+                observations.LazyObservation instances, which only run a
+                renderer when its key is accessed, instead of dicts.
+            debug_allocations: Bool. Whether to log the bytes allocated by
+                each physics step, see simulation_plan.EpisodePlan. For
+                debugging only, since it slows down simulation.
+            initial_state_bank: Optional
+                initial_state_bank.InitialStateBank. If given, each reset
+                loads the next scene of the bank, cycling through it from
+                scene 0, instead of calling init_sprites. See next_scene.
+            num_threads: Optional int. Number of threads applying forces
+                between all pairs of sprites of large scenes, see
+                simulation_plan.SimulationPlan. Defaults to the number of CPUs.
+            blocked_min_sprites: Int. Number of sprites from which forces
+                between all pairs of sprites are applied block by block, or
+                None to never do so.
             metadata: Optional metadata to be added to the global_state.
+
+        Raises:
+            ValueError: If the graph generators are incompatible with their
+                forces, see simulation_plan.SimulationPlan, or if
+                observation_stride is not positive.
         """
+        if observation_stride < 1:
+            raise ValueError('observation_stride must be positive, but is '
+                             '{}.'.format(observation_stride))
+
         self._graph_generators = graph_generators
         self._renderers = renderers
         self._init_sprites = init_sprites
         self._bounce_off_walls = bounce_off_walls
         self._episode_length = episode_length
         self._physics_steps_per_env_step = physics_steps_per_env_step
+        self._observation_stride = observation_stride
+        self._lazy_observations = lazy_observations
         self._metadata = metadata
 
-        self._physics_delta_t = 1. / physics_steps_per_env_step
-        self._sprites = self._init_sprites()
+        self._plan = simulation_plan.SimulationPlan(
+            graph_generators=graph_generators,
+            bounce_off_walls=bounce_off_walls,
+            physics_steps_per_env_step=physics_steps_per_env_step,
+            debug_allocations=debug_allocations,
+            num_threads=num_threads,
+            blocked_min_sprites=blocked_min_sprites)
+        self._sprite_state = sprite_state.SpriteState()
+        self._initial_state_bank = initial_state_bank
+        self._next_scene = 0
+        if initial_state_bank is None:
+            self._sprites = self._init_sprites()
+            self._sprite_state.bind(self._sprites)
+        else:
+            self._sprites = self._sprite_state.bind_factors(
+                initial_state_bank.scene(0))
+        # Bound to the sprites of each episode on reset.
+        self._episode_plan = None
         self._step_count = 0
         self._reset_next_step = True
         self._renderers_initialized = False
-        self._task = tasks.NoReward()
+        self._last_observation = None
 
     def reset(self):
         """Reset the environment and re-generate the interaction graphs."""
-        timestep = super(PhysicsEnvironment, self).reset()
-        self._graphs = [graph_gen.generate_graph(self._sprites)
-                        for graph_gen in self._graph_generators]
-        return timestep
+        self._freeze_last_observation()
+        self._reset_state()
+        return dm_env.restart(self._strided_observation())
+
+    def _reset_state(self):
+        """Start a new episode, without rendering."""
+        if self._initial_state_bank is None:
+            self._sprites = self._init_sprites()
+            self._sprite_state.bind(self._sprites)
+        else:
+            self._sprites = self._sprite_state.bind_factors(
+                self._initial_state_bank.scene(self._next_scene))
+            self._next_scene = (
+                (self._next_scene + 1) % len(self._initial_state_bank))
+        self._step_count = 0
+        self._reset_next_step = False
+        self._episode_plan = self._plan.bind(self._sprites, self._sprite_state)
+
+    def state(self):
+        """Return environment state, exposing the sprite factor array.
+
+        The sprite_state.SpriteState bound to the current sprites is added to
+        the global state under the 'sprite_state' key, for renderers such as
+        renderers.SpriteFactorArray that read factors from it directly. The
+        'static_sprites' key holds a bool array marking the sprites that never
+        move during the episode, see simulation_plan.EpisodePlan.static_mask,
+        or None before the first reset.
+        """
+        state = super(PhysicsEnvironment, self).state()
+        state['global_state']['sprite_state'] = self._sprite_state
+        state['global_state']['static_sprites'] = (
+            self._episode_plan.static_mask
+            if self._episode_plan is not None else None)
+        return state
+
+    def observation(self):
+        """Render the current state with all renderers.
+
+        Returns:
+            Dict mapping renderer names to their outputs, or an
+            observations.LazyObservation if lazy_observations is True.
+        """
+        if not self._lazy_observations:
+            return super(PhysicsEnvironment, self).observation()
+        self._freeze_last_observation()
+        self._last_observation = observations.LazyObservation(
+            self._renderers, self.state())
+        return self._last_observation
+
+    def observation_spec(self):
+        if not self._renderers_initialized:
+            # Render eagerly, since renderers such as
+            # renderers.SpriteFactorArray size their specs on render, which a
+            # LazyObservation defers until its keys are accessed.
+            super(PhysicsEnvironment, self).observation()
+            self._renderers_initialized = True
+        return super(PhysicsEnvironment, self).observation_spec()
+
+    def _strided_observation(self):
+        """Observation of the current timestep, or None between strides."""
+        if self._step_count % self._observation_stride:
+            return None
+        return self.observation()
+
+    def _freeze_last_observation(self):
+        """Snapshot the last lazy observation before the state changes."""
+        if self._last_observation is not None:
+            self._last_observation.freeze()
+            self._last_observation = None
+
+    def success(self):
+        """Physics environments have no task, so never succeed."""
+        return False
 
     def should_terminate(self):
         return self._step_count >= self._episode_length
 
     def physics_step(self):
         """Apply forces and update sprite positions/velocities."""
-        # Apply forces to sprites
-        for graph in self._graphs:
-            for i, acting_sprite in enumerate(self._sprites):
-                for j, receiving_sprite in enumerate(self._sprites):
-                    graph[i][j].apply_force(
-                        acting_sprite, receiving_sprite,
-                        force_multiplier=self._physics_delta_t)
-
-        # Update sprite positions from their velocities
-        for sprite in self._sprites:
-            sprite.update_position(bounce_off_walls=self._bounce_off_walls,
-                                   delta_t=self._physics_delta_t)
+        self._episode_plan.physics_step()
 
     def step(self):
         """Step the environment, returning an observation."""
         if self._reset_next_step:
             return self.reset()
 
+        self._freeze_last_observation()
         self._step_count += 1
 
-        for _ in range(self._physics_steps_per_env_step):
-            self.physics_step()
+        self._episode_plan.env_step()
 
-        observation = self.observation()
+        observation = self._strided_observation()
 
         if self.should_terminate():
             self._reset_next_step = True
@@ -110,6 +276,160 @@ class PhysicsEnvironment(environment.Environment):
         else:
             return dm_env.transition(reward=0, observation=observation)
 
+    def rollout_episode(self, observation_keys=None, out=None):
+        """Run a whole episode, returning its stacked states and observations.
+
+        This resets the environment and steps it to the end of the episode
+        without creating dm_env.TimeStep objects. Each step is written into
+        arrays allocated once per episode, or into the arrays of out.
+
+        Args:
+            observation_keys: Optional iterable of the names of the renderers
+                to render. Defaults to all renderers. Use () to only simulate.
+            out: Optional dictionary of output arrays, keyed as the returned
+                dictionary (positions and velocities excluded). An array is
+                written into if it is large enough for the episode and
+                otherwise replaced in out by a new array, so passing the same
+                dictionary to each call reuses the arrays across episodes.
+
+        Returns:
+            Dictionary of arrays, whose first dimension is the timestep:
+                factors: Float array [episode_length + 1, num_sprites,
+                    sprite_state.NUM_FACTORS]. Sprite factors of each timestep.
+                positions: View [episode_length + 1, num_sprites, 2] of the
+                    positions in factors.
+                velocities: View [episode_length + 1, num_sprites, 2] of the
+                    velocities in factors.
+                Each renderer name in observation_keys: Renderer outputs of
+                    the timesteps that have observations, i.e. every
+                    observation_stride timesteps from the first.
+
+        Raises:
+            ValueError: If a renderer name is one of ROLLOUT_STATE_KEYS.
+        """
+        if observation_keys is None:
+            observation_keys = list(self._renderers.keys())
+        for key in observation_keys:
+            if key in ROLLOUT_STATE_KEYS:
+                raise ValueError('Renderer name {} is reserved for sprite '
+                                 'states in rollouts.'.format(key))
+        if out is None:
+            out = {}
+
+        self._freeze_last_observation()
+        self._reset_state()
+        num_steps = self._episode_length + 1
+        num_sprites = self._sprite_state.num_sprites
+        factors = _output_array(
+            out, 'factors', (num_steps, num_sprites, sprite_state.NUM_FACTORS),
+            np.float64)
+        out['factors'][:num_steps, num_sprites:] = np.nan
+        num_observations = len(range(0, num_steps, self._observation_stride))
+        episode = {}
+
+        if self._episode_plan.is_force_free and not observation_keys:
+            # Without rendering, force-free episodes are computed in one call.
+            positions, velocities = self._episode_plan.free_motion_trajectory(
+                self._episode_length)
+            factors[:] = self._sprite_state.factors
+            factors[:, :, sprite_state.POSITION_SLICE] = positions
+            factors[:, :, sprite_state.VELOCITY_SLICE] = velocities
+            self._sprite_state.factors[:] = factors[-1]
+            num_steps = 0
+            self._step_count = self._episode_length
+
+        for step in range(num_steps):
+            if step > 0:
+                self._step_count = step
+                self._episode_plan.env_step()
+            factors[step] = self._sprite_state.factors
+            if step % self._observation_stride or not observation_keys:
+                continue
+            state = self.state()
+            index = step // self._observation_stride
+            for key in observation_keys:
+                value = np.asarray(self._renderers[key].render(**state))
+                if key not in episode:
+                    episode[key] = _output_array(
+                        out, key, (num_observations,) + value.shape,
+                        value.dtype)
+                episode[key][index] = value
+
+        self._reset_next_step = True
+        episode['factors'] = factors
+        episode['positions'] = factors[:, :, sprite_state.POSITION_SLICE]
+        episode['velocities'] = factors[:, :, sprite_state.VELOCITY_SLICE]
+        return episode
+
+    def rollout(self, num_episodes, observation_keys=None,
+                reuse_outputs=False):
+        """Generator of whole episodes, see rollout_episode().
+
+        Args:
+            num_episodes: Int. Number of episodes.
+            observation_keys: Optional iterable of renderer names, see
+                rollout_episode().
+            reuse_outputs: Bool. Whether to write every episode into the same
+                arrays (reallocated only when an episode does not fit), in
+                which case each yielded episode is overwritten by the next.
+
+        Yields:
+            Dictionaries of stacked arrays, as returned by rollout_episode().
+        """
+        out = {}
+        for _ in range(num_episodes):
+            if not reuse_outputs:
+                out = {}
+            yield self.rollout_episode(observation_keys=observation_keys,
+                                       out=out)
+
+    @property
+    def episode_length(self):
+        return self._episode_length
+
+    @property
+    def allocation_log(self):
+        """Bytes allocated by each physics step of the episode, if debugging."""
+        if self._episode_plan is None:
+            return []
+        return self._episode_plan.allocation_log
+
+    @property
+    def graph_refresh_log(self):
+        """simulation_plan.GraphRefresh records of the episode so far."""
+        if self._episode_plan is None:
+            return []
+        return self._episode_plan.refresh_log
+
+    @property
+    def episode_plan(self):
+        """simulation_plan.EpisodePlan of the current episode, or None."""
+        return self._episode_plan
+
+    @property
+    def observation_stride(self):
+        return self._observation_stride
+
+    @property
+    def next_scene(self):
+        """Index of the initial_state_bank scene loaded by the next reset."""
+        return self._next_scene
+
+    @next_scene.setter
+    def next_scene(self, index):
+        if self._initial_state_bank is None:
+            raise ValueError('The environment has no initial state bank.')
+        self._next_scene = index % len(self._initial_state_bank)
+
+    @property
+    def sprite_state(self):
+        """sprite_state.SpriteState holding the factors of the sprites."""
+        return self._sprite_state
+
+    def close(self):
+        """Stop the thread pool of the simulation plan, if started."""
+        self._plan.close()
+
     def action_spec(self):
         return None
 
@@ -0,0 +1,146 @@
+"""Tests for physics_environment."""
+
+# pylint: disable=import-error
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import os
+import subprocess
+import sys
+import threading
+
+from absl.testing import absltest
+import numpy as np
+from spriteworld_physics import dataset_jobs
+from spriteworld_physics import initial_state_bank
+from spriteworld_physics import physics_environment
+from spriteworld_physics import renderers
+
+_SPRINGS = 'spriteworld_physics.configs.springs'
+_COLLIDING_SPRINGS = 'spriteworld_physics.configs.colliding_springs'
+_CONFIGS = ('drift', 'springs', 'collisions', 'magnets', 'star_system',
+            'colliding_springs')
+
+# Modules that the simulation core must not import, because they are slow to
+# import and only needed for rendering, GUIs or tasks.
+_HEAVY_MODULES = ('PIL', 'matplotlib', 'sklearn', 'spriteworld.renderers',
+                  'spriteworld.tasks')
+_CORE_MODULES = ('spriteworld_physics.forces',
+                 'spriteworld_physics.graph_generators',
+                 'spriteworld_physics.simulation_plan',
+                 'spriteworld_physics.physics_environment')
+_IMPORT_SCRIPT = '''
+import sys
+import {module}
+print(','.join(m for m in {heavy_modules!r} if m in sys.modules))
+'''
+
+
+def _make_environment(**kwargs):
+    """Environment of the springs config with a SpriteFactorArray renderer."""
+    config = dataset_jobs.make_config(_SPRINGS, render_size=16)
+    config['renderers']['factors_array'] = renderers.SpriteFactorArray()
+    config.update(kwargs)
+    return physics_environment.PhysicsEnvironment(**config)
+
+
+class PhysicsEnvironmentTest(absltest.TestCase):
+
+    def testCoreDoesNotImportHeavyModules(self):
+        root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        env = dict(os.environ, PYTHONPATH=os.pathsep.join(
+            [root] + os.environ.get('PYTHONPATH', '').split(os.pathsep)))
+        for module in _CORE_MODULES:
+            script = _IMPORT_SCRIPT.format(module=module,
+                                           heavy_modules=_HEAVY_MODULES)
+            heavy = subprocess.check_output(
+                [sys.executable, '-c', script], env=env).decode().strip()
+            self.assertEmpty(heavy, '{} imports {}'.format(module, heavy))
+
+    def testObservationSpecBeforeResetForAllConfigs(self):
+        # Consumers such as vector_environment.SubprocessVectorEnvironment and
+        # rollout_buffer.EpisodeRingBuffer.for_environment() query the
+        # observation spec of an environment before its first reset.
+        for config_name in _CONFIGS:
+            env = dataset_jobs.make_environment(
+                'spriteworld_physics.configs.' + config_name, render_size=16)
+            self.assertIn('image', env.observation_spec())
+
+    def testCloseStopsThreadPool(self):
+        num_threads = threading.active_count()
+        env = _make_environment(num_threads=2, blocked_min_sprites=2)
+        env.reset()
+        env.step()
+        self.assertGreater(threading.active_count(), num_threads)
+        env.close()
+        self.assertEqual(num_threads, threading.active_count())
+        # A closed environment starts a new thread pool if stepped again.
+        env.step()
+        env.close()
+
+    def testWriteObservationHoldsLastObservation(self):
+        arrays = {'image': np.zeros((3, 2)),
+                  physics_environment.FACTORS_KEY: np.zeros((3, 2))}
+        physics_environment.write_observation(
+            arrays, {'image': [1., 2.], 'other': [3.]}, 0, None)
+        physics_environment.write_observation(arrays, None, 1, 0)
+        np.testing.assert_array_equal([[1., 2.], [1., 2.], [0., 0.]],
+                                      arrays['image'])
+        np.testing.assert_array_equal(
+            np.zeros((3, 2)), arrays[physics_environment.FACTORS_KEY])
+
+    def testLazyObservationSpecBeforeReset(self):
+        np.random.seed(0)
+        eager_spec = _make_environment().observation_spec()
+        np.random.seed(0)
+        lazy_spec = _make_environment(
+            lazy_observations=True).observation_spec()
+        self.assertEqual(eager_spec, lazy_spec)
+
+    def testLazyObservationSpecAfterReset(self):
+        np.random.seed(0)
+        eager_env = _make_environment()
+        eager_env.reset()
+        np.random.seed(0)
+        lazy_env = _make_environment(lazy_observations=True)
+        lazy_env.reset()
+        self.assertEqual(eager_env.observation_spec(),
+                         lazy_env.observation_spec())
+
+    def testBankResetsMatchFreshEnvironments(self):
+        config = dataset_jobs.make_config(_COLLIDING_SPRINGS, render_size=16)
+        bank = initial_state_bank.InitialStateBank.generate(
+            config['init_sprites'], num_scenes=3, seed=0)
+        env = physics_environment.PhysicsEnvironment(
+            initial_state_bank=bank, **config)
+        rollouts = [env.rollout_episode() for _ in range(2 * len(bank))]
+        for index, rollout in enumerate(rollouts):
+            fresh_env = physics_environment.PhysicsEnvironment(
+                initial_state_bank=bank, **config)
+            fresh_env.next_scene = index
+            expected = fresh_env.rollout_episode()
+            self.assertCountEqual(expected.keys(), rollout.keys())
+            for key, value in expected.items():
+                np.testing.assert_array_equal(value, rollout[key])
+
+    def testBankResetsReuseSprites(self):
+        config = dataset_jobs.make_config(_COLLIDING_SPRINGS, render_size=16)
+        bank = initial_state_bank.InitialStateBank.generate(
+            config['init_sprites'], num_scenes=2, seed=0)
+        env = physics_environment.PhysicsEnvironment(
+            initial_state_bank=bank, **config)
+        env.reset()
+        sprites = env.state()['sprites']
+        env.reset()
+        self.assertIsNot(sprites, env.state()['sprites'])
+        for old_sprite, new_sprite in zip(sprites, env.state()['sprites']):
+            self.assertIs(old_sprite, new_sprite)
+        np.testing.assert_array_equal(
+            bank.scene(1)[:, :2],
+            [[s.x, s.y] for s in env.state()['sprites']])
+
+
+if __name__ == '__main__':
+    absltest.main()
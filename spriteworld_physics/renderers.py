@@ -0,0 +1,501 @@
+"""Renderers for Spriteworld with physics.
+
+These complement the renderers in spriteworld.renderers and follow the same
+interface, so they can be mixed freely in the renderers dict of an environment
+config.
+"""
+
+# pylint: disable=import-error
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+from dm_env import specs
+import numpy as np
+from PIL import Image
+from PIL import ImageDraw
+from spriteworld.renderers import abstract_renderer
+from spriteworld_physics import sprite_state as sprite_state_lib
+
+
+class SpriteFactorArray(abstract_renderer.AbstractRenderer):
+    """Renders the factors of all sprites as one float array.
+
+    The output has shape [num_sprites, len(sprite.FACTOR_NAMES)], with columns
+    ordered as sprite.FACTOR_NAMES and the shape factor encoded as in
+    sprite_state.shape_code().
+
+    When the environment exposes its sprite_state.SpriteState in the global
+    state (as physics_environment.PhysicsEnvironment does), the output is read
+    directly from the state array without visiting the sprites. Otherwise the
+    factors are gathered from the sprites into a preallocated buffer.
+    """
+
+    def __init__(self, copy=True):
+        """Construct factor array renderer.
+
+        Args:
+            copy: Bool. If True, each render returns a new array holding a
+                single copy of the factors. If False, the returned array is a
+                view that is overwritten as the environment steps, which avoids
+                copying entirely but requires the consumer to copy any data it
+                wants to keep.
+        """
+        self._copy = copy
+        self._buffer = np.zeros((0, sprite_state_lib.NUM_FACTORS))
+        self._num_sprites = None
+
+    def hash_parameters(self):
+        """Constructor arguments, see config_hashing.describe()."""
+        return {'copy': self._copy}
+
+    def render(self, sprites=(), global_state=None):
+        """Render the factors of sprites.
+
+        Args:
+            sprites: Sequence of sprite.Sprite instances.
+            global_state: Optional dictionary. If it has a 'sprite_state' key
+                holding a sprite_state.SpriteState bound to sprites, factors
+                are read from it.
+
+        Returns:
+            Float array of shape [num_sprites, len(sprite.FACTOR_NAMES)].
+        """
+        self._num_sprites = len(sprites)
+
+        state = None
+        if global_state is not None:
+            state = global_state.get('sprite_state')
+        if state is not None and state.holds(sprites):
+            factors = state.factors
+        else:
+            factors = self._gather(sprites)
+
+        if self._copy:
+            return np.array(factors)
+        return factors
+
+    def _gather(self, sprites):
+        """Gather factors from sprites that are not bound to a SpriteState."""
+        if len(sprites) > self._buffer.shape[0]:
+            self._buffer = np.zeros(
+                (len(sprites), sprite_state_lib.NUM_FACTORS))
+        factors = self._buffer[:len(sprites)]
+        for sprite, row in zip(sprites, factors):
+            sprite_state_lib.write_factors(sprite, row)
+        return factors
+
+    def observation_spec(self):
+        return specs.Array(
+            shape=(self._num_sprites, sprite_state_lib.NUM_FACTORS),
+            dtype=np.float64)
+
+
+class StaticLayerPILRenderer(abstract_renderer.AbstractRenderer):
+    """PIL renderer caching sprites that never move in a background layer.
+
+    This produces the same images as spriteworld.renderers.PILRenderer. When
+    the global state has a 'static_sprites' bool array (as provided by
+    physics_environment.PhysicsEnvironment), the leading static sprites in
+    drawing order are drawn once per episode into a background layer at full
+    anti-aliased resolution, and only the remaining sprites are drawn each
+    frame. Static sprites drawn after a moving sprite are still drawn every
+    frame, since the moving sprite may pass below them.
+    """
+
+    def __init__(self,
+                 image_size=(64, 64),
+                 anti_aliasing=1,
+                 bg_color=None,
+                 color_to_rgb=None):
+        """Construct static layer PIL renderer.
+
+        Args:
+            image_size: Int tuple (height, width). Size of output of .render().
+            anti_aliasing: Int. Anti-aliasing factor. Linearly scales the size
+                of the internal canvas.
+            bg_color: None or 3-tuple of ints in [0, 255]. Background color. If
+                None, background is (0, 0, 0).
+            color_to_rgb: Callable converting a tuple (c1, c2, c3) to a uint8
+                tuple (r, g, b) in [0, 255].
+        """
+        self._image_size = image_size
+        self._anti_aliasing = anti_aliasing
+        self._bg_color = bg_color
+        self._canvas_size = (anti_aliasing * image_size[0],
+                             anti_aliasing * image_size[1])
+
+        if color_to_rgb is None:
+            color_to_rgb = lambda x: x
+        self._color_to_rgb = color_to_rgb
+
+        if bg_color is None:
+            bg_color = (0, 0, 0)
+        self._canvas_bg = Image.new('RGB', self._canvas_size, bg_color)
+
+        self._observation_spec = specs.Array(
+            shape=self._image_size + (3,), dtype=np.uint8)
+
+        self._canvas = Image.new('RGB', self._canvas_size)
+        self._draw = ImageDraw.Draw(self._canvas)
+
+        # Cached background layer, and the sprites it was drawn for.
+        self._layer = self._canvas_bg
+        self._layer_sprites = None
+        self._num_layer_sprites = 0
+
+    def hash_parameters(self):
+        """Constructor arguments, see config_hashing.describe()."""
+        return {'image_size': self._image_size,
+                'anti_aliasing': self._anti_aliasing,
+                'bg_color': self._bg_color,
+                'color_to_rgb': self._color_to_rgb}
+
+    def _draw_sprite(self, draw, sprite):
+        vertices = self._canvas_size * sprite.vertices
+        color = self._color_to_rgb(sprite.color)
+        draw.polygon([tuple(v) for v in vertices], fill=color)
+
+    def _update_layer(self, sprites, static_sprites):
+        """Redraw the background layer for a new episode."""
+        self._layer_sprites = sprites
+        if static_sprites is None:
+            self._num_layer_sprites = 0
+        else:
+            dynamic = np.flatnonzero(~np.asarray(static_sprites))
+            self._num_layer_sprites = (
+                dynamic[0] if len(dynamic) else len(sprites))
+
+        if self._num_layer_sprites == 0:
+            self._layer = self._canvas_bg
+            return
+        self._layer = self._canvas_bg.copy()
+        draw = ImageDraw.Draw(self._layer)
+        for sprite in sprites[:self._num_layer_sprites]:
+            self._draw_sprite(draw, sprite)
+
+    def render(self, sprites=(), global_state=None):
+        """Render sprites.
+
+        Sprites are ordered from background to foreground.
+
+        Args:
+            sprites: Sequence of sprite.Sprite instances.
+            global_state: Optional dictionary. If it has a 'static_sprites'
+                key, it must be a bool array marking the sprites that do not
+                move for as long as the sequence sprites is rendered.
+
+        Returns:
+            Numpy uint8 RGB array of size self._image_size + (3,).
+        """
+        static_sprites = None
+        if global_state is not None:
+            static_sprites = global_state.get('static_sprites')
+        if static_sprites is None:
+            self._layer_sprites = None
+            self._layer = self._canvas_bg
+            self._num_layer_sprites = 0
+        elif sprites is not self._layer_sprites:
+            self._update_layer(sprites, static_sprites)
+
+        self._canvas.paste(self._layer)
+        for sprite in sprites[self._num_layer_sprites:]:
+            self._draw_sprite(self._draw, sprite)
+        image = self._canvas.resize(self._image_size, resample=Image.LANCZOS)
+
+        # PIL uses a coordinate system with the origin (0, 0) at the
+        # upper-left, but our environment uses an origin at the bottom-left
+        # (i.e. mathematical convention). Hence we need to flip the render
+        # vertically to correct for that.
+        image = np.flipud(np.array(image))
+        return image
+
+    def observation_spec(self):
+        return self._observation_spec
+
+
+class MultiResolutionPILRenderer(object):
+    """PIL renderers producing images at several resolutions from one canvas.
+
+    Sprites are drawn once on a supersampled canvas, which is then box-filter
+    downsampled to each output size. Extra output sizes hence only cost their
+    downsampling, instead of a separate rasterization as with one
+    spriteworld.renderers.PILRenderer per size.
+
+    Each output size has its own renderer, with the usual array output and
+    observation spec, obtained with renderers(). These are put in the
+    renderers dict of a config, e.g.
+    '''
+    multi_resolution = MultiResolutionPILRenderer([(64, 64), (256, 256)])
+    config['renderers'] = multi_resolution.renderers('image')
+    '''
+    gives observation keys 'image_64x64' and 'image_256x256'. The canvas is
+    drawn by the first of them to render a scene, and reused by the others.
+    """
+
+    def __init__(self,
+                 image_sizes,
+                 anti_aliasing=1,
+                 bg_color=None,
+                 color_to_rgb=None):
+        """Construct multi-resolution PIL renderer.
+
+        Args:
+            image_sizes: Iterable of int tuples (height, width). The canvas is
+                anti_aliasing times the largest size, which must be an integer
+                multiple of every size.
+            anti_aliasing: Int. Supersampling factor of the canvas relative to
+                the largest output size.
+            bg_color: None or 3-tuple of ints in [0, 255]. Background color. If
+                None, background is (0, 0, 0).
+            color_to_rgb: Callable converting a tuple (c1, c2, c3) to a uint8
+                tuple (r, g, b) in [0, 255].
+
+        Raises:
+            ValueError: If the canvas size is not an integer multiple of every
+                output size.
+        """
+        self._image_sizes = [tuple(size) for size in image_sizes]
+        self._anti_aliasing = anti_aliasing
+        self._bg_color = bg_color
+        largest = max(self._image_sizes, key=lambda s: s[0] * s[1])
+        # (height, width), whereas PIL sizes are (width, height).
+        self._canvas_size = (anti_aliasing * largest[0],
+                             anti_aliasing * largest[1])
+        for size in self._image_sizes:
+            if (self._canvas_size[0] % size[0] or
+                    self._canvas_size[1] % size[1]):
+                raise ValueError(
+                    'Canvas size {} is not a multiple of image size '
+                    '{}.'.format(self._canvas_size, size))
+
+        if color_to_rgb is None:
+            color_to_rgb = lambda x: x
+        self._color_to_rgb = color_to_rgb
+
+        if bg_color is None:
+            bg_color = (0, 0, 0)
+        pil_size = self._canvas_size[::-1]
+        self._canvas_bg = Image.new('RGB', pil_size, bg_color)
+        self._canvas = Image.new('RGB', pil_size)
+        self._draw = ImageDraw.Draw(self._canvas)
+        # Vertices are (x, y), scaled by the canvas (width, height).
+        self._vertex_scale = np.array(pil_size, dtype=float)
+        self._scene = None
+
+    def hash_parameters(self):
+        """Constructor arguments, see config_hashing.describe()."""
+        return {'image_sizes': self._image_sizes,
+                'anti_aliasing': self._anti_aliasing,
+                'bg_color': self._bg_color,
+                'color_to_rgb': self._color_to_rgb}
+
+    def _scene_key(self, sprites, global_state):
+        """Value identifying the scene drawn on the canvas."""
+        sprite_state = (global_state or {}).get('sprite_state')
+        if sprite_state is not None:
+            return sprite_state.factors.tobytes()
+        return tuple((s.vertices.tobytes(), tuple(s.color)) for s in sprites)
+
+    def _draw_canvas(self, sprites, global_state):
+        """Draw the sprites on the canvas, unless it already shows them."""
+        scene = self._scene_key(sprites, global_state)
+        if scene == self._scene:
+            return
+        self._canvas.paste(self._canvas_bg)
+        for sprite in sprites:
+            vertices = self._vertex_scale * sprite.vertices
+            color = self._color_to_rgb(sprite.color)
+            self._draw.polygon([tuple(v) for v in vertices], fill=color)
+        self._scene = scene
+
+    def render_size(self, image_size, sprites=(), global_state=None):
+        """Render sprites at one of the output sizes.
+
+        Args:
+            image_size: Int tuple (height, width). One of image_sizes.
+            sprites: Iterable of sprite.Sprite instances, ordered from
+                background to foreground.
+            global_state: Optional global state. Its sprite_state, if any,
+                identifies the scene of the canvas.
+
+        Returns:
+            Numpy uint8 RGB array of size image_size + (3,).
+        """
+        self._draw_canvas(sprites, global_state)
+        if tuple(image_size) == self._canvas_size:
+            image = self._canvas
+        else:
+            image = self._canvas.resize(tuple(image_size)[::-1],
+                                        resample=Image.BOX)
+        # Flip vertically from PIL's upper-left origin to the bottom-left
+        # origin of the environment, as in StaticLayerPILRenderer.
+        return np.flipud(np.array(image))
+
+    def renderers(self, name='image'):
+        """Renderers of each output size, keyed by name_HEIGHTxWIDTH."""
+        return {
+            '{}_{}x{}'.format(name, size[0], size[1]):
+                _ResolutionRenderer(self, size)
+            for size in self._image_sizes
+        }
+
+    @property
+    def image_sizes(self):
+        return list(self._image_sizes)
+
+
+class _ResolutionRenderer(abstract_renderer.AbstractRenderer):
+    """Renderer of one output size of a MultiResolutionPILRenderer."""
+
+    def __init__(self, multi_resolution, image_size):
+        self._multi_resolution = multi_resolution
+        self._image_size = tuple(image_size)
+        self._observation_spec = specs.Array(
+            shape=self._image_size + (3,), dtype=np.uint8)
+
+    def hash_parameters(self):
+        return {'multi_resolution': self._multi_resolution,
+                'image_size': self._image_size}
+
+    def render(self, sprites=(), global_state=None):
+        return self._multi_resolution.render_size(
+            self._image_size, sprites=sprites, global_state=global_state)
+
+    def observation_spec(self):
+        return self._observation_spec
+
+
+def _polygon_signed_distance(points, vertices):
+    """Signed distance from points to a polygon, negative inside.
+
+    Args:
+        points: Float array of shape [num_points, 2].
+        vertices: Float array of shape [num_vertices, 2]. May be non-convex.
+
+    Returns:
+        Float array of shape [num_points].
+    """
+    starts = vertices
+    ends = np.roll(vertices, -1, axis=0)
+    edges = ends - starts
+    # Distance to each edge segment, [num_points, num_vertices].
+    to_points = points[:, np.newaxis] - starts[np.newaxis]
+    t = np.clip(
+        np.sum(to_points * edges, axis=2) / np.sum(edges * edges, axis=1),
+        0., 1.)
+    closest = to_points - t[..., np.newaxis] * edges
+    dist = np.sqrt(np.min(np.sum(closest * closest, axis=2), axis=1))
+    # Inside test by the even-odd rule.
+    px = points[:, 0:1]
+    py = points[:, 1:2]
+    crosses_y = (starts[:, 1] > py) != (ends[:, 1] > py)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        x_cross = (starts[:, 0] + (py - starts[:, 1]) * edges[:, 0] /
+                   edges[:, 1])
+    inside = np.mod(np.sum(crosses_y & (px < x_cross), axis=1), 2) == 1
+    return np.where(inside, -dist, dist)
+
+
+class SignedDistanceRenderer(abstract_renderer.AbstractRenderer):
+    """Anti-aliased renderer computing pixel coverage analytically.
+
+    Instead of drawing on a canvas anti_aliasing times larger than the output
+    and downsampling, like spriteworld.renderers.PILRenderer, this computes the
+    signed distance from each pixel center to the edges of each sprite at the
+    output resolution and converts it to a coverage fraction. The coverage
+    matches a box filter for axis-aligned edges, and approximates it for
+    slanted edges and near corners, where it differs from
+    spriteworld.renderers.PILRenderer with anti_aliasing=10 by up to about 0.1
+    of full intensity. Circles use the exact distance to a circle rather than
+    to the polygon approximating them. Only pixels in the bounding box of each
+    sprite are evaluated.
+    """
+
+    def __init__(self, image_size=(64, 64), bg_color=None, color_to_rgb=None):
+        """Construct signed distance renderer.
+
+        Args:
+            image_size: Int tuple (height, width). Size of output of .render().
+            bg_color: None or 3-tuple of ints in [0, 255]. Background color. If
+                None, background is (0, 0, 0).
+            color_to_rgb: Callable converting a tuple (c1, c2, c3) to a uint8
+                tuple (r, g, b) in [0, 255].
+        """
+        self._image_size = tuple(image_size)
+        self._bg_color = bg_color
+        if color_to_rgb is None:
+            color_to_rgb = lambda x: x
+        self._color_to_rgb = color_to_rgb
+
+        if bg_color is None:
+            bg_color = (0, 0, 0)
+        self._background = np.empty(self._image_size + (3,), dtype=np.float32)
+        self._background[:] = bg_color
+        self._image = np.empty_like(self._background)
+
+        self._observation_spec = specs.Array(
+            shape=self._image_size + (3,), dtype=np.uint8)
+
+    def hash_parameters(self):
+        """Constructor arguments, see config_hashing.describe()."""
+        return {'image_size': self._image_size,
+                'bg_color': self._bg_color,
+                'color_to_rgb': self._color_to_rgb}
+
+    def _signed_distance(self, sprite, points):
+        """Signed distance in pixel units from pixel points to a sprite."""
+        height, width = self._image_size
+        vertices = sprite.vertices * [width, height]
+        if sprite.shape == 'circle':
+            center = sprite.position * [width, height]
+            radius = np.mean(np.linalg.norm(vertices - center, axis=1))
+            return np.linalg.norm(points - center, axis=1) - radius
+        return _polygon_signed_distance(points, vertices)
+
+    def render(self, sprites=(), global_state=None):
+        """Render sprites.
+
+        Sprites are ordered from background to foreground.
+
+        Args:
+            sprites: Iterable of sprite.Sprite instances.
+            global_state: Unused global state.
+
+        Returns:
+            Numpy uint8 RGB array of size self._image_size + (3,).
+        """
+        del global_state
+        height, width = self._image_size
+        image = self._image
+        image[:] = self._background
+
+        for sprite in sprites:
+            # Bounding box in pixel units, with x right and y up.
+            vertices = sprite.vertices * [width, height]
+            col_min, row_min = np.maximum(
+                np.floor(np.min(vertices, axis=0)).astype(int) - 1, 0)
+            col_max = min(int(np.ceil(np.max(vertices[:, 0]))) + 1, width)
+            row_max = min(int(np.ceil(np.max(vertices[:, 1]))) + 1, height)
+            if col_min >= col_max or row_min >= row_max:
+                continue
+
+            cols = np.arange(col_min, col_max) + 0.5
+            rows = np.arange(row_min, row_max) + 0.5
+            points = np.stack(np.meshgrid(cols, rows), axis=-1).reshape(-1, 2)
+            coverage = np.clip(
+                0.5 - self._signed_distance(sprite, points), 0., 1.)
+            coverage = coverage.reshape(len(rows), len(cols), 1)
+
+            # Row r of the image holds y in [height - r - 1, height - r], so
+            # the box is flipped vertically, as in PILRenderer.
+            patch = image[height - row_max:height - row_min, col_min:col_max]
+            color = np.asarray(self._color_to_rgb(sprite.color),
+                               dtype=np.float32)
+            patch += coverage[::-1].astype(np.float32) * (color - patch)
+
+        return np.round(image).astype(np.uint8)
+
+    def observation_spec(self):
+        return self._observation_spec
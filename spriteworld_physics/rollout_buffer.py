@@ -0,0 +1,384 @@
+"""Bounded in-memory ring buffer of whole episodes for online consumers.
+
+An EpisodeRingBuffer preallocates storage for a fixed number of episodes:
+renderer outputs of shape [capacity, num_steps, ...] and sprite factors of shape
+[capacity, num_steps, max_sprites, len(sprite.FACTOR_NAMES)]. A
+RolloutProducer fills it from one or more environments in background threads,
+writing each step directly into the storage of its slot.
+
+Consumers sample minibatches with EpisodeRingBuffer.sample(), which returns
+views into the storage of a contiguous run of slots, so no data is copied.
+Runs that wrap around the end of the storage are copied instead. Sampled
+slots are pinned until the batch is released, and a slot is only overwritten
+once it has been sampled reads_before_overwrite times, so producers block
+(back-pressure) when consumers fall behind, while consumers only wait for
+simulation until the buffer first holds enough episodes.
+
+Example usage:
+'''
+env = physics_environment.PhysicsEnvironment(**config)
+buffer = rollout_buffer.EpisodeRingBuffer.for_environment(env, capacity=256)
+producer = rollout_buffer.RolloutProducer(buffer, [env, other_env])
+producer.start()
+while training:
+    with buffer.sample(batch_size=32) as batch:
+        train_step(batch['image'], batch['factors'])
+producer.stop()
+'''
+"""
+
+# pylint: disable=import-error
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import threading
+
+import numpy as np
+import six
+from spriteworld_physics import physics_environment
+from spriteworld_physics import sprite_state as sprite_state_lib
+
+# Key of the sprite factor arrays in the buffer.
+FACTORS_KEY = physics_environment.FACTORS_KEY
+
+_FREE = 0
+_WRITING = 1
+_READY = 2
+
+
+class EpisodeBatch(object):
+    """Arrays of a contiguous run of buffer slots.
+
+    Behaves as a read-only dict from storage keys to arrays of shape
+    [batch_size, num_steps, ...], and additionally has a 'num_sprites' entry.
+    The arrays are views into the storage, unless the run wraps around its
+    end. The slots stay pinned, hence are not overwritten, until release() is
+    called, which also happens when used as a context manager.
+    """
+
+    def __init__(self, buffer, slots, arrays):
+        self._buffer = buffer
+        self._slots = slots
+        self._arrays = arrays
+        self._released = False
+
+    def __getitem__(self, key):
+        return self._arrays[key]
+
+    def keys(self):
+        return self._arrays.keys()
+
+    @property
+    def slots(self):
+        return self._slots.copy()
+
+    def release(self):
+        """Unpin the slots. The arrays must not be used afterwards."""
+        if not self._released:
+            self._released = True
+            self._buffer._release(self._slots)  # pylint: disable=protected-access
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *unused_args):
+        self.release()
+
+
+class EpisodeRingBuffer(object):
+    """Fixed-capacity, preallocated ring buffer of whole episodes."""
+
+    def __init__(self,
+                 capacity,
+                 num_steps,
+                 observation_spec,
+                 max_sprites=64,
+                 reads_before_overwrite=1):
+        """Construct ring buffer.
+
+        Args:
+            capacity: Int. Number of episodes stored.
+            num_steps: Int. Number of timesteps per episode, including the
+                first timestep returned by reset().
+            observation_spec: Dict mapping renderer names to specs with shape
+                and dtype attributes, e.g. from env.observation_spec(). The
+                renderer outputs must have these fixed shapes.
+            max_sprites: Int. Maximum number of sprites in an episode. Factor
+                arrays are padded with NaN up to this size.
+            reads_before_overwrite: Int. Number of times an episode must be
+                sampled before it can be overwritten. With 0, producers never
+                block and always overwrite the oldest unpinned episode.
+        """
+        if FACTORS_KEY in observation_spec:
+            raise ValueError('Observation key {} is reserved for the sprite '
+                             'factors.'.format(FACTORS_KEY))
+        self._capacity = capacity
+        self._num_steps = num_steps
+        self._max_sprites = max_sprites
+        self._reads_before_overwrite = reads_before_overwrite
+
+        self._storage = {
+            k: np.zeros((capacity, num_steps) + tuple(spec.shape),
+                        dtype=spec.dtype)
+            for k, spec in six.iteritems(observation_spec)
+        }
+        self._storage[FACTORS_KEY] = np.full(
+            (capacity, num_steps, max_sprites, sprite_state_lib.NUM_FACTORS),
+            np.nan)
+        self._num_sprites = np.zeros(capacity, dtype=np.int64)
+
+        self._status = np.full(capacity, _FREE)
+        self._reads = np.zeros(capacity, dtype=np.int64)
+        self._pins = np.zeros(capacity, dtype=np.int64)
+        self._write_cursor = 0
+        self._closed = False
+        self._condition = threading.Condition()
+        self._rng = np.random.RandomState()
+
+    @classmethod
+    def for_environment(cls, env, capacity, observation_keys=None, **kwargs):
+        """Construct a ring buffer sized for the episodes of env.
+
+        Args:
+            env: physics_environment.PhysicsEnvironment.
+            capacity: Int. Number of episodes stored.
+            observation_keys: Optional iterable of renderer names to store.
+                Defaults to all renderers. Renderers with variable output
+                shapes (e.g. renderers.SpriteFactorArray) should be left out.
+            **kwargs: Forwarded to the constructor.
+        """
+        observation_spec = env.observation_spec()
+        if observation_keys is None:
+            observation_keys = [
+                k for k in observation_spec.keys() if k != FACTORS_KEY]
+        return cls(
+            capacity=capacity,
+            num_steps=env.episode_length + 1,
+            observation_spec={k: observation_spec[k] for k in observation_keys},
+            **kwargs)
+
+    def _writable(self, slot):
+        if self._pins[slot] > 0:
+            return False
+        if self._status[slot] == _FREE:
+            return True
+        return (self._status[slot] == _READY and
+                self._reads[slot] >= self._reads_before_overwrite)
+
+    def acquire(self, timeout=None):
+        """Reserve the next writable slot for a producer.
+
+        Blocks while no slot is writable, i.e. while every stored episode is
+        pinned or has not been sampled enough times yet.
+
+        Args:
+            timeout: Optional float. Maximum number of seconds to wait.
+
+        Returns:
+            Int slot index, or None on timeout or if the buffer is closed.
+        """
+        with self._condition:
+            while not self._closed:
+                for offset in range(self._capacity):
+                    slot = (self._write_cursor + offset) % self._capacity
+                    if self._writable(slot):
+                        self._status[slot] = _WRITING
+                        self._reads[slot] = 0
+                        self._write_cursor = (slot + 1) % self._capacity
+                        return slot
+                if not self._condition.wait(timeout):
+                    return None
+            return None
+
+    def slot_arrays(self, slot):
+        """Dict of writable views into the storage of an acquired slot."""
+        return {k: v[slot] for k, v in six.iteritems(self._storage)}
+
+    def commit(self, slot, num_sprites):
+        """Mark an acquired slot as holding a complete episode."""
+        with self._condition:
+            self._num_sprites[slot] = num_sprites
+            self._status[slot] = _READY
+            self._condition.notify_all()
+
+    def abort(self, slot):
+        """Give back an acquired slot without committing an episode."""
+        with self._condition:
+            self._status[slot] = _FREE
+            self._condition.notify_all()
+
+    def sample(self, batch_size, timeout=None):
+        """Sample a minibatch of episodes without copying.
+
+        The batch is a contiguous run of batch_size ready slots, with a start
+        sampled uniformly among the valid ones. Runs may wrap around from the
+        last slot to the first, in which case the episodes are copied rather
+        than viewed.
+
+        Args:
+            batch_size: Int. Number of episodes. At most capacity.
+            timeout: Optional float. Maximum number of seconds to wait for
+                batch_size contiguous ready episodes.
+
+        Returns:
+            EpisodeBatch, or None on timeout.
+        """
+        if batch_size > self._capacity:
+            raise ValueError('batch_size {} is larger than capacity {}.'.format(
+                batch_size, self._capacity))
+        with self._condition:
+            while True:
+                ready = (self._status == _READY).astype(np.int64)
+                # Runs starting at each slot, continuing past the last slot
+                # with the first ones.
+                ready = np.concatenate([ready, ready[:batch_size - 1]])
+                ready_runs = np.convolve(
+                    ready, np.ones(batch_size, dtype=np.int64), mode='valid')
+                starts = np.flatnonzero(ready_runs == batch_size)
+                if len(starts):
+                    break
+                if self._closed or not self._condition.wait(timeout):
+                    return None
+
+            start = starts[self._rng.randint(len(starts))]
+            slots = (start + np.arange(batch_size)) % self._capacity
+            self._pins[slots] += 1
+            self._reads[slots] += 1
+
+        if start + batch_size <= self._capacity:
+            index = slice(start, start + batch_size)
+            arrays = {k: v[index] for k, v in six.iteritems(self._storage)}
+            arrays['num_sprites'] = self._num_sprites[index]
+        else:
+            arrays = {k: np.take(v, slots, axis=0)
+                      for k, v in six.iteritems(self._storage)}
+            arrays['num_sprites'] = self._num_sprites[slots]
+        return EpisodeBatch(self, slots, arrays)
+
+    def _release(self, slots):
+        with self._condition:
+            self._pins[slots] -= 1
+            self._condition.notify_all()
+
+    def close(self):
+        """Wake up and stop all blocked producers and consumers."""
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+
+    @property
+    def size(self):
+        """Number of slots holding a complete episode."""
+        with self._condition:
+            return int(np.sum(self._status == _READY))
+
+    @property
+    def capacity(self):
+        return self._capacity
+
+    @property
+    def num_steps(self):
+        return self._num_steps
+
+    @property
+    def max_sprites(self):
+        return self._max_sprites
+
+    @property
+    def closed(self):
+        return self._closed
+
+
+class RolloutProducer(object):
+    """Fills an EpisodeRingBuffer from environments in background threads.
+
+    Each environment is stepped by its own thread. Much of the work of stepping
+    and rendering happens in NumPy and PIL, which release the GIL, so several
+    environments can make progress concurrently. Environments with an
+    observation_stride only render every few steps, and in between the renderer
+    arrays hold the last rendered observation.
+    """
+
+    def __init__(self, buffer, envs):
+        """Construct producer.
+
+        Args:
+            buffer: EpisodeRingBuffer.
+            envs: Iterable of physics_environment.PhysicsEnvironment instances,
+                whose episodes have buffer.num_steps timesteps.
+        """
+        self._buffer = buffer
+        self._envs = list(envs)
+        self._stop_event = threading.Event()
+        self._threads = []
+        self._errors = []
+        self._episodes_produced = 0
+        self._lock = threading.Lock()
+
+    def _run_episode(self, env, slot):
+        arrays = self._buffer.slot_arrays(slot)
+        factors = arrays[FACTORS_KEY]
+        timestep = env.reset()
+        num_sprites = env.sprite_state.num_sprites
+        if num_sprites > self._buffer.max_sprites:
+            raise ValueError('Episode has {} sprites, more than max_sprites='
+                             '{}.'.format(num_sprites, self._buffer.max_sprites))
+        factors[:, num_sprites:] = np.nan
+
+        for step in range(self._buffer.num_steps):
+            if step > 0:
+                timestep = env.step()
+            # The first timestep always has an observation.
+            physics_environment.write_observation(
+                arrays, timestep.observation, step, step - 1)
+            factors[step, :num_sprites] = env.sprite_state.factors
+            if timestep.last() and step < self._buffer.num_steps - 1:
+                raise ValueError('Episode is shorter than buffer.num_steps.')
+        return num_sprites
+
+    def _loop(self, env):
+        try:
+            while not self._stop_event.is_set():
+                slot = self._buffer.acquire(timeout=0.1)
+                if slot is None:
+                    if self._buffer.closed:
+                        return
+                    continue
+                try:
+                    num_sprites = self._run_episode(env, slot)
+                except BaseException:
+                    self._buffer.abort(slot)
+                    raise
+                self._buffer.commit(slot, num_sprites)
+                with self._lock:
+                    self._episodes_produced += 1
+        except Exception as e:  # pylint: disable=broad-except
+            self._errors.append(e)
+
+    def start(self):
+        """Start one producer thread per environment."""
+        self._stop_event.clear()
+        self._threads = [threading.Thread(target=self._loop, args=(env,))
+                         for env in self._envs]
+        for thread in self._threads:
+            thread.daemon = True
+            thread.start()
+
+    def stop(self):
+        """Stop the producer threads after their current episode.
+
+        Raises:
+            The first exception raised in a producer thread, if any.
+        """
+        self._stop_event.set()
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
+        if self._errors:
+            raise self._errors[0]
+
+    @property
+    def episodes_produced(self):
+        return self._episodes_produced
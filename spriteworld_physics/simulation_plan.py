@@ -0,0 +1,717 @@
+"""Compiled simulation plans.
+
+A SimulationPlan is built once from the graph generators and integration
+settings of a config, before any episode is run. Building it validates the
+config, e.g. rejecting symmetric forces in graph generators that would apply
+them twice per sprite pair.
+
+At each episode reset the plan is bound to the sprites of the episode, which
+generates the interaction edges and groups them by force type into an
+EpisodePlan. Each group holds the sender and receiver indices of its edges and
+the force parameters broadcast to per-edge arrays. Running a physics step then
+only executes one vectorized call per group on the arrays of a
+sprite_state.SpriteState, followed by a vectorized integration step, with no
+per-pair dispatch. Sprites that provably never move during the episode (see
+EpisodePlan.static_mask) still act as force sources but are skipped by
+integration. Graph generators whose edges only depend on the number of sprites,
+like graph_generators.FullyConnected, reuse the edges of the previous episode.
+
+If no force acts in an episode, e.g. in configs/drift.py, the episode plan skips
+physics steps altogether and computes the state at each environment step in
+closed form with free_motion.free_motion_state().
+
+Graph generators that apply one force between all pairs of sprites, like
+graph_generators.FullyConnected, have num_sprites * (num_sprites - 1) edges. For
+scenes of at least blocked_min_sprites sprites, forces that support it (see
+forces.AbstractForce.blockwise) are instead applied block by block by a
+blocked_forces.AllPairsGroup, on a thread pool of num_threads threads, without
+listing the edges. The thread pool is stopped by SimulationPlan.close(), which
+physics_environment.PhysicsEnvironment.close() calls.
+
+Forces whose class does not implement apply_force_to_edges() are still
+supported, and are applied pair by pair with apply_force(). Since each pair then
+sees the velocities updated by the previous pairs, all edges of a graph
+containing such a force are applied pair by pair, in the row-major order of the
+graph, across forces.
+
+Dynamic graph generators (with a refresh_interval, see graph_generators.py) have
+their edges updated every refresh_interval physics steps during the episode,
+after which the edge groups of the generator are rebuilt. Each refresh is
+recorded in EpisodePlan.refresh_log, with its cost.
+
+All scratch arrays of the vectorized forces (a forces.EdgeWorkspace per edge
+group) and of integration are allocated when the plan is bound, so physics
+steps only run in-place array operations. With debug_allocations=True, each
+physics step is traced with tracemalloc and the peak number of bytes it
+allocated is logged in EpisodePlan.allocation_log. In steady state this is a
+small constant from Python interpreter objects, independent of the number of
+sprites and edges, except in steps where shell collisions occur.
+"""
+
+# pylint: disable=import-error
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import collections
+import multiprocessing
+import time
+from multiprocessing import pool as pool_lib
+import numpy as np
+from spriteworld_physics import blocked_forces
+from spriteworld_physics import forces as forces_lib
+from spriteworld_physics import free_motion
+
+# Bounds of the frame, as numpy scalars that ufuncs convert faster than Python
+# numbers.
+_FRAME_LOW = np.float64(0.)
+_FRAME_HIGH = np.float64(1.)
+
+# Number of sprites from which forces between all pairs of sprites are applied
+# block by block. Below it, the edge lists are small enough that the vectorized
+# kernels of forces.AbstractForce.apply_force_to_edges() are faster.
+DEFAULT_BLOCKED_MIN_SPRITES = 256
+
+
+def compile_config(config):
+    """Compile the simulation plan of an environment config.
+
+    Args:
+        config: Dictionary defining task/environment configuration, as
+            returned by the get_config() functions in configs/.
+
+    Returns:
+        SimulationPlan.
+    """
+    return SimulationPlan(
+        graph_generators=config['graph_generators'],
+        bounce_off_walls=config.get('bounce_off_walls', True),
+        physics_steps_per_env_step=config.get('physics_steps_per_env_step', 1),
+        debug_allocations=config.get('debug_allocations', False),
+        num_threads=config.get('num_threads'),
+        blocked_min_sprites=config.get('blocked_min_sprites',
+                                       DEFAULT_BLOCKED_MIN_SPRITES))
+
+
+# Record of a refresh of the edges of a dynamic graph generator: the physics
+# step (counted from the start of the episode) before which it happened, the
+# index of the graph generator, the number of sprites whose edges were
+# recomputed, the number of edges added or removed, the number of edges after
+# the refresh, and the time it took in seconds, including rebuilding the edge
+# groups.
+GraphRefresh = collections.namedtuple(
+    'GraphRefresh', ['physics_step', 'graph_generator', 'num_moved',
+                     'num_patched_edges', 'num_edges', 'seconds'])
+
+
+def _allocated_bytes(fn):
+    """Call fn and return the peak number of bytes it allocated."""
+    import tracemalloc  # pylint: disable=g-import-not-at-top
+    if hasattr(tracemalloc, 'reset_peak'):
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+        tracemalloc.reset_peak()
+    else:
+        # Before Python 3.9, the peak is only reset by restarting tracing.
+        tracemalloc.stop()
+        tracemalloc.start()
+    start = tracemalloc.get_traced_memory()[0]
+    fn()
+    return tracemalloc.get_traced_memory()[1] - start
+
+
+def _check_symmetric_edges(force_class, senders, receivers, num_sprites):
+    """Raise ValueError if a symmetric force acts twice on a sprite pair."""
+    pair_ids = (np.minimum(senders, receivers) * num_sprites +
+                np.maximum(senders, receivers))
+    if len(np.unique(pair_ids)) < len(pair_ids):
+        raise ValueError(
+            'Symmetric force {} is applied more than once to the same pair of '
+            'sprites.'.format(force_class.__name__))
+
+
+def _pairs_in_graph_order(edges):
+    """List of (force, sender, receiver) of edges, in row-major graph order.
+
+    Forces with per-edge parameters are replaced by the force of each edge, as
+    in graph_generators.EdgeList.generate_graph().
+    """
+    pairs = []
+    for force, senders, receivers in edges:
+        edge_force = getattr(force, 'edge_force', None)
+        for index, (i, j) in enumerate(zip(senders.tolist(),
+                                           receivers.tolist())):
+            pairs.append((force if edge_force is None else edge_force(index),
+                          i, j))
+    # Stable, so that repeated pairs keep the order of their edges.
+    pairs.sort(key=lambda pair: pair[1:])
+    return pairs
+
+
+class SimulationPlan(object):
+    """Static simulation plan compiled from graph generators and settings."""
+
+    def __init__(self,
+                 graph_generators,
+                 bounce_off_walls=True,
+                 physics_steps_per_env_step=1,
+                 debug_allocations=False,
+                 num_threads=None,
+                 blocked_min_sprites=DEFAULT_BLOCKED_MIN_SPRITES,
+                 block_shape=(128, 256)):
+        """Compile and validate simulation plan.
+
+        Args:
+            graph_generators: Iterable of instances of subclasses of
+                graph_generators.AbstractGraphGenerator.
+            bounce_off_walls: Bool. Whether sprites bounce elastically off the
+                frame edges.
+            physics_steps_per_env_step: Int. Number of physics steps per
+                environment step.
+            debug_allocations: Bool. Whether to log the bytes allocated by
+                each physics step, see EpisodePlan.allocation_log. This slows
+                down simulation and is meant for debugging. Requires
+                tracemalloc, i.e. Python 3.4 or later.
+            num_threads: Optional int. Number of threads applying forces block
+                by block, see blocked_forces.AllPairsGroup. Defaults to the
+                number of CPUs. The thread pool is only started by the first
+                episode that applies forces block by block.
+            blocked_min_sprites: Int. Number of sprites from which forces
+                between all pairs of sprites are applied block by block, or
+                None to never do so.
+            block_shape: Pair of ints. Number of receivers and senders per
+                block.
+
+        Raises:
+            ValueError: If physics_steps_per_env_step is not positive, or if a
+                graph generator may apply a symmetric force both on (i, j) and
+                (j, i).
+        """
+        if physics_steps_per_env_step < 1:
+            raise ValueError(
+                'physics_steps_per_env_step must be positive, but is '
+                '{}.'.format(physics_steps_per_env_step))
+
+        self._graph_generators = tuple(graph_generators)
+        self._bounce_off_walls = bounce_off_walls
+        self._physics_steps_per_env_step = physics_steps_per_env_step
+        self._delta_t = 1. / physics_steps_per_env_step
+        self._debug_allocations = debug_allocations
+        self._num_threads = num_threads or multiprocessing.cpu_count()
+        self._blocked_min_sprites = blocked_min_sprites
+        self._block_shape = tuple(block_shape)
+        self._thread_pool = None
+        # Maps the index of each position-independent graph generator to the
+        # number of sprites and the edges of its last generated graph.
+        self._edge_cache = {}
+
+        for graph_generator in self._graph_generators:
+            for force in graph_generator.forces:
+                if (force.symmetric and
+                        graph_generator.applies_both_directions(force)):
+                    raise ValueError(
+                        'Symmetric force {} cannot be used with {}, which '
+                        'applies it both on (i, j) and (j, i). Consider '
+                        'graph_generators.LowerTriangular instead.'.format(
+                            type(force).__name__,
+                            type(graph_generator).__name__))
+
+    def bind(self, sprites, sprite_state):
+        """Generate the interaction edges of an episode.
+
+        Args:
+            sprites: Sequence of sprite.Sprite instances.
+            sprite_state: sprite_state.SpriteState bound to sprites.
+
+        Returns:
+            EpisodePlan.
+        """
+        return EpisodePlan(self, sprites, sprite_state)
+
+    def generate_edges(self, index, sprites):
+        """Generate the edges of a graph generator for an episode.
+
+        The edges of position-independent graph generators (see
+        graph_generators.AbstractGraphGenerator.position_independent) are
+        reused from the previous episode if it had as many sprites.
+
+        Args:
+            index: Int. Index of the graph generator in graph_generators.
+            sprites: Sequence of sprite.Sprite instances.
+
+        Returns:
+            Edge lists, as returned by
+                graph_generators.AbstractGraphGenerator.generate_edges().
+        """
+        graph_generator = self._graph_generators[index]
+        if not graph_generator.position_independent:
+            return graph_generator.generate_edges(sprites)
+        num_sprites, edges = self._edge_cache.get(index, (None, None))
+        if num_sprites != len(sprites):
+            edges = graph_generator.generate_edges(sprites)
+            self._edge_cache[index] = (len(sprites), edges)
+        return edges
+
+    @property
+    def graph_generators(self):
+        return self._graph_generators
+
+    @property
+    def bounce_off_walls(self):
+        return self._bounce_off_walls
+
+    @property
+    def physics_steps_per_env_step(self):
+        return self._physics_steps_per_env_step
+
+    @property
+    def delta_t(self):
+        return self._delta_t
+
+    @property
+    def debug_allocations(self):
+        return self._debug_allocations
+
+    @property
+    def num_threads(self):
+        return self._num_threads
+
+    @property
+    def blocked_min_sprites(self):
+        return self._blocked_min_sprites
+
+    @property
+    def block_shape(self):
+        return self._block_shape
+
+    @property
+    def thread_pool(self):
+        """ThreadPool applying blocked forces, or None if single-threaded."""
+        if self._num_threads > 1 and self._thread_pool is None:
+            self._thread_pool = pool_lib.ThreadPool(self._num_threads)
+        return self._thread_pool
+
+    def close(self):
+        """Stop the thread pool, if started. Later steps start a new one."""
+        if self._thread_pool is not None:
+            self._thread_pool.close()
+            self._thread_pool.join()
+            self._thread_pool = None
+
+    def applies_blocked(self, force, num_sprites):
+        """Whether force is applied between all pairs block by block.
+
+        Args:
+            force: The all-pairs force of a graph generator, see
+                graph_generators.AbstractGraphGenerator.all_pairs_force().
+            num_sprites: Int. Number of sprites of the episode.
+        """
+        return (self._blocked_min_sprites is not None and
+                num_sprites >= self._blocked_min_sprites and
+                force is not None and type(force).blockwise and
+                not any(np.ndim(v) for v in force.parameters().values()))
+
+    @property
+    def is_force_free(self):
+        """Whether all graph generators are known to only apply NoForce."""
+        return all(
+            graph_generator.forces and
+            all(forces_lib.is_no_force(f) for f in graph_generator.forces)
+            for graph_generator in self._graph_generators)
+
+
+class EdgeGroup(object):
+    """Edges of one force type within one interaction graph."""
+
+    def __init__(self, force_class, senders, receivers, parameters,
+                 workspace=None):
+        """Construct edge group.
+
+        Args:
+            force_class: Subclass of forces.AbstractForce.
+            senders: Int array of shape [num_edges].
+            receivers: Int array of shape [num_edges].
+            parameters: Dictionary mapping parameter names to float arrays of
+                shape [num_edges].
+            workspace: Optional forces.EdgeWorkspace of the edges.
+        """
+        self.force_class = force_class
+        self.senders = senders
+        self.receivers = receivers
+        self.parameters = parameters
+        self.workspace = workspace
+
+    @property
+    def num_edges(self):
+        return len(self.senders)
+
+
+class EpisodePlan(object):
+    """Simulation plan bound to the sprites of an episode."""
+
+    def __init__(self, plan, sprites, sprite_state):
+        """Generate and group interaction edges.
+
+        Args:
+            plan: SimulationPlan.
+            sprites: Sequence of sprite.Sprite instances.
+            sprite_state: sprite_state.SpriteState bound to sprites.
+        """
+        self._plan = plan
+        self._sprites = sprites
+        self._positions = sprite_state.positions
+        self._velocities = sprite_state.velocities
+        self._masses = sprite_state.masses
+
+        # The positions and velocities of the sprite state are strided views
+        # of its factor array, on which numpy ufuncs and np.take() allocate a
+        # buffered copy of the operands at every call. Physics steps therefore
+        # run on contiguous copies, whose dynamic sprites are written back once
+        # at the end of the step.
+        self._work_positions = np.empty((len(sprites), 2))
+        self._work_velocities = np.empty((len(sprites), 2))
+
+        # Each element of self._steps is either an EdgeGroup, a
+        # blocked_forces.AllPairsGroup or, for forces that are not vectorized,
+        # a list of (force, sender, receiver) tuples. They are the
+        # concatenation of the steps of each graph generator, which are
+        # rebuilt when the edges of a dynamic generator are refreshed.
+        self._generator_steps = []
+        self._edge_updaters = []
+        symmetric_edges = collections.defaultdict(lambda: ([], []))
+        for index, graph_generator in enumerate(plan.graph_generators):
+            all_pairs_force = graph_generator.all_pairs_force()
+            if plan.applies_blocked(all_pairs_force, len(sprites)):
+                self._generator_steps.append([blocked_forces.AllPairsGroup(
+                    type(all_pairs_force),
+                    {k: float(v) for k, v in
+                     all_pairs_force.parameters().items()},
+                    len(sprites), block_shape=plan.block_shape)])
+                continue
+            if graph_generator.refresh_interval:
+                updater = graph_generator.edge_updater(sprites)
+                self._edge_updaters.append((index, updater))
+                edges = updater.edges
+            else:
+                edges = plan.generate_edges(index, sprites)
+            self._generator_steps.append(
+                self._build_steps(edges, symmetric_edges))
+        self._steps = [s for steps in self._generator_steps for s in steps]
+
+        for force_class, (senders, receivers) in symmetric_edges.items():
+            _check_symmetric_edges(force_class, np.concatenate(senders),
+                                   np.concatenate(receivers), len(sprites))
+
+        # Static sprites have no incoming edges, so forces are only evaluated
+        # for dynamic receivers. Integration is restricted to dynamic sprites
+        # too, through a slice when they are contiguous (e.g. all sprites but a
+        # fixed first one) and an index array otherwise.
+        self._static_mask = self._find_static_sprites()
+        dynamic = np.flatnonzero(~self._static_mask)
+        self._dynamic_index = None
+        if len(dynamic) == 0:
+            self._dynamic_slice = slice(0, 0)
+        elif dynamic[-1] - dynamic[0] + 1 == len(dynamic):
+            self._dynamic_slice = slice(dynamic[0], dynamic[-1] + 1)
+        else:
+            self._dynamic_index = dynamic
+
+        # Integration buffers, holding the dynamic sprites only.
+        num_dynamic = len(dynamic)
+        self._position_step = np.empty((num_dynamic, 2))
+        self._bounce = np.empty((num_dynamic, 2), dtype=bool)
+        self._bounce_scratch = np.empty((2, num_dynamic, 2), dtype=bool)
+        if self._dynamic_index is not None:
+            self._dynamic_positions = np.empty((num_dynamic, 2))
+            self._dynamic_velocities = np.empty((num_dynamic, 2))
+
+        # Static sprites never change during the episode, so their rows of the
+        # contiguous copies are only filled here. Each physics step then only
+        # copies the state of the dynamic sprites in and out.
+        np.copyto(self._work_positions, self._positions)
+        np.copyto(self._work_velocities, self._velocities)
+        self._allocation_log = []
+
+        # Force-free episodes are computed in closed form from their initial
+        # state and the number of physics steps taken.
+        self._is_force_free = not self._steps and not self._edge_updaters
+        self._num_physics_steps = 0
+        self._refresh_log = []
+        if self._is_force_free:
+            self._initial_positions = np.array(self._positions)
+            self._initial_velocities = np.array(self._velocities)
+
+    def _build_steps(self, edges, symmetric_edges=None):
+        """Group the edges of a graph generator into steps.
+
+        Args:
+            edges: Edge lists, as returned by
+                graph_generators.AbstractGraphGenerator.generate_edges().
+            symmetric_edges: Optional dictionary mapping symmetric force
+                classes to lists of senders and receivers, to which the edges
+                of symmetric forces are added.
+
+        Returns:
+            List of steps, see self._steps.
+        """
+        edges = [(force, senders, receivers)
+                 for force, senders, receivers in edges
+                 if not forces_lib.is_no_force(force) and len(senders)]
+        for force, senders, receivers in edges:
+            force_class = type(force)
+            if force_class.symmetric and symmetric_edges is not None:
+                symmetric_edges[force_class][0].append(senders)
+                symmetric_edges[force_class][1].append(receivers)
+        if not all(type(force).vectorized for force, _, _ in edges):
+            return [_pairs_in_graph_order(edges)]
+
+        steps = []
+        groups = collections.OrderedDict()
+        for force, senders, receivers in edges:
+            force_class = type(force)
+            parameters = {
+                k: np.broadcast_to(np.asarray(v, dtype=float), senders.shape)
+                for k, v in force.parameters().items()
+            }
+            groups.setdefault(force_class, []).append(
+                (senders, receivers, parameters))
+
+        for force_class, edge_lists in groups.items():
+            parameter_names = edge_lists[0][2].keys()
+            senders = np.concatenate([e[0] for e in edge_lists])
+            receivers = np.concatenate([e[1] for e in edge_lists])
+            steps.append(EdgeGroup(
+                force_class=force_class,
+                senders=senders,
+                receivers=receivers,
+                parameters={
+                    k: np.concatenate([e[2][k] for e in edge_lists])
+                    for k in parameter_names
+                },
+                workspace=forces_lib.EdgeWorkspace(
+                    self._work_velocities, self._masses, senders,
+                    receivers)))
+        return steps
+
+    def _find_static_sprites(self):
+        """Find the sprites that provably never move during the episode.
+
+        A sprite is static if it has zero velocity and no force can change its
+        velocity, i.e. it is not the receiver of any edge, nor the sender of an
+        edge of a symmetric force. Non-vectorized forces may update either
+        sprite of their edges, so both are treated as receivers. Every sprite
+        receives the forces of a blocked_forces.AllPairsGroup, and may receive
+        those of dynamic graph generators.
+
+        Returns:
+            Bool array of shape [num_sprites].
+        """
+        receiving = np.zeros(len(self._sprites), dtype=bool)
+        if self._edge_updaters:
+            receiving[:] = True
+        for step in self._steps:
+            if isinstance(step, EdgeGroup):
+                receiving[step.receivers] = True
+                if step.force_class.symmetric:
+                    receiving[step.senders] = True
+            elif isinstance(step, blocked_forces.AllPairsGroup):
+                receiving[:] = True
+            else:
+                for _, i, j in step:
+                    receiving[i] = True
+                    receiving[j] = True
+        return ~receiving & np.all(self._velocities == 0, axis=1)
+
+    def physics_step(self):
+        """Apply forces and update sprite positions/velocities once."""
+        if self._plan.debug_allocations:
+            self._allocation_log.append(_allocated_bytes(self._physics_step))
+        else:
+            self._physics_step()
+
+    def _physics_step(self):
+        if self._is_force_free:
+            self._advance_free_motion(1)
+            return
+
+        step_index = self._num_physics_steps
+        for index, updater in self._edge_updaters:
+            interval = self._plan.graph_generators[index].refresh_interval
+            if step_index and not step_index % interval:
+                self._refresh_edges(index, updater)
+        self._num_physics_steps += 1
+
+        delta_t = np.float64(self._plan.delta_t)
+        positions = self._work_positions
+        velocities = self._work_velocities
+        self._load_dynamic_state()
+
+        for step in self._steps:
+            if isinstance(step, EdgeGroup):
+                step.force_class.apply_force_to_edges(
+                    positions, velocities, self._masses, step.senders,
+                    step.receivers, step.parameters, force_multiplier=delta_t,
+                    workspace=step.workspace)
+            elif isinstance(step, blocked_forces.AllPairsGroup):
+                step.apply(positions, velocities, self._masses,
+                           force_multiplier=delta_t,
+                           pool=self._plan.thread_pool)
+            else:
+                # Sprites are bound to the sprite state, not the copies.
+                np.copyto(self._velocities, velocities)
+                for force, i, j in step:
+                    force.apply_force(self._sprites[i], self._sprites[j],
+                                      force_multiplier=delta_t)
+                np.copyto(velocities, self._velocities)
+
+        self._integrate(delta_t)
+        self._store_dynamic_state()
+
+    def _refresh_edges(self, index, updater):
+        """Update the edges of a dynamic graph generator and its steps."""
+        start = time.time()
+        self._generator_steps[index] = self._build_steps(updater.update())
+        self._steps = [s for steps in self._generator_steps for s in steps]
+        self._refresh_log.append(GraphRefresh(
+            physics_step=self._num_physics_steps,
+            graph_generator=index,
+            num_moved=updater.num_moved,
+            num_patched_edges=updater.num_patched_edges,
+            num_edges=updater.num_edges,
+            seconds=time.time() - start))
+
+    def _load_dynamic_state(self):
+        """Copy the state of the dynamic sprites into the contiguous copies."""
+        if self._dynamic_index is None:
+            dynamic = self._dynamic_slice
+            np.copyto(self._work_positions[dynamic], self._positions[dynamic])
+            np.copyto(self._work_velocities[dynamic],
+                      self._velocities[dynamic])
+        else:
+            dynamic = self._dynamic_index
+            self._work_positions[dynamic] = self._positions[dynamic]
+            self._work_velocities[dynamic] = self._velocities[dynamic]
+
+    def _store_dynamic_state(self):
+        """Copy the integrated dynamic sprites back into the sprite state."""
+        if self._dynamic_index is None:
+            dynamic = self._dynamic_slice
+            np.copyto(self._positions[dynamic], self._work_positions[dynamic])
+            np.copyto(self._velocities[dynamic],
+                      self._work_velocities[dynamic])
+        else:
+            # _integrate() leaves the dynamic sprites in these buffers.
+            self._positions[self._dynamic_index] = self._dynamic_positions
+            self._velocities[self._dynamic_index] = self._dynamic_velocities
+
+    def _integrate(self, delta_t):
+        """Update positions of the dynamic sprites from their velocities.
+
+        With an index of dynamic sprites, they are gathered from the contiguous
+        copies into the dynamic buffers, and integrated there.
+        """
+        if self._dynamic_index is None:
+            positions = self._work_positions[self._dynamic_slice]
+            velocities = self._work_velocities[self._dynamic_slice]
+        else:
+            # mode='clip' avoids the buffered copy of out that mode='raise'
+            # makes. The indices are always valid.
+            positions = self._dynamic_positions
+            velocities = self._dynamic_velocities
+            np.take(self._work_positions, self._dynamic_index, axis=0,
+                    out=positions, mode='clip')
+            np.take(self._work_velocities, self._dynamic_index, axis=0,
+                    out=velocities, mode='clip')
+        if self._plan.bounce_off_walls:
+            # bounce = ((positions < 0) & (velocities < 0)) |
+            #          ((positions > 1) & (velocities > 0))
+            bounce = self._bounce
+            low, high = self._bounce_scratch
+            np.less(positions, _FRAME_LOW, out=bounce)
+            np.less(velocities, _FRAME_LOW, out=low)
+            np.logical_and(bounce, low, out=bounce)
+            np.greater(positions, _FRAME_HIGH, out=low)
+            np.greater(velocities, _FRAME_LOW, out=high)
+            np.logical_and(low, high, out=low)
+            np.logical_or(bounce, low, out=bounce)
+            np.negative(velocities, out=velocities, where=bounce)
+        np.multiply(velocities, delta_t, out=self._position_step)
+        np.add(positions, self._position_step, out=positions)
+
+    def _advance_free_motion(self, num_physics_steps):
+        """Set the state of a force-free episode after more physics steps."""
+        self._num_physics_steps += num_physics_steps
+        positions, velocities = free_motion.free_motion_state(
+            self._initial_positions, self._initial_velocities,
+            self._num_physics_steps, delta_t=self._plan.delta_t,
+            bounce_off_walls=self._plan.bounce_off_walls)
+        self._positions[:] = positions
+        self._velocities[:] = velocities
+
+    def env_step(self):
+        """Run the physics steps of one environment step."""
+        if self._is_force_free:
+            self._advance_free_motion(self._plan.physics_steps_per_env_step)
+            return
+        for _ in range(self._plan.physics_steps_per_env_step):
+            self.physics_step()
+
+    def free_motion_trajectory(self, num_env_steps):
+        """Positions and velocities of a force-free episode in one call.
+
+        Args:
+            num_env_steps: Int. Number of environment steps from the current
+                state.
+
+        Returns:
+            positions: Float array [num_env_steps + 1, num_sprites, 2].
+            velocities: Float array [num_env_steps + 1, num_sprites, 2].
+
+        Raises:
+            ValueError: If forces act in this episode.
+        """
+        if not self._is_force_free:
+            raise ValueError('Forces act in this episode, so its trajectory '
+                             'has no closed form.')
+        steps_per_env_step = self._plan.physics_steps_per_env_step
+        num_physics_steps = (self._num_physics_steps + steps_per_env_step *
+                             np.arange(num_env_steps + 1))
+        return free_motion.free_motion_state(
+            self._initial_positions, self._initial_velocities,
+            num_physics_steps, delta_t=self._plan.delta_t,
+            bounce_off_walls=self._plan.bounce_off_walls)
+
+    @property
+    def is_force_free(self):
+        """Whether no force acts in this episode."""
+        return self._is_force_free
+
+    @property
+    def allocation_log(self):
+        """List of the bytes allocated by each physics step so far.
+
+        Only recorded if the plan has debug_allocations=True.
+        """
+        return self._allocation_log
+
+    @property
+    def refresh_log(self):
+        """List of GraphRefresh records of the refreshes of dynamic graphs."""
+        return self._refresh_log
+
+    @property
+    def static_mask(self):
+        """Bool array [num_sprites], True for sprites that never move."""
+        return self._static_mask
+
+    @property
+    def edge_groups(self):
+        """Tuple of the vectorized EdgeGroups, in order of application."""
+        return tuple(s for s in self._steps if isinstance(s, EdgeGroup))
+
+    @property
+    def all_pairs_groups(self):
+        """Tuple of the blocked_forces.AllPairsGroup steps, in order."""
+        return tuple(s for s in self._steps
+                     if isinstance(s, blocked_forces.AllPairsGroup))
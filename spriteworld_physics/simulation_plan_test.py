@@ -0,0 +1,61 @@
+"""Tests for simulation_plan."""
+
+# pylint: disable=import-error
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+from absl.testing import absltest
+import numpy as np
+from spriteworld_physics import forces
+from spriteworld_physics import graph_generators
+from spriteworld_physics import simulation_plan
+from spriteworld_physics import sprite
+from spriteworld_physics import sprite_state
+
+
+class _Damping(forces.AbstractForce):
+    """Force that is not vectorized, scaling down the receiver's velocity."""
+
+    def __init__(self, factor):
+        self._factor = factor
+
+    def apply_force(self, acting_sprite, receiving_sprite, force_multiplier=1.):
+        receiving_sprite.update_velocity(
+            -force_multiplier * self._factor * receiving_sprite.velocity)
+
+    def metadata(self):
+        return {'type': 'Damping', 'factor': self._factor}
+
+
+def _make_sprites():
+    return [sprite.Sprite(x=0.4, y=0.5, x_vel=0.01, y_vel=0.),
+            sprite.Sprite(x=0.5, y=0.6, x_vel=0., y_vel=-0.01),
+            sprite.Sprite(x=0.6, y=0.4, x_vel=0.02, y_vel=0.01)]
+
+
+class SimulationPlanTest(absltest.TestCase):
+
+    def testNonVectorizedForceKeepsGraphOrder(self):
+        spring = forces.Spring(spring_constant=0.1, spring_equilibrium=0.05)
+        graph_generator = graph_generators.AdjacencyMatrix(
+            {(0, 1): spring, (1, 2): _Damping(0.5), (2, 0): spring})
+
+        # Reference: every pair of the graph applied in row-major order.
+        sprites = _make_sprites()
+        for i, row in enumerate(graph_generator.generate_graph(sprites)):
+            for j, force in enumerate(row):
+                force.apply_force(sprites[i], sprites[j])
+        expected = [s.velocity for s in sprites]
+
+        sprites = _make_sprites()
+        state = sprite_state.SpriteState()
+        state.bind(sprites)
+        plan = simulation_plan.SimulationPlan([graph_generator])
+        plan.bind(sprites, state).physics_step()
+        np.testing.assert_allclose(expected, state.velocities)
+
+
+if __name__ == '__main__':
+    absltest.main()
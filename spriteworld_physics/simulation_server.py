@@ -0,0 +1,394 @@
+"""Local simulation server coalescing rollout requests from many clients.
+
+Processes that each build their own environments from configs/ (evaluators,
+data loaders, notebooks) duplicate the work of loading configs, constructing
+renderers and, often, simulating the very same episodes. A SimulationServer
+instead holds one environment per config, built on first use, and serves
+rollout requests from any number of SimulationClient instances, over a Unix
+socket or a localhost TCP port:
+'''
+server = simulation_server.SimulationServer('/tmp/spriteworld.sock')
+server.start()
+...
+with simulation_server.SimulationClient('/tmp/spriteworld.sock') as client:
+    for episode in client.rollout('spriteworld_physics.configs.collisions',
+                                  num_episodes=10, outputs=('image',)):
+        print(episode['image'].shape)
+'''
+
+Requests are queued as individual episodes, identified by config, mode, seed
+and episode index. Concurrent requests for the same episode are coalesced: it is
+simulated once, with the union of the outputs requested for it, and each
+requester is sent the outputs it asked for. A single scheduler thread
+repeatedly takes a run of queued episodes, the oldest one and other queued
+episodes of the same config up to max_run_episodes, and simulates them
+sequentially on the environment of the config, without timestep objects (see
+physics_environment.PhysicsEnvironment.rollout_episode()) and without rendering
+if no images are requested. Episodes of a run are not simulated as a batch, but
+one after the other on the same environment. Results are streamed back to the
+clients as dictionaries of numpy arrays, one message per episode.
+
+Episode e of a request with seed s is sampled with the global numpy random
+state seeded with dataset_jobs.episode_seed(s, e), so the server returns the
+same episodes as dataset_jobs.DatasetJob with the same config, seed and
+rendering settings.
+
+With a cache_dir, episodes are stored in an episode_cache.EpisodeCache, keyed by
+the resolved config (including the renderers), the episode seed and the library
+version. Requests for stored episodes, also across server restarts or by
+servers sharing the directory, are served from the memory-mapped arrays of the
+cache without simulating and rendering them again.
+"""
+
+# pylint: disable=import-error
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import collections
+from multiprocessing import connection
+import threading
+
+from absl import logging
+import numpy as np
+from spriteworld_physics import dataset_jobs
+from spriteworld_physics import episode_cache
+from spriteworld_physics import physics_environment
+
+# Names of the arrays that rollout requests may ask for.
+OUTPUT_KEYS = physics_environment.ROLLOUT_STATE_KEYS + ('image',)
+
+_CONNECTION_ERRORS = (EOFError, IOError, OSError)
+
+
+def parse_address(address):
+    """Listener address of a 'host:port' string or a Unix socket path."""
+    if isinstance(address, tuple):
+        return address
+    host, separator, port = address.rpartition(':')
+    if separator and port.isdigit():
+        return (host or 'localhost', int(port))
+    return address
+
+
+class _Client(object):
+    """Connection to a client, whose messages may be sent from any thread."""
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.closed = False
+        self._lock = threading.Lock()
+
+    def send(self, message):
+        if self.closed:
+            return
+        with self._lock:
+            try:
+                self.conn.send(message)
+            except _CONNECTION_ERRORS:
+                self.closed = True
+
+
+class SimulationServer(object):
+    """Server simulating rollout requests of SimulationClient instances."""
+
+    def __init__(self,
+                 address,
+                 authkey=None,
+                 render_size=64,
+                 anti_aliasing=5,
+                 hsv_colors=True,
+                 max_run_episodes=64,
+                 cache_dir=None,
+                 cache_max_bytes=None):
+        """Construct server.
+
+        Args:
+            address: String. Path of a Unix socket, or 'host:port' (e.g.
+                'localhost:6000') for a TCP socket.
+            authkey: Optional bytes. Key clients must authenticate with.
+            render_size: Int. Height and width of the rendered images.
+            anti_aliasing: Int. Renderer anti-aliasing factor.
+            hsv_colors: Bool. Whether the configs use HSV as color factors.
+            max_run_episodes: Int. Largest number of episodes of one config
+                simulated sequentially before the scheduler looks at the
+                queue again.
+            cache_dir: Optional string. Directory of an
+                episode_cache.EpisodeCache of the simulated episodes.
+            cache_max_bytes: Optional int. Size limit of the cache, see
+                episode_cache.EpisodeCache.
+        """
+        self._address = parse_address(address)
+        self._authkey = authkey
+        self._render_settings = dict(render_size=render_size,
+                                     anti_aliasing=anti_aliasing,
+                                     hsv_colors=hsv_colors)
+        self._max_run_episodes = max_run_episodes
+        self._cache = None
+        if cache_dir is not None:
+            self._cache = episode_cache.EpisodeCache(
+                cache_dir, max_bytes=cache_max_bytes)
+
+        # Maps (config, mode) to the environment and config digest.
+        self._environments = {}
+        # Maps episode keys (config, mode, seed, episode) to the list of
+        # ((client, request id), outputs) that requested them, in order of
+        # requests.
+        self._queue = collections.OrderedDict()
+        # Number of episodes still to be sent for each (client, request id).
+        self._remaining = {}
+        self._condition = threading.Condition()
+        self._stats = collections.Counter()
+        self._listener = None
+        self._threads = []
+        self._closed = False
+
+    def start(self):
+        """Start listening and simulating in background threads."""
+        self._listener = connection.Listener(self._address,
+                                             authkey=self._authkey)
+        self._threads = [threading.Thread(target=self._accept_loop),
+                         threading.Thread(target=self._schedule_loop)]
+        for thread in self._threads:
+            thread.daemon = True
+            thread.start()
+        logging.info('Simulation server listening on %s.', self.address)
+
+    def serve_forever(self):
+        """Start the server and block until it is closed."""
+        self.start()
+        while self._threads[1].is_alive():
+            self._threads[1].join(1.)
+
+    def close(self):
+        """Stop accepting clients and simulating."""
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+        if self._listener is not None:
+            self._listener.close()
+
+    def _accept_loop(self):
+        while not self._closed:
+            try:
+                conn = self._listener.accept()
+            except _CONNECTION_ERRORS:
+                if self._closed:
+                    return
+                logging.exception('Failed to accept a client.')
+                continue
+            thread = threading.Thread(target=self._client_loop,
+                                      args=(_Client(conn),))
+            thread.daemon = True
+            thread.start()
+
+    def _client_loop(self, client):
+        """Queue the requests of a client until it disconnects."""
+        while not self._closed:
+            try:
+                request = client.conn.recv()
+            except _CONNECTION_ERRORS:
+                break
+            try:
+                self._queue_request(client, request)
+            except (AttributeError, KeyError, TypeError, ValueError) as e:
+                request_id = (request.get('request')
+                              if isinstance(request, dict) else None)
+                client.send({'request': request_id,
+                             'error': 'Invalid request: {!r}'.format(e)})
+        client.closed = True
+        client.conn.close()
+
+    def _queue_request(self, client, request):
+        outputs = tuple(sorted(set(request['outputs'])))
+        unknown = set(outputs) - set(OUTPUT_KEYS)
+        if unknown:
+            raise ValueError('Unknown outputs {}, expected a subset of '
+                             '{}.'.format(sorted(unknown), OUTPUT_KEYS))
+        start = int(request.get('start', 0))
+        num_episodes = int(request['num_episodes'])
+        request_key = (client, request['request'])
+        if num_episodes <= 0:
+            client.send({'request': request['request'], 'done': True})
+            return
+        with self._condition:
+            self._stats['requests'] += 1
+            self._stats['episodes_requested'] += num_episodes
+            self._remaining[request_key] = num_episodes
+            for episode in range(start, start + num_episodes):
+                key = (request['config'], request.get('mode', 'train'),
+                       int(request.get('seed', 0)), episode)
+                self._queue.setdefault(key, []).append((request_key, outputs))
+            self._condition.notify()
+
+    def _next_run(self):
+        """Pop the oldest queued episode and queued episodes of its config."""
+        with self._condition:
+            while not self._queue and not self._closed:
+                self._condition.wait()
+            if self._closed:
+                return None
+            config = next(iter(self._queue))[:2]
+            keys = [k for k in self._queue if k[:2] == config]
+            keys = keys[:self._max_run_episodes]
+            return [(k, self._queue.pop(k)) for k in keys]
+
+    def _environment(self, config, mode):
+        if (config, mode) not in self._environments:
+            env_config = dataset_jobs.make_config(
+                config, mode=mode, **self._render_settings)
+            digest = (episode_cache.config_digest(env_config)
+                      if self._cache is not None else None)
+            self._environments[(config, mode)] = (
+                physics_environment.PhysicsEnvironment(**env_config), digest)
+        return self._environments[(config, mode)]
+
+    def _schedule_loop(self):
+        while True:
+            run = self._next_run()
+            if run is None:
+                for env, _ in self._environments.values():
+                    env.close()
+                return
+            self._stats['runs'] += 1
+            for key, requests in run:
+                requests = self._drop_closed(requests)
+                if not requests:
+                    continue
+                outputs = sorted(set().union(*(o for _, o in requests)))
+                try:
+                    arrays = self._simulate(*key, outputs=outputs)
+                    error = None
+                except Exception as e:  # pylint: disable=broad-except
+                    logging.exception('Failed to simulate %s.', key)
+                    error = '{}: {}'.format(type(e).__name__, e)
+                self._stats['episodes_simulated'] += 1
+                for request_key, request_outputs in requests:
+                    if error is None:
+                        message = {'arrays': {k: arrays[k]
+                                              for k in request_outputs}}
+                    else:
+                        message = {'error': error}
+                    self._send(key[3], message, request_key)
+
+    def _simulate(self, config, mode, seed, episode, outputs):
+        """Run an episode, returning the dictionary of its outputs."""
+        env, digest = self._environment(config, mode)
+        seed = dataset_jobs.episode_seed(seed, episode)
+        np.random.seed(seed)
+        if self._cache is not None:
+            return self._cache.rollout_episode(
+                env, episode_cache.episode_key(digest, seed), outputs)
+        observation_keys = ('image',) if 'image' in outputs else ()
+        arrays = env.rollout_episode(observation_keys=observation_keys)
+        return {k: arrays[k] for k in outputs}
+
+    def _drop_closed(self, requests):
+        """Requests of connected clients, forgetting the others."""
+        with self._condition:
+            for request_key, _ in requests:
+                if request_key[0].closed:
+                    self._remaining.pop(request_key, None)
+        return [r for r in requests if not r[0][0].closed]
+
+    def _send(self, episode, message, request_key):
+        """Send the message of an episode to a request waiting for it."""
+        client, request = request_key
+        client.send(dict(message, request=request, episode=episode))
+        with self._condition:
+            self._remaining[request_key] -= 1
+            done = not self._remaining[request_key]
+            if done:
+                del self._remaining[request_key]
+        if done:
+            client.send({'request': request, 'done': True})
+
+    @property
+    def address(self):
+        if self._listener is not None:
+            return self._listener.address
+        return self._address
+
+    @property
+    def stats(self):
+        """Counts of requests, episodes requested and simulated, and runs.
+
+        With a cache, also holds its stats, with keys prefixed by 'cache_'.
+        """
+        with self._condition:
+            stats = dict(self._stats)
+        if self._cache is not None:
+            stats.update(('cache_' + k, v)
+                         for k, v in self._cache.stats.items())
+        return stats
+
+
+class SimulationClient(object):
+    """Client of a SimulationServer."""
+
+    def __init__(self, address, authkey=None):
+        """Connect to a server.
+
+        Args:
+            address: Address of the server, see SimulationServer.
+            authkey: Optional bytes. Authentication key of the server.
+        """
+        self._conn = connection.Client(parse_address(address), authkey=authkey)
+        self._next_request = 0
+
+    def rollout(self, config, num_episodes=1, seed=0, start=0,
+                outputs=('factors',), mode='train'):
+        """Generator of episodes simulated by the server.
+
+        Args:
+            config: String. Module name of the task config to use.
+            num_episodes: Int. Number of episodes.
+            seed: Int. Seed from which episode seeds are derived.
+            start: Int. Index of the first episode, see module docstring.
+            outputs: Iterable of OUTPUT_KEYS to return.
+            mode: String. Mode fed to the config's get_config().
+
+        Yields:
+            Dictionaries mapping outputs to arrays, as returned by
+                PhysicsEnvironment.rollout_episode(), in episode order.
+
+        Raises:
+            RuntimeError: If the server fails to simulate an episode.
+        """
+        request = self._next_request
+        self._next_request += 1
+        self._conn.send({
+            'request': request,
+            'config': config,
+            'mode': mode,
+            'seed': seed,
+            'start': start,
+            'num_episodes': num_episodes,
+            'outputs': list(outputs),
+        })
+
+        received = {}
+        next_episode = start
+        while True:
+            message = self._conn.recv()
+            # Messages of requests whose generator was not exhausted.
+            if message.get('request') != request:
+                continue
+            if 'error' in message:
+                raise RuntimeError(message['error'])
+            if message.get('done'):
+                return
+            received[message['episode']] = message['arrays']
+            while next_episode in received:
+                yield received.pop(next_episode)
+                next_episode += 1
+
+    def close(self):
+        self._conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *unused_args):
+        self.close()
@@ -0,0 +1,75 @@
+"""Tests for simulation_server."""
+
+# pylint: disable=import-error,protected-access
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import os
+import shutil
+import tempfile
+import threading
+
+from absl.testing import absltest
+import numpy as np
+from spriteworld_physics import simulation_server
+
+_SPRINGS = 'spriteworld_physics.configs.springs'
+
+
+class _RecordingConnection(object):
+    """Connection recording the messages sent to a client."""
+
+    def __init__(self):
+        self.messages = []
+        self.done = threading.Event()
+
+    def send(self, message):
+        self.messages.append(message)
+        if message.get('done'):
+            self.done.set()
+
+    def close(self):
+        pass
+
+
+class SimulationServerTest(absltest.TestCase):
+
+    def testRequestsWithDifferentOutputsShareSimulations(self):
+        tempdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tempdir)
+        server = simulation_server.SimulationServer(
+            os.path.join(tempdir, 'server.sock'), render_size=16)
+        requests = [('factors',), ('factors', 'image'), ('positions',)]
+        connections = []
+        # Queued before the scheduler starts, so that all requests are
+        # pending together.
+        for request, outputs in enumerate(requests):
+            connections.append(_RecordingConnection())
+            server._queue_request(
+                simulation_server._Client(connections[-1]),
+                {'request': request, 'config': _SPRINGS, 'num_episodes': 2,
+                 'outputs': list(outputs)})
+        server.start()
+        try:
+            for conn in connections:
+                self.assertTrue(conn.done.wait(60.))
+        finally:
+            server.close()
+
+        self.assertEqual(2, server.stats['episodes_simulated'])
+        episodes = []
+        for conn, outputs in zip(connections, requests):
+            arrays = [m['arrays'] for m in conn.messages if 'arrays' in m]
+            self.assertLen(arrays, 2)
+            for episode in arrays:
+                self.assertCountEqual(outputs, episode.keys())
+            episodes.append(arrays)
+        for episode in range(2):
+            np.testing.assert_array_equal(episodes[0][episode]['factors'],
+                                          episodes[1][episode]['factors'])
+
+
+if __name__ == '__main__':
+    absltest.main()
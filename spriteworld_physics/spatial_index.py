@@ -0,0 +1,280 @@
+"""Uniform grid index of sprite positions for neighbor queries.
+
+A GridIndex buckets points into square cells of a given size. Points within
+distance cell_size of a point lie in its cell or in one of the 8 surrounding
+cells, so finding all pairs of points within that distance takes time linear in
+the number of points and pairs, rather than quadratic in the number of points.
+Cells are identified by sorted integer keys rather than a dense array, so
+sparse or spread out points need no memory for empty cells.
+
+Points can be moved with GridIndex.update(), which only recomputes the cells of
+the moved points and re-sorts the nearly sorted cell keys, so indexes of
+dynamic graphs (see graph_generators.RadiusGraph and
+graph_generators.NearestNeighbors) are maintained incrementally over an
+episode. Radii larger than the cell size search correspondingly more cells, so
+nearest neighbor queries, whose radius grows until enough neighbors are found,
+reuse the same index.
+
+All queries are vectorized over points. They are used by the local graph
+generators of graph_generators.py, e.g. graph_generators.RadiusGraph.
+"""
+
+# pylint: disable=import-error
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import numpy as np
+
+# Cell keys are x * _KEY_STRIDE + y, where the cell coordinates x and y are
+# offset by _CELL_OFFSET to be non-negative for points that move anywhere near
+# the indexed region.
+_KEY_STRIDE = np.int64(1 << 32)
+_CELL_OFFSET = 1 << 30
+
+
+def _expand_ranges(starts, counts):
+    """Concatenation of the ranges [start, start + count) of all pairs."""
+    ends = np.cumsum(counts)
+    offsets = np.arange(ends[-1] if len(ends) else 0) - np.repeat(
+        ends - counts, counts)
+    return np.repeat(starts, counts) + offsets
+
+
+def _sort_pairs(first, second, *others):
+    """Sort index pairs by first, then by second, along with other arrays."""
+    order = np.lexsort((second, first))
+    return tuple(a[order] for a in (first, second) + others)
+
+
+class GridIndex(object):
+    """Points bucketed into a uniform grid of square cells."""
+
+    def __init__(self, positions, cell_size):
+        """Build index.
+
+        Args:
+            positions: Float array [num_points, 2].
+            cell_size: Positive float. Side length of the cells, and default
+                radius of neighbors().
+
+        Raises:
+            ValueError: If cell_size is not positive.
+        """
+        if not cell_size > 0:
+            raise ValueError(
+                'cell_size must be positive, but is {}.'.format(cell_size))
+        self._positions = np.array(positions, dtype=float).reshape(-1, 2)
+        self._cell_size = float(cell_size)
+        if len(self._positions):
+            self._origin = self._positions.min(axis=0)
+        else:
+            self._origin = np.zeros(2)
+
+        self._keys = self._cell_keys_of(self._positions)
+        self._order = np.argsort(self._keys, kind='stable')
+        self._bucket()
+
+    def _cell_keys_of(self, positions):
+        cells = np.floor(
+            (positions - self._origin) / self._cell_size).astype(np.int64)
+        cells += _CELL_OFFSET
+        return cells[:, 0] * _KEY_STRIDE + cells[:, 1]
+
+    def _bucket(self):
+        """Find the cells and their ranges in self._order."""
+        sorted_keys = self._keys[self._order]
+        self._cell_starts = np.flatnonzero(np.concatenate(
+            [[True], sorted_keys[1:] != sorted_keys[:-1]]))[:len(sorted_keys)]
+        self._cell_keys = sorted_keys[self._cell_starts]
+        self._cell_counts = np.diff(
+            np.append(self._cell_starts, len(sorted_keys)))
+
+    def update(self, indices, positions):
+        """Move some of the indexed points.
+
+        Args:
+            indices: Int array [num_moved]. Indices of the moved points.
+            positions: Float array [num_moved, 2]. Their new positions.
+
+        Returns:
+            Int. Number of points that changed cells.
+        """
+        indices = np.asarray(indices, dtype=np.int64)
+        self._positions[indices] = positions
+        keys = self._cell_keys_of(self._positions[indices])
+        num_changed = np.count_nonzero(keys != self._keys[indices])
+        if num_changed:
+            self._keys[indices] = keys
+            # Few keys changed, so the keys in the previous order are nearly
+            # sorted, which the stable sort (timsort) handles in linear time.
+            self._order = self._order[
+                np.argsort(self._keys[self._order], kind='stable')]
+            self._bucket()
+        return num_changed
+
+    def neighbors(self, radius=None, queries=None):
+        """Pairs of distinct indexed points within radius of each other.
+
+        Args:
+            radius: Optional float. Defaults to cell_size. Larger radii search
+                the 2 * ceil(radius / cell_size) + 1 columns of cells around
+                each query.
+            queries: Optional int array. Indices of the points whose neighbors
+                are returned. Defaults to all points.
+
+        Returns:
+            query_indices: Int array [num_pairs].
+            neighbor_indices: Int array [num_pairs], never equal to the
+                corresponding element of query_indices.
+            dist: Float array [num_pairs]. Distances between the points.
+            The pairs are sorted by query index, then neighbor index.
+        """
+        if radius is None:
+            radius = self._cell_size
+        num_cells = max(1, int(np.ceil(radius / self._cell_size)))
+        if queries is None:
+            queries = np.arange(len(self._positions))
+        queries = np.asarray(queries, dtype=np.int64)
+        query_keys = self._keys[queries]
+        if not len(self._cell_keys):
+            empty = np.zeros(0, dtype=np.int64)
+            return empty, empty, np.zeros(0)
+
+        # The cells of a column of cells, i.e. with the same x coordinate and
+        # consecutive y coordinates, are consecutive in self._cell_keys, so
+        # the occupied cells of each column around a query are found with two
+        # binary searches.
+        query_indices = []
+        neighbor_indices = []
+        for dx in range(-num_cells, num_cells + 1):
+            keys = query_keys + dx * _KEY_STRIDE
+            first_cells = np.searchsorted(self._cell_keys, keys - num_cells)
+            num_column_cells = np.searchsorted(
+                self._cell_keys, keys + num_cells, side='right') - first_cells
+            cells = _expand_ranges(first_cells, num_column_cells)
+            counts = self._cell_counts[cells]
+            query_indices.append(np.repeat(
+                np.repeat(queries, num_column_cells), counts))
+            neighbor_indices.append(self._order[_expand_ranges(
+                self._cell_starts[cells], counts)])
+        query_indices = np.concatenate(query_indices)
+        neighbor_indices = np.concatenate(neighbor_indices)
+
+        diff = (self._positions[query_indices] -
+                self._positions[neighbor_indices])
+        dist = np.sqrt(np.einsum('ij,ij->i', diff, diff))
+        keep = (dist <= radius) & (query_indices != neighbor_indices)
+        return _sort_pairs(
+            query_indices[keep], neighbor_indices[keep], dist[keep])
+
+    def nearest_neighbors(self, k, queries=None):
+        """The k nearest other indexed points of each query point.
+
+        Neighbors are found within a radius, starting at cell_size, that is
+        doubled for the queries with fewer than k neighbors within it. Ties
+        are broken by index.
+
+        Args:
+            k: Int. Number of neighbors of each point. Points have all others
+                as neighbors if there are no more than k of them.
+            queries: Optional int array. Indices of the points whose neighbors
+                are returned. Defaults to all points.
+
+        Returns:
+            query_indices, neighbor_indices, dist, as neighbors(), with
+                min(k, num_points - 1) neighbors for each query.
+        """
+        num_points = len(self._positions)
+        k = min(k, num_points - 1)
+        if k <= 0 or (queries is not None and not len(queries)):
+            empty = np.zeros(0, dtype=np.int64)
+            return empty, empty, np.zeros(0)
+
+        radius = self._cell_size
+        results = []
+        if queries is None:
+            remaining = np.arange(num_points)
+        else:
+            remaining = np.unique(np.asarray(queries, dtype=np.int64))
+        while len(remaining):
+            query_indices, neighbor_indices, dist = self.neighbors(
+                radius=radius, queries=remaining)
+            counts = np.bincount(query_indices, minlength=num_points)[remaining]
+            done = remaining[counts >= k]
+            in_done = np.isin(query_indices, done)
+            query_indices = query_indices[in_done]
+            neighbor_indices = neighbor_indices[in_done]
+            dist = dist[in_done]
+
+            # Keep the k nearest neighbors of each query, by distance then
+            # index.
+            order = np.lexsort((neighbor_indices, dist, query_indices))
+            query_indices = query_indices[order]
+            starts = np.searchsorted(query_indices, done)
+            keep = _expand_ranges(starts, np.full(len(done), k))
+            results.append((query_indices[keep],
+                            neighbor_indices[order][keep],
+                            dist[order][keep]))
+
+            remaining = remaining[counts < k]
+            radius *= 2.
+
+        return _sort_pairs(*[np.concatenate(r) for r in zip(*results)])
+
+    @property
+    def positions(self):
+        return self._positions
+
+    @property
+    def cell_size(self):
+        return self._cell_size
+
+
+def radius_neighbors(positions, radius):
+    """All ordered pairs of distinct points within radius of each other.
+
+    Args:
+        positions: Float array [num_points, 2].
+        radius: Positive float.
+
+    Returns:
+        query_indices, neighbor_indices, dist, as GridIndex.neighbors().
+    """
+    return GridIndex(positions, radius).neighbors(radius)
+
+
+def nearest_neighbor_cell_size(positions, k):
+    """Cell size of an index for the k nearest neighbors of positions.
+
+    This is the radius holding about 2 * k points if the points are spread
+    uniformly over their bounding box.
+    """
+    positions = np.asarray(positions, dtype=float).reshape(-1, 2)
+    if not len(positions):
+        return 1.
+    extent = positions.max(axis=0) - positions.min(axis=0)
+    radius = np.sqrt(2. * k * max(extent.prod(), 1e-12) /
+                     (np.pi * len(positions)))
+    return max(float(radius), 1e-9)
+
+
+def nearest_neighbors(positions, k, queries=None):
+    """The k nearest other points of each point.
+
+    See GridIndex.nearest_neighbors(). With the cell size of
+    nearest_neighbor_cell_size(), this takes time O(num_points * k) for evenly
+    spread points.
+
+    Args:
+        positions: Float array [num_points, 2].
+        k: Int. Number of neighbors of each point.
+        queries: Optional int array. Indices of the points whose neighbors
+            are returned. Defaults to all points.
+
+    Returns:
+        query_indices, neighbor_indices, dist, as GridIndex.neighbors().
+    """
+    index = GridIndex(positions, nearest_neighbor_cell_size(positions, k))
+    return index.nearest_neighbors(k, queries=queries)
@@ -0,0 +1,100 @@
+"""Tests for spatial_index."""
+
+# pylint: disable=import-error
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+from absl.testing import absltest
+import numpy as np
+from spriteworld_physics import forces
+from spriteworld_physics import graph_generators
+from spriteworld_physics import spatial_index
+from spriteworld_physics import sprite
+
+
+def _brute_force_neighbors(positions, radius):
+    diff = positions[:, np.newaxis] - positions[np.newaxis]
+    dist = np.sqrt(np.sum(diff ** 2, axis=-1))
+    np.fill_diagonal(dist, np.inf)
+    queries, neighbors = np.nonzero(dist <= radius)
+    return queries, neighbors, dist[queries, neighbors]
+
+
+def _brute_force_nearest_neighbors(positions, k):
+    diff = positions[:, np.newaxis] - positions[np.newaxis]
+    dist = np.sqrt(np.sum(diff ** 2, axis=-1))
+    np.fill_diagonal(dist, np.inf)
+    neighbors = np.stack([np.lexsort((np.arange(len(d)), d))[:k]
+                          for d in dist])
+    queries = np.repeat(np.arange(len(positions)), k)
+    return queries, neighbors.ravel()
+
+
+class GridIndexTest(absltest.TestCase):
+
+    def setUp(self):
+        super(GridIndexTest, self).setUp()
+        rng = np.random.RandomState(0)
+        self._positions = rng.uniform(0., 1., (200, 2))
+        # A few sparse points far from the others.
+        self._positions[:5] = rng.uniform(0., 4., (5, 2))
+
+    def testNeighborsWithinCellSize(self):
+        index = spatial_index.GridIndex(self._positions, 0.1)
+        expected = _brute_force_neighbors(self._positions, 0.07)
+        for actual, wanted in zip(index.neighbors(radius=0.07), expected):
+            np.testing.assert_allclose(actual, wanted)
+
+    def testNeighborsBeyondCellSize(self):
+        index = spatial_index.GridIndex(self._positions, 0.03)
+        expected = _brute_force_neighbors(self._positions, 0.25)
+        for actual, wanted in zip(index.neighbors(radius=0.25), expected):
+            np.testing.assert_allclose(actual, wanted)
+
+    def testNeighborsAfterUpdate(self):
+        index = spatial_index.GridIndex(self._positions, 0.1)
+        positions = self._positions.copy()
+        moved = np.arange(0, 200, 7)
+        positions[moved] += 0.2
+        index.update(moved, positions[moved])
+        expected = _brute_force_neighbors(positions, 0.1)
+        for actual, wanted in zip(index.neighbors(), expected):
+            np.testing.assert_allclose(actual, wanted)
+
+    def testNearestNeighbors(self):
+        queries, neighbors, _ = spatial_index.nearest_neighbors(
+            self._positions, 4)
+        expected_queries, expected_neighbors = _brute_force_nearest_neighbors(
+            self._positions, 4)
+        self.assertEqual(
+            sorted(zip(queries.tolist(), neighbors.tolist())),
+            sorted(zip(expected_queries.tolist(), expected_neighbors.tolist())))
+
+
+class NearestNeighborEdgeUpdaterTest(absltest.TestCase):
+
+    def testUpdatedEdgesMatchRegeneratedEdges(self):
+        rng = np.random.RandomState(0)
+        positions = rng.uniform(0.1, 0.9, (100, 2))
+        sprites = [sprite.Sprite(x=x, y=y) for x, y in positions]
+        generator = graph_generators.NearestNeighbors(
+            forces.Spring(0.1, 0.1), num_neighbors=3, refresh_interval=1)
+        updater = generator.edge_updater(sprites)
+        velocities = rng.normal(0., 0.02, (100, 2))
+        velocities[rng.rand(100) < 0.5] = 0.
+        for _ in range(10):
+            for s, velocity in zip(sprites, velocities):
+                s.move(velocity)
+            (_, senders, receivers), = updater.update()
+            (_, expected_senders, expected_receivers), = (
+                generator.generate_edges(sprites))
+            self.assertEqual(
+                sorted(zip(senders.tolist(), receivers.tolist())),
+                sorted(zip(expected_senders.tolist(),
+                           expected_receivers.tolist())))
+
+
+if __name__ == '__main__':
+    absltest.main()
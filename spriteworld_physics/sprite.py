@@ -1,4 +1,11 @@
-"""Sprite object for Spriteworld with physics."""
+"""Sprite object for Spriteworld with physics.
+
+Sprite has the interface of spriteworld.sprite.Sprite, which renderers and
+tasks rely on, but does not inherit from it: spriteworld.sprite imports
+matplotlib to transform shape vertices, whereas here vertices are transformed
+with numpy and matplotlib is only imported by contains_point(). This keeps the
+simulation core importable without matplotlib.
+"""
 
 # pylint: disable=import-error
 
@@ -7,7 +14,7 @@ from __future__ import division
 from __future__ import print_function
 
 import collections
-from spriteworld import sprite
+from spriteworld import constants
 import numpy as np
 
 FACTOR_NAMES = (
@@ -24,8 +31,11 @@ FACTOR_NAMES = (
     'mass',  # mass (float)
 )
 
+# Maximum number of samples in Sprite.sample_contained_position().
+_MAX_TRIES = int(1e6)
+
 
-class Sprite(sprite.Sprite):
+class Sprite(object):
     """Sprite class.
 
     Sprites are simple shapes parameterized by a few factors (position, shape,
@@ -63,19 +73,65 @@ class Sprite(sprite.Sprite):
             y_vel: Float. y-velocity.
             mass: Float. Mass.
         """
-        super(Sprite, self).__init__(x=x,
-                                     y=y,
-                                     shape=shape,
-                                     angle=angle,
-                                     scale=scale,
-                                     c0=c0,
-                                     c1=c1,
-                                     c2=c2,
-                                     x_vel=x_vel,
-                                     y_vel=y_vel)
+        self._position = np.array([x, y])
+        self._shape = shape
+        self._angle = angle
+        self._scale = scale
+        self._color = (c0, c1, c2)
         self._velocity = np.array([x_vel, y_vel])
         self._mass = mass
 
+        self._reset_centered_vertices()
+
+    def _reset_centered_vertices(self):
+        """Scale and rotate the vertices of the shape, centered at 0."""
+        radians = np.deg2rad(self._angle)
+        cos, sin = np.cos(radians), np.sin(radians)
+        scale_rotate = np.array([[cos, -sin], [sin, cos]]) * self._scale
+        self._centered_vertices = np.dot(
+            np.asarray(constants.SHAPES[self._shape]), scale_rotate.T)
+
+    def bind_state(self, position, velocity):
+        """Store position and velocity in externally owned arrays.
+
+        The current position and velocity are copied into the given arrays,
+        which are then updated in place as the sprite moves. This is used by
+        sprite_state.SpriteState to keep the factors of all sprites in a single
+        array.
+
+        Args:
+            position: Float array of shape [2].
+            velocity: Float array of shape [2].
+        """
+        position[:] = self._position
+        velocity[:] = self._velocity
+        self._position = position
+        self._velocity = velocity
+
+    def set_factors(self, shape, angle, scale, color, mass):
+        """Set the factors other than position and velocity.
+
+        Used by sprite_state.SpriteState to reuse sprites across scenes. The
+        vertices are only recomputed if the shape, angle or scale changed.
+        """
+        if (shape, angle, scale) != (self._shape, self._angle, self._scale):
+            self._shape = shape
+            self._angle = angle
+            self._scale = scale
+            self._reset_centered_vertices()
+        self._color = color
+        self._mass = mass
+
+    def move(self, motion, keep_in_frame=False):
+        """Move the sprite, optionally keeping its centerpoint in the frame.
+
+        Unlike spriteworld.sprite.Sprite.move(), this updates the position in
+        place so that it stays bound to any array given to bind_state().
+        """
+        self._position += motion
+        if keep_in_frame:
+            np.clip(self._position, 0.0, 1.0, out=self._position)
+
     def update_position(self, bounce_off_walls=False, delta_t=1.):
         """Bounce off walls if out of frame.
 
@@ -98,6 +154,100 @@ class Sprite(sprite.Sprite):
     def update_velocity(self, delta_velocity):
         self._velocity += delta_velocity
 
+    def contains_point(self, point):
+        """Check if the point is contained in the Sprite."""
+        from matplotlib import path as mpl_path  # pylint: disable=g-import-not-at-top
+        centered_path = mpl_path.Path(self._centered_vertices)
+        return centered_path.contains_point(point - self.position)
+
+    def sample_contained_position(self):
+        """Sample random position uniformly within sprite."""
+        low = np.min(self._centered_vertices, axis=0)
+        high = np.max(self._centered_vertices, axis=0)
+        for _ in range(_MAX_TRIES):
+            sample = self._position + np.random.uniform(low, high)
+            if self.contains_point(sample):
+                return sample
+        raise ValueError('max_tries exceeded. There is almost surely an error '
+                         'in the Spriteworld library code.')
+
+    @property
+    def vertices(self):
+        """Numpy array of vertices of the shape."""
+        return self._centered_vertices + self._position
+
+    @property
+    def out_of_frame(self):
+        return not (np.all(self._position >= [0., 0.]) and
+                    np.all(self._position <= [1., 1.]))
+
+    @property
+    def x(self):
+        return self._position[0]
+
+    @property
+    def y(self):
+        return self._position[1]
+
+    @property
+    def shape(self):
+        return self._shape
+
+    @shape.setter
+    def shape(self, s):
+        self._shape = s
+        self._reset_centered_vertices()
+
+    @property
+    def angle(self):
+        return self._angle
+
+    @angle.setter
+    def angle(self, a):
+        self._angle = a
+        self._reset_centered_vertices()
+
+    @property
+    def scale(self):
+        return self._scale
+
+    @scale.setter
+    def scale(self, s):
+        self._scale = s
+        self._reset_centered_vertices()
+
+    @property
+    def c0(self):
+        return self._color[0]
+
+    @property
+    def c1(self):
+        return self._color[1]
+
+    @property
+    def c2(self):
+        return self._color[2]
+
+    @property
+    def x_vel(self):
+        return self._velocity[0]
+
+    @property
+    def y_vel(self):
+        return self._velocity[1]
+
+    @property
+    def color(self):
+        return self._color
+
+    @property
+    def position(self):
+        return self._position
+
+    @property
+    def velocity(self):
+        return self._velocity
+
     @property
     def mass(self):
         return self._mass
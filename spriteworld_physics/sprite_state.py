@@ -0,0 +1,196 @@
+"""Contiguous array storage for the factors of the sprites in a scene.
+
+A SpriteState holds the factors of every sprite in an episode in a single
+preallocated float array of shape [num_sprites, len(sprite.FACTOR_NAMES)], with
+columns ordered as sprite.FACTOR_NAMES. Sprites bound to a SpriteState keep
+their position and velocity as views into the rows of this array, so moving a
+sprite updates the array in place and the array can be read out without
+visiting the sprites.
+
+The shape factor is stored with the categorical encoding of
+spriteworld.constants.ShapeType, which is the same encoding used by
+spriteworld.renderers.SpriteFactors.
+"""
+
+# pylint: disable=import-error
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+from spriteworld import constants
+from spriteworld_physics import sprite as sprite_lib
+import numpy as np
+
+NUM_FACTORS = len(sprite_lib.FACTOR_NAMES)
+FACTOR_INDEX = {name: i for i, name in enumerate(sprite_lib.FACTOR_NAMES)}
+
+# Column slices of the factor array. x and y are adjacent, as are x_vel and
+# y_vel, so positions and velocities are [num_sprites, 2] views.
+POSITION_SLICE = slice(FACTOR_INDEX['x'], FACTOR_INDEX['y'] + 1)
+VELOCITY_SLICE = slice(FACTOR_INDEX['x_vel'], FACTOR_INDEX['y_vel'] + 1)
+MASS_INDEX = FACTOR_INDEX['mass']
+SHAPE_INDEX = FACTOR_INDEX['shape']
+ANGLE_INDEX = FACTOR_INDEX['angle']
+SCALE_INDEX = FACTOR_INDEX['scale']
+COLOR_SLICE = slice(FACTOR_INDEX['c0'], FACTOR_INDEX['c2'] + 1)
+
+
+def shape_code(shape):
+    """Categorical code of a shape name, from constants.ShapeType."""
+    return float(constants.ShapeType[shape].value)
+
+
+def shape_name(code):
+    """Shape name of a categorical code, inverse of shape_code()."""
+    return constants.ShapeType(int(code)).name
+
+
+def write_factors(sprite, out):
+    """Write the factors of a sprite into a row of length NUM_FACTORS."""
+    for i, factor_name in enumerate(sprite_lib.FACTOR_NAMES):
+        if i == SHAPE_INDEX:
+            out[i] = shape_code(sprite.shape)
+        else:
+            out[i] = getattr(sprite, factor_name)
+
+
+def sprites_from_factors(factors):
+    """Construct sprites from a factor array, inverse of write_factors().
+
+    Args:
+        factors: Float array of shape [num_sprites, NUM_FACTORS].
+
+    Returns:
+        List of sprite.Sprite instances.
+    """
+    sprites = []
+    for row in factors:
+        kwargs = dict(zip(sprite_lib.FACTOR_NAMES, row.tolist()))
+        kwargs['shape'] = shape_name(row[SHAPE_INDEX])
+        sprites.append(sprite_lib.Sprite(**kwargs))
+    return sprites
+
+
+class SpriteState(object):
+    """Preallocated factor array shared with the sprites of an episode."""
+
+    def __init__(self, capacity=0):
+        """Construct sprite state.
+
+        Args:
+            capacity: Int. Number of sprite rows to preallocate. The buffer is
+                grown when a larger scene is bound.
+        """
+        self._buffer = np.zeros((capacity, NUM_FACTORS))
+        self._num_sprites = 0
+        self._sprites = ()
+        # Sprites constructed by bind_factors(), bound to the first rows of
+        # the buffer and reused by later calls.
+        self._bound_sprites = []
+
+    def bind(self, sprites):
+        """Copy the factors of sprites into the array and bind sprites to it.
+
+        After this call, each sprite's position and velocity are views into
+        its row of the array. Sprites bound previously are no longer tracked.
+
+        Args:
+            sprites: Sequence of sprite.Sprite instances.
+        """
+        self._reserve(len(sprites))
+        for i, sprite in enumerate(sprites):
+            row = self._buffer[i]
+            write_factors(sprite, row)
+            sprite.bind_state(position=row[POSITION_SLICE],
+                              velocity=row[VELOCITY_SLICE])
+        self._num_sprites = len(sprites)
+        self._sprites = sprites
+
+    def bind_factors(self, factors):
+        """Copy a factor array into the state and return sprites bound to it.
+
+        Equivalent to bind(sprites_from_factors(factors)), but the factors are
+        copied as a whole rather than written sprite by sprite, and the sprites
+        returned by the previous call are reused: their positions and
+        velocities are already views into the rows the factors are copied to,
+        and only their other factors are set. Sprites are only constructed for
+        rows beyond those of previous calls. Each call returns a new list, so
+        renderers that cache per sequence of sprites (e.g.
+        renderers.StaticLayerPILRenderer) see a new scene.
+
+        Args:
+            factors: Float array of shape [num_sprites, NUM_FACTORS].
+
+        Returns:
+            List of the sprite.Sprite instances now bound to the state.
+        """
+        num_sprites = len(factors)
+        self._reserve(num_sprites)
+        self._buffer[:num_sprites] = factors
+
+        rows = self._buffer[:num_sprites]
+        num_reused = min(num_sprites, len(self._bound_sprites))
+        shapes = rows[:num_reused, SHAPE_INDEX].tolist()
+        angles = rows[:num_reused, ANGLE_INDEX].tolist()
+        scales = rows[:num_reused, SCALE_INDEX].tolist()
+        colors = rows[:num_reused, COLOR_SLICE].tolist()
+        masses = rows[:num_reused, MASS_INDEX].tolist()
+        for i in range(num_reused):
+            self._bound_sprites[i].set_factors(
+                shape_name(shapes[i]), angles[i], scales[i], tuple(colors[i]),
+                masses[i])
+        new_rows = rows[num_reused:]
+        for sprite, row in zip(sprites_from_factors(new_rows), new_rows):
+            sprite.bind_state(position=row[POSITION_SLICE],
+                              velocity=row[VELOCITY_SLICE])
+            self._bound_sprites.append(sprite)
+
+        sprites = self._bound_sprites[:num_sprites]
+        self._num_sprites = num_sprites
+        self._sprites = sprites
+        return sprites
+
+    def _reserve(self, num_sprites):
+        """Grow the buffer to hold at least num_sprites rows."""
+        if num_sprites > self._buffer.shape[0]:
+            capacity = max(num_sprites, 2 * self._buffer.shape[0])
+            self._buffer = np.zeros((capacity, NUM_FACTORS))
+            # Their rows are in the previous buffer.
+            self._bound_sprites = []
+
+    def holds(self, sprites):
+        """Whether sprites is the sequence of sprites bound to this state."""
+        return sprites is self._sprites
+
+    @property
+    def sprites(self):
+        return self._sprites
+
+    @property
+    def num_sprites(self):
+        return self._num_sprites
+
+    @property
+    def capacity(self):
+        return self._buffer.shape[0]
+
+    @property
+    def factors(self):
+        """View of the [num_sprites, NUM_FACTORS] factor array."""
+        return self._buffer[:self._num_sprites]
+
+    @property
+    def positions(self):
+        """View of the [num_sprites, 2] position array."""
+        return self._buffer[:self._num_sprites, POSITION_SLICE]
+
+    @property
+    def velocities(self):
+        """View of the [num_sprites, 2] velocity array."""
+        return self._buffer[:self._num_sprites, VELOCITY_SLICE]
+
+    @property
+    def masses(self):
+        """View of the [num_sprites] mass array."""
+        return self._buffer[:self._num_sprites, MASS_INDEX]
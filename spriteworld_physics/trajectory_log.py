@@ -0,0 +1,391 @@
+"""Compact log files of sprite factor trajectories.
+
+A trajectory log stores the factors of every sprite at every step of a sequence
+of episodes, as read from sprite_state.SpriteState.factors, much more compactly
+than full float arrays:
+    * Factors that do not change during an episode (typically shape, scale,
+        color, mass and angle) are stored once per episode.
+    * Positions and velocities are quantized to a fixed resolution and stored as
+        differences between consecutive steps, which are small integers
+        (zigzag-encoded, so that small negative integers have no high bits).
+        With exact=True, they are instead stored as the XOR of the float64 bit
+        patterns of consecutive steps, which is lossless.
+    * Other factors that change are stored losslessly, as with exact=True.
+The encoded arrays are byte-shuffled (bytes of equal significance are stored
+together) and compressed with zlib.
+
+Steps of an episode are encoded in blocks of keyframe_interval steps, each of
+which starts from absolute values and is compressed separately. The file ends
+with an index of the file offsets of all episodes and blocks, so
+TrajectoryLogReader.read_step(e, t) only reads and decodes one block.
+
+Example usage:
+'''
+with trajectory_log.TrajectoryLogWriter('/tmp/log.swtraj') as writer:
+    for _ in range(num_episodes):
+        timestep = env.reset()
+        writer.add_step(env.sprite_state.factors)
+        while not timestep.last():
+            timestep = env.step()
+            writer.add_step(env.sprite_state.factors)
+        writer.end_episode()
+
+with trajectory_log.TrajectoryLogReader('/tmp/log.swtraj') as reader:
+    factors = reader.read_step(episode=3, step=10)
+'''
+
+File layout, all integers little-endian:
+    Magic bytes _MAGIC.
+    For each episode, the compressed static factors followed by the compressed
+        chunks of each block.
+    Index: zlib-compressed UTF-8 JSON, see TrajectoryLogWriter.close().
+    Footer: uint64 file offset of the index, then _MAGIC.
+"""
+
+# pylint: disable=import-error
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import json
+import os
+import struct
+import zlib
+
+import numpy as np
+from spriteworld_physics import sprite as sprite_lib
+from spriteworld_physics import sprite_state as sprite_state_lib
+
+_MAGIC = b'SWPTLOG1'
+_FOOTER = struct.Struct('<Q8s')
+_VERSION = 1
+_TMP_SUFFIX = '.tmp'
+
+# Columns quantized unless exact=True.
+QUANTIZED_COLUMNS = tuple(np.r_[sprite_state_lib.POSITION_SLICE,
+                                sprite_state_lib.VELOCITY_SLICE].tolist())
+
+
+def _compress(array, level):
+    """Byte-shuffle and compress an 8-byte array."""
+    if not array.size:
+        return b''
+    shuffled = np.ascontiguousarray(array).view(np.uint8).reshape(-1, 8).T
+    return zlib.compress(np.ascontiguousarray(shuffled).tobytes(), level)
+
+
+def _decompress(data, dtype, shape):
+    """Inverse of _compress()."""
+    if not data:
+        return np.empty(shape, dtype=dtype)
+    shuffled = np.frombuffer(zlib.decompress(data), dtype=np.uint8)
+    array = np.ascontiguousarray(shuffled.reshape(8, -1).T)
+    return array.view(dtype).reshape(shape)
+
+
+def _quantize_deltas(values, resolution):
+    """Zigzag-encoded differences of quantized values along axis 0."""
+    quantized = np.round(values / resolution).astype(np.int64)
+    deltas = np.concatenate([quantized[:1], np.diff(quantized, axis=0)])
+    return ((deltas << 1) ^ (deltas >> 63)).view(np.uint64)
+
+
+def _dequantize_deltas(encoded, resolution):
+    deltas = (encoded >> np.uint64(1)).view(np.int64) ^ -(
+        encoded & np.uint64(1)).view(np.int64)
+    return np.cumsum(deltas, axis=0) * resolution
+
+
+def _xor_deltas(values):
+    """XOR of the bit patterns of consecutive values along axis 0."""
+    bits = np.ascontiguousarray(values).view(np.uint64)
+    deltas = bits.copy()
+    deltas[1:] ^= bits[:-1]
+    return deltas
+
+
+def _undo_xor_deltas(deltas):
+    return np.bitwise_xor.accumulate(deltas, axis=0).view(np.float64)
+
+
+class TrajectoryLogWriter(object):
+    """Streaming writer of a trajectory log file.
+
+    Steps are added one at a time and buffered until end_episode(), which
+    encodes the episode and appends it to the file. The file is written under a
+    temporary name and moved to its path by close(), so an incomplete log is
+    never mistaken for a complete one.
+    """
+
+    def __init__(self,
+                 path,
+                 exact=False,
+                 resolution=1e-6,
+                 keyframe_interval=32,
+                 compression_level=6):
+        """Construct writer.
+
+        Args:
+            path: String. Path of the log file.
+            exact: Bool. Whether to store positions and velocities losslessly
+                instead of quantizing them.
+            resolution: Float. Quantization step of positions and velocities
+                if not exact. Decoded values are within resolution / 2 of the
+                written values.
+            keyframe_interval: Int. Number of steps per independently decoded
+                block.
+            compression_level: Int. zlib compression level in [0, 9].
+        """
+        if keyframe_interval < 1:
+            raise ValueError('keyframe_interval must be positive, got '
+                             '{}.'.format(keyframe_interval))
+        self._path = os.path.expanduser(path)
+        self._exact = exact
+        self._resolution = resolution
+        self._keyframe_interval = keyframe_interval
+        self._compression_level = compression_level
+        self._episodes = []
+        self._steps = []
+        self._file = open(self._path + _TMP_SUFFIX, 'wb')
+        self._file.write(_MAGIC)
+
+    def _write_chunk(self, array):
+        """Write a compressed array and return its [offset, length]."""
+        data = _compress(array, self._compression_level)
+        offset = self._file.tell()
+        self._file.write(data)
+        return [offset, len(data)]
+
+    def add_step(self, factors):
+        """Buffer the factors of a step of the current episode.
+
+        Args:
+            factors: Float array [num_sprites, sprite_state.NUM_FACTORS].
+                Copied, so it can be a view of a SpriteState updated in place.
+        """
+        factors = np.array(factors, dtype=np.float64)
+        if self._steps and factors.shape != self._steps[0].shape:
+            raise ValueError(
+                'Steps of an episode have factor shapes {} and {}.'.format(
+                    self._steps[0].shape, factors.shape))
+        self._steps.append(factors)
+
+    def end_episode(self):
+        """Encode the buffered steps as an episode and write them."""
+        if not self._steps:
+            raise ValueError('No steps were added to the episode.')
+        self.write_episode(np.stack(self._steps))
+        self._steps = []
+
+    def write_episode(self, factors):
+        """Write a whole episode.
+
+        Args:
+            factors: Float array [num_steps, num_sprites,
+                sprite_state.NUM_FACTORS].
+
+        Raises:
+            ValueError: If quantized positions or velocities are not finite.
+        """
+        factors = np.asarray(factors, dtype=np.float64)
+        num_steps, num_sprites, num_factors = factors.shape
+        if num_factors != sprite_state_lib.NUM_FACTORS:
+            raise ValueError('Expected {} factors, got {}.'.format(
+                sprite_state_lib.NUM_FACTORS, num_factors))
+
+        is_static = np.all(factors == factors[:1], axis=(0, 1))
+        static_columns = np.flatnonzero(is_static).tolist()
+        dynamic_columns = np.flatnonzero(~is_static).tolist()
+        if self._exact:
+            quantized_columns = []
+        else:
+            quantized_columns = [
+                c for c in dynamic_columns if c in QUANTIZED_COLUMNS]
+        exact_columns = [
+            c for c in dynamic_columns if c not in quantized_columns]
+        quantized = factors[:, :, quantized_columns]
+        if not np.all(np.isfinite(quantized)):
+            raise ValueError('Cannot quantize non-finite positions or '
+                             'velocities, use exact=True.')
+
+        episode = {
+            'num_steps': num_steps,
+            'num_sprites': num_sprites,
+            'static_columns': static_columns,
+            'quantized_columns': quantized_columns,
+            'exact_columns': exact_columns,
+            'static': self._write_chunk(
+                np.ascontiguousarray(factors[0][:, static_columns])),
+            'blocks': [],
+        }
+        for start in range(0, num_steps, self._keyframe_interval):
+            block = slice(start, start + self._keyframe_interval)
+            episode['blocks'].append(
+                self._write_chunk(_quantize_deltas(quantized[block],
+                                                   self._resolution)) +
+                self._write_chunk(_xor_deltas(factors[block][:, :,
+                                                             exact_columns])))
+        self._episodes.append(episode)
+
+    def close(self):
+        """Write the index and move the file to its path.
+
+        The index holds the format version, sprite.FACTOR_NAMES, the resolution
+        (None if exact), the keyframe interval and, for each episode, its
+        number of steps and sprites, the column indices of each encoding and
+        the file offsets and lengths of its static factors and blocks.
+        """
+        if self._file is None:
+            return
+        if self._steps:
+            raise ValueError('Episode with {} steps was not ended.'.format(
+                len(self._steps)))
+        index_offset = self._file.tell()
+        self._file.write(zlib.compress(json.dumps({
+            'version': _VERSION,
+            'factor_names': list(sprite_lib.FACTOR_NAMES),
+            'resolution': None if self._exact else self._resolution,
+            'keyframe_interval': self._keyframe_interval,
+            'episodes': self._episodes,
+        }).encode('utf-8'), self._compression_level))
+        self._file.write(_FOOTER.pack(index_offset, _MAGIC))
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._file.close()
+        self._file = None
+        os.rename(self._path + _TMP_SUFFIX, self._path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self._file.close()
+            self._file = None
+            os.remove(self._path + _TMP_SUFFIX)
+
+    @property
+    def num_episodes(self):
+        return len(self._episodes)
+
+
+class TrajectoryLogReader(object):
+    """Random-access reader of a trajectory log file."""
+
+    def __init__(self, path):
+        """Open a log and read its index.
+
+        Args:
+            path: String. Path of a file written by TrajectoryLogWriter.
+
+        Raises:
+            ValueError: If the file is not a complete trajectory log.
+        """
+        self._file = open(os.path.expanduser(path), 'rb')
+        if self._file.read(len(_MAGIC)) != _MAGIC:
+            raise ValueError('{} is not a trajectory log.'.format(path))
+        self._file.seek(-_FOOTER.size, os.SEEK_END)
+        index_offset, magic = _FOOTER.unpack(self._file.read(_FOOTER.size))
+        if magic != _MAGIC:
+            raise ValueError('{} is an incomplete trajectory log.'.format(path))
+        index_end = os.fstat(self._file.fileno()).st_size - _FOOTER.size
+        self._file.seek(index_offset)
+        self._index = json.loads(zlib.decompress(
+            self._file.read(index_end - index_offset)).decode('utf-8'))
+        if self._index['version'] != _VERSION:
+            raise ValueError('Unsupported trajectory log version {}.'.format(
+                self._index['version']))
+        self._episodes = self._index['episodes']
+        # Last decoded block, so that reading consecutive steps decodes each
+        # block once.
+        self._cached_block = (None, None)
+
+    def _read_chunk(self, chunk, dtype, shape):
+        offset, length = chunk
+        self._file.seek(offset)
+        return _decompress(self._file.read(length), dtype, shape)
+
+    def _episode(self, episode):
+        if not 0 <= episode < len(self._episodes):
+            raise IndexError('Episode {} out of range [0, {}).'.format(
+                episode, len(self._episodes)))
+        return self._episodes[episode]
+
+    def _decode_block(self, episode, block):
+        """Factors [block_steps, num_sprites, NUM_FACTORS] of a block."""
+        key = (episode, block)
+        if self._cached_block[0] == key:
+            return self._cached_block[1]
+        info = self._episode(episode)
+        num_sprites = info['num_sprites']
+        start = block * self.keyframe_interval
+        num_steps = min(self.keyframe_interval, info['num_steps'] - start)
+
+        factors = np.empty(
+            (num_steps, num_sprites, sprite_state_lib.NUM_FACTORS))
+        static_columns = info['static_columns']
+        factors[:, :, static_columns] = self._read_chunk(
+            info['static'], np.float64, (num_sprites, len(static_columns)))
+        quantized_chunk, exact_chunk = (
+            info['blocks'][block][:2], info['blocks'][block][2:])
+        quantized_columns = info['quantized_columns']
+        factors[:, :, quantized_columns] = _dequantize_deltas(
+            self._read_chunk(quantized_chunk, np.uint64,
+                             (num_steps, num_sprites, len(quantized_columns))),
+            self._index['resolution'])
+        exact_columns = info['exact_columns']
+        factors[:, :, exact_columns] = _undo_xor_deltas(
+            self._read_chunk(exact_chunk, np.uint64,
+                             (num_steps, num_sprites, len(exact_columns))))
+
+        self._cached_block = (key, factors)
+        return factors
+
+    def read_step(self, episode, step):
+        """Factors [num_sprites, NUM_FACTORS] of a step of an episode."""
+        num_steps = self.num_steps(episode)
+        if not 0 <= step < num_steps:
+            raise IndexError('Step {} out of range [0, {}).'.format(
+                step, num_steps))
+        block, offset = divmod(step, self.keyframe_interval)
+        return np.array(self._decode_block(episode, block)[offset])
+
+    def read_episode(self, episode):
+        """Factors [num_steps, num_sprites, NUM_FACTORS] of an episode."""
+        num_blocks = len(self._episode(episode)['blocks'])
+        return np.concatenate(
+            [self._decode_block(episode, b) for b in range(num_blocks)])
+
+    def num_steps(self, episode):
+        return self._episode(episode)['num_steps']
+
+    def num_sprites(self, episode):
+        return self._episode(episode)['num_sprites']
+
+    def close(self):
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    @property
+    def num_episodes(self):
+        return len(self._episodes)
+
+    @property
+    def exact(self):
+        return self._index['resolution'] is None
+
+    @property
+    def resolution(self):
+        return self._index['resolution']
+
+    @property
+    def keyframe_interval(self):
+        return self._index['keyframe_interval']
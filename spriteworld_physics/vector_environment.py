@@ -0,0 +1,317 @@
+"""Vectorized physics environment stepping in worker processes.
+
+SubprocessVectorEnvironment runs many PhysicsEnvironment instances split across
+worker processes. Observations are never sent through pipes: each worker
+writes them straight into shared-memory rings of preallocated arrays, and the
+parent only receives a few scalars per environment per step (step type, reward,
+discount and number of sprites). The arrays returned to the parent are views
+into these rings.
+
+Example usage:
+'''
+def env_fn(index):
+    config = springs.get_config()
+    return physics_environment.PhysicsEnvironment(**config)
+
+vector_env = vector_environment.SubprocessVectorEnvironment(
+    env_fn, num_envs=16, num_workers=4)
+timestep = vector_env.reset()
+for _ in range(100):
+    timestep = vector_env.step()
+    images = timestep.observation['image']  # Shape [16, 64, 64, 3]
+vector_env.close()
+'''
+"""
+
+# pylint: disable=import-error
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import ctypes
+import multiprocessing
+import traceback
+
+import dm_env
+import numpy as np
+import six
+from spriteworld_physics import physics_environment
+from spriteworld_physics import sprite_state as sprite_state_lib
+
+# Key of the sprite factor array in the returned observations.
+FACTORS_KEY = physics_environment.FACTORS_KEY
+
+_DEFAULT_MAX_SPRITES = 64
+
+
+def _allocate(shape, dtype):
+    """Allocate a shared-memory array, returning (raw_array, shape, dtype)."""
+    dtype = np.dtype(dtype)
+    num_bytes = int(np.prod(shape)) * dtype.itemsize
+    raw = multiprocessing.RawArray(ctypes.c_uint8, max(num_bytes, 1))
+    return raw, tuple(shape), dtype.str
+
+
+def _as_array(raw, shape, dtype):
+    """Numpy view of a shared-memory array returned by _allocate()."""
+    dtype = np.dtype(dtype)
+    count = int(np.prod(shape))
+    return np.frombuffer(raw, dtype=dtype, count=count).reshape(shape)
+
+
+def _worker(conn, env_fn, env_indices, buffers, max_sprites):
+    """Worker process loop.
+
+    Args:
+        conn: Child end of a multiprocessing.Pipe.
+        env_fn: Callable mapping an environment index to an environment.
+        env_indices: Indices of the environments owned by this worker.
+        buffers: Dict mapping observation keys to (raw, shape, dtype) shared
+            arrays of shape [ring_size, num_envs, ...].
+        max_sprites: Int. Number of rows of the factor buffers.
+    """
+    try:
+        envs = [env_fn(i) for i in env_indices]
+        arrays = {k: _as_array(*v) for k, v in six.iteritems(buffers)}
+        conn.send(('ready', None))
+    except Exception:  # pylint: disable=broad-except
+        conn.send(('error', traceback.format_exc()))
+        conn.close()
+        return
+
+    # Slot of the last step of each environment, whose renderer outputs are
+    # held on timesteps without observation (see observation_stride in
+    # physics_environment.PhysicsEnvironment).
+    last_slots = {}
+    while True:
+        command, slot = conn.recv()
+        if command == 'close':
+            break
+        try:
+            results = []
+            for index, env in zip(env_indices, envs):
+                if command == 'reset':
+                    timestep = env.reset()
+                else:
+                    timestep = env.step()
+
+                physics_environment.write_observation(
+                    arrays, timestep.observation, (slot, index),
+                    (last_slots.get(index), index))
+                last_slots[index] = slot
+
+                factors = env.sprite_state.factors
+                num_sprites = factors.shape[0]
+                if num_sprites > max_sprites:
+                    raise ValueError(
+                        'Environment {} has {} sprites, more than '
+                        'max_sprites={}.'.format(index, num_sprites,
+                                                 max_sprites))
+                arrays[FACTORS_KEY][slot, index, :num_sprites] = factors
+                arrays[FACTORS_KEY][slot, index, num_sprites:] = np.nan
+
+                results.append((int(timestep.step_type),
+                                timestep.reward or 0.,
+                                1. if timestep.discount is None
+                                else timestep.discount,
+                                num_sprites))
+            conn.send(('ok', results))
+        except Exception:  # pylint: disable=broad-except
+            conn.send(('error', traceback.format_exc()))
+    for env in envs:
+        env.close()
+    conn.close()
+
+
+class SubprocessVectorEnvironment(object):
+    """Steps a batch of environments in worker processes.
+
+    The observation of each step is a dict with one entry per renderer of the
+    environments, plus FACTORS_KEY holding the sprite factor arrays, of shape
+    [num_envs, max_sprites, len(sprite.FACTOR_NAMES)] and padded with NaN.
+    Renderer outputs must have the fixed shape and dtype of their
+    observation_spec(). Environments with an observation_stride only render
+    every few steps, and in between the renderer arrays hold the last rendered
+    observation.
+
+    All arrays in a returned timestep are views into a ring of ring_size
+    shared-memory slots. They remain valid for the next ring_size - 1 calls to
+    step() or reset(), after which their slot is overwritten. Copy them if they
+    are needed for longer.
+    """
+
+    def __init__(self,
+                 env_fn,
+                 num_envs,
+                 num_workers=None,
+                 ring_size=2,
+                 max_sprites=_DEFAULT_MAX_SPRITES,
+                 observation_keys=None,
+                 context=None):
+        """Construct vectorized environment and start the worker processes.
+
+        Args:
+            env_fn: Callable mapping an int index in [0, num_envs) to a
+                physics_environment.PhysicsEnvironment. Called once in the
+                parent to read observation specs, and in the workers to build
+                their environments. Must be picklable if context is 'spawn' or
+                'forkserver'.
+            num_envs: Int. Total number of environments.
+            num_workers: Int. Number of worker processes. Defaults to
+                min(num_envs, multiprocessing.cpu_count()).
+            ring_size: Int. Number of shared-memory observation slots.
+            max_sprites: Int. Maximum number of sprites in any environment.
+            observation_keys: Optional iterable of renderer names to write to
+                shared memory. Defaults to all renderers. Renderers with
+                variable output shapes (e.g. renderers.SpriteFactorArray)
+                should be left out, since the sprite factors are always
+                available under FACTORS_KEY.
+            context: Optional multiprocessing start method, e.g. 'fork' or
+                'spawn'.
+        """
+        # Set before any error can be raised, since __del__() calls close().
+        self._closed = False
+        self._conns = []
+        self._processes = []
+
+        if num_workers is None:
+            num_workers = min(num_envs, multiprocessing.cpu_count())
+        if num_workers < 1 or num_workers > num_envs:
+            raise ValueError('num_workers must be in [1, num_envs], but is '
+                             '{}.'.format(num_workers))
+        if ring_size < 1:
+            raise ValueError('ring_size must be positive, but is {}.'.format(
+                ring_size))
+
+        self._num_envs = num_envs
+        self._ring_size = ring_size
+        self._slot = -1
+
+        # Build one environment in the parent to read the observation specs.
+        probe_env = env_fn(0)
+        observation_spec = probe_env.observation_spec()
+        if observation_keys is None:
+            observation_keys = [
+                k for k in observation_spec.keys() if k != FACTORS_KEY]
+        if FACTORS_KEY in observation_keys:
+            raise ValueError('Observation key {} is reserved for the sprite '
+                             'factors.'.format(FACTORS_KEY))
+        self._observation_spec = {
+            k: observation_spec[k] for k in observation_keys}
+        del probe_env
+
+        self._buffers = {}
+        for key, spec in six.iteritems(self._observation_spec):
+            self._buffers[key] = _allocate(
+                (ring_size, num_envs) + tuple(spec.shape), spec.dtype)
+        self._buffers[FACTORS_KEY] = _allocate(
+            (ring_size, num_envs, max_sprites, sprite_state_lib.NUM_FACTORS),
+            np.float64)
+        self._arrays = {
+            k: _as_array(*v) for k, v in six.iteritems(self._buffers)}
+
+        ctx = multiprocessing.get_context(context)
+        self._env_indices = np.array_split(np.arange(num_envs), num_workers)
+        for env_indices in self._env_indices:
+            parent_conn, child_conn = ctx.Pipe()
+            process = ctx.Process(
+                target=_worker,
+                args=(child_conn, env_fn, [int(i) for i in env_indices],
+                      self._buffers, max_sprites))
+            process.daemon = True
+            process.start()
+            child_conn.close()
+            self._conns.append(parent_conn)
+            self._processes.append(process)
+
+        for conn in self._conns:
+            self._receive(conn)
+
+        self._num_sprites = np.zeros(num_envs, dtype=np.int64)
+
+    def _receive(self, conn):
+        status, payload = conn.recv()
+        if status == 'error':
+            self.close()
+            raise RuntimeError('Error in worker process:\n' + payload)
+        return payload
+
+    def _send(self, command):
+        if self._closed:
+            raise RuntimeError('Environment is closed.')
+        self._slot = (self._slot + 1) % self._ring_size
+        for conn in self._conns:
+            conn.send((command, self._slot))
+
+    def _gather(self):
+        step_type = np.zeros(self._num_envs, dtype=np.int64)
+        reward = np.zeros(self._num_envs)
+        discount = np.zeros(self._num_envs)
+        for conn, env_indices in zip(self._conns, self._env_indices):
+            results = self._receive(conn)
+            for index, result in zip(env_indices, results):
+                (step_type[index], reward[index], discount[index],
+                 self._num_sprites[index]) = result
+        observation = {
+            k: v[self._slot] for k, v in six.iteritems(self._arrays)}
+        return dm_env.TimeStep(step_type=step_type,
+                               reward=reward,
+                               discount=discount,
+                               observation=observation)
+
+    def step_async(self):
+        """Ask all workers to step their environments, without waiting."""
+        self._send('step')
+
+    def step_wait(self):
+        """Wait for the step started by step_async() and return timestep."""
+        return self._gather()
+
+    def step(self):
+        """Step all environments.
+
+        Environments that terminated on the previous step are reset, as in
+        PhysicsEnvironment.step().
+
+        Returns:
+            dm_env.TimeStep whose fields are arrays with leading dimension
+                num_envs. step_type holds the int values of dm_env.StepType.
+        """
+        self.step_async()
+        return self.step_wait()
+
+    def reset(self):
+        """Reset all environments and return the batched first timestep."""
+        self._send('reset')
+        return self._gather()
+
+    def close(self):
+        """Stop the worker processes."""
+        if self._closed:
+            return
+        self._closed = True
+        for conn in self._conns:
+            try:
+                conn.send(('close', None))
+            except (EOFError, IOError, OSError):
+                pass
+        for process in self._processes:
+            process.join(timeout=1)
+            if process.is_alive():
+                process.terminate()
+
+    def observation_spec(self):
+        return self._observation_spec
+
+    @property
+    def num_envs(self):
+        return self._num_envs
+
+    @property
+    def num_sprites(self):
+        """Number of sprites in each environment at the last step."""
+        return self._num_sprites
+
+    def __del__(self):
+        self.close()